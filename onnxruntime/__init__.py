@@ -62,8 +62,12 @@ if import_capi_exception:
 
 from onnxruntime.capi.onnxruntime_inference_collection import (
     AdapterFormat,  # noqa: F401
+    AsyncInferenceSession,  # noqa: F401
+    DynamicBatcher,  # noqa: F401
     InferenceSession,  # noqa: F401
+    InferenceSessionPool,  # noqa: F401
     IOBinding,  # noqa: F401
+    IOBindingArena,  # noqa: F401
     OrtDevice,  # noqa: F401
     OrtValue,  # noqa: F401
     SparseTensor,  # noqa: F401
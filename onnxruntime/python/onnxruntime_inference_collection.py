@@ -4,14 +4,22 @@
 # --------------------------------------------------------------------------
 from __future__ import annotations
 
+import asyncio
+import bisect
 import collections
 import collections.abc
+import concurrent.futures
+import contextlib
 import os
+import threading
+import time
 import typing
 import warnings
 from collections.abc import Sequence
 from typing import Any
 
+import numpy as np
+
 from onnxruntime.capi import _pybind_state as C
 
 if typing.TYPE_CHECKING:
@@ -164,6 +172,27 @@ def check_and_normalize_provider_args(
     return list(provider_name_to_options.keys()), list(provider_name_to_options.values())
 
 
+def _set_future_result(future: asyncio.Future, results, err: str, callback_done: threading.Event) -> None:
+    # The callback releases the GIL while it wakes up the event loop, so it might not have returned yet. Wait for it,
+    # otherwise the session could be destroyed by the caller while the callback still runs in the session threadpool.
+    callback_done.wait()
+    if future.cancelled():
+        return
+    if err:
+        future.set_exception(C.Fail(err))
+    else:
+        future.set_result(results)
+
+
+def _complete_future_threadsafe(results, user_data, err: str) -> None:
+    # Invoked by a cxx thread from ort intra-op threadpool, so the future is completed in its own event loop.
+    loop, future, _input_feed, callback_done = user_data
+    # RuntimeError is raised when the event loop is closed, so nobody is waiting for the results.
+    with contextlib.suppress(RuntimeError):
+        loop.call_soon_threadsafe(_set_future_result, future, results, err, callback_done)
+    callback_done.set()
+
+
 class Session:
     """
     This is the main class used to run a model.
@@ -240,13 +269,10 @@ class Session:
         self._enable_fallback = True
 
     def _validate_input(self, feed_input_names):
-        missing_input_names = []
-        for input in self._inputs_meta:
-            if input.name not in feed_input_names and not input.type.startswith("optional"):
-                missing_input_names.append(input.name)
+        missing_input_names = [name for name in self._required_input_names if name not in feed_input_names]
         if missing_input_names:
             raise ValueError(
-                f"Required inputs ({missing_input_names}) are missing from input feed ({feed_input_names})."
+                f"Required inputs ({missing_input_names}) are missing from input feed ({list(feed_input_names)})."
             )
 
     def run(self, output_names, input_feed, run_options=None):
@@ -263,9 +289,9 @@ class Session:
 
             sess.run([output_name], {input_name: x})
         """
-        self._validate_input(list(input_feed.keys()))
+        self._validate_input(input_feed)
         if not output_names:
-            output_names = [output.name for output in self._outputs_meta]
+            output_names = self._output_names
         try:
             return self._sess.run(output_names, input_feed, run_options)
         except C.EPFail as err:
@@ -278,6 +304,41 @@ class Session:
                 return self._sess.run(output_names, input_feed, run_options)
             raise
 
+    def prepare_run(self, output_names=None, input_names=None, run_options=None):
+        """
+        Prepare a function that computes the predictions like :meth:`Session.run`. Output names are resolved and
+        input names are validated once here, so that each call goes almost directly to the native session.
+        It reduces the python overhead of serving small models.
+
+        :param output_names: name of the outputs. All outputs are computed by default.
+        :param input_names: name of the inputs that will be fed. If given, it is validated that all required
+            inputs are included. The input feed of each call is not validated in python.
+        :param run_options: default run options of each call. See :class:`onnxruntime.RunOptions`.
+        :return: a function ``run(input_feed, run_options=None)`` that returns the list of results.
+
+        ::
+
+            run = sess.prepare_run([output_name], [input_name])
+            for x in inputs:
+                results = run({input_name: x})
+        """
+        output_names = list(output_names) if output_names else list(self._output_names)
+        if input_names is not None:
+            self._validate_input(set(input_names))
+        default_run_options = run_options
+
+        def run(input_feed, run_options=None):
+            if run_options is None:
+                run_options = default_run_options
+            try:
+                # self._sess is looked up in each call since it is re-created when providers are changed.
+                return self._sess.run(output_names, input_feed, run_options)
+            except C.EPFail:
+                # Let Session.run handle the fallback to other providers.
+                return self.run(output_names, input_feed, run_options)
+
+        return run
+
     def run_async(self, output_names, input_feed, callback, user_data, run_options=None):
         """
         Compute the predictions asynchronously in a separate cxx thread from ort intra-op threadpool.
@@ -303,11 +364,34 @@ class Session:
 
             sess.run_async([output_name], {input_name: x}, callback)
         """
-        self._validate_input(list(input_feed.keys()))
+        self._validate_input(input_feed)
         if not output_names:
-            output_names = [output.name for output in self._outputs_meta]
+            output_names = self._output_names
         return self._sess.run_async(output_names, input_feed, callback, user_data, run_options)
 
+    def run_awaitable(self, output_names, input_feed, run_options=None) -> asyncio.Future:
+        """
+        Compute the predictions asynchronously like :meth:`Session.run_async`, and return an :class:`asyncio.Future`
+        that is completed in the running event loop of the caller. No python thread is blocked while the model runs.
+        Like :meth:`Session.run_async`, the session needs an intra-op threadpool with more than one thread.
+
+        :param output_names: name of the outputs
+        :param input_feed: dictionary ``{ input_name: input_value }``
+        :param run_options: See :class:`onnxruntime.RunOptions`.
+        :return: a future of the list of results like :meth:`Session.run`.
+            The future raises :class:`onnxruntime.capi.onnxruntime_pybind11_state.Fail` if the run fails.
+
+        ::
+
+            results = await sess.run_awaitable([output_name], {input_name: x})
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # input_feed is kept alive until the run completes since the input data might not be copied.
+        user_data = (loop, future, input_feed, threading.Event())
+        self.run_async(output_names, input_feed, _complete_future_threadsafe, user_data, run_options)
+        return future
+
     def run_with_ort_values(self, output_names, input_dict_ort_values, run_options=None):
         """
         Compute the predictions.
@@ -334,9 +418,9 @@ class Session:
             ort_values = [OrtValue(v) for v in result]
             return ort_values
 
-        self._validate_input(list(input_dict_ort_values.keys()))
+        self._validate_input(input_dict_ort_values)
         if not output_names:
-            output_names = [output.name for output in self._outputs_meta]
+            output_names = self._output_names
         try:
             return invoke(self._sess, output_names, input_dict_ort_values, run_options)
         except C.EPFail as err:
@@ -544,6 +628,9 @@ class InferenceSession(Session):
         self._sess_options = self._sess.session_options
         self._inputs_meta = self._sess.inputs_meta
         self._outputs_meta = self._sess.outputs_meta
+        # Cached for validating input feeds and resolving output names in each run.
+        self._required_input_names = [i.name for i in self._inputs_meta if not i.type.startswith("optional")]
+        self._output_names = [output.name for output in self._outputs_meta]
         self._overridable_initializers = self._sess.overridable_initializers
         self._model_meta = self._sess.model_meta
         self._providers = self._sess.get_providers()
@@ -557,6 +644,8 @@ class InferenceSession(Session):
         self._sess_options = None
         self._inputs_meta = None
         self._outputs_meta = None
+        self._required_input_names = None
+        self._output_names = None
         self._overridable_initializers = None
         self._model_meta = None
         self._providers = None
@@ -580,6 +669,491 @@ class InferenceSession(Session):
                 C.register_tensorrt_plugins_as_custom_ops(session_options, providers[i][1])
 
 
+class AsyncInferenceSession:
+    """
+    Wraps a :class:`Session` to run the model from asyncio code with a limit on the number of runs in flight.
+
+    Each run is started with :meth:`Session.run_awaitable`. When `max_in_flight_runs` runs are not completed yet,
+    :meth:`run` waits for one of them to complete before starting a new run. So requests beyond the limit
+    wait in the event loop instead of queuing up in the intra-op threadpool of the session.
+
+    ::
+
+        sess = onnxruntime.AsyncInferenceSession(onnxruntime.InferenceSession("model.onnx", sess_options))
+        results = await sess.run([output_name], {input_name: x})
+    """
+
+    def __init__(self, session: Session, max_in_flight_runs: int | None = None):
+        """
+        :param session: the session to run. Its `intra_op_num_threads` shall not be 1.
+        :param max_in_flight_runs: maximum number of runs that are not completed. The default is
+            `intra_op_num_threads` of the session options, or the number of CPUs when it is not set.
+        """
+        if max_in_flight_runs is None:
+            max_in_flight_runs = session.get_session_options().intra_op_num_threads or os.cpu_count() or 1
+        if max_in_flight_runs < 1:
+            raise ValueError(f"max_in_flight_runs shall be positive, got {max_in_flight_runs}.")
+
+        self._session = session
+        self._max_in_flight_runs = max_in_flight_runs
+        self._semaphore = asyncio.Semaphore(max_in_flight_runs)
+        self._in_flight_runs = 0
+
+    @property
+    def session(self) -> Session:
+        "Return the wrapped session."
+        return self._session
+
+    @property
+    def max_in_flight_runs(self) -> int:
+        "Return the maximum number of runs that are not completed."
+        return self._max_in_flight_runs
+
+    @property
+    def in_flight_runs(self) -> int:
+        "Return the number of runs that are started but not completed."
+        return self._in_flight_runs
+
+    def _on_run_done(self, future: asyncio.Future) -> None:
+        self._in_flight_runs -= 1
+        self._semaphore.release()
+        if not future.cancelled():
+            # Mark the exception as retrieved in case the caller has been cancelled.
+            future.exception()
+
+    async def run(self, output_names, input_feed, run_options=None):
+        """
+        Compute the predictions. See :meth:`Session.run_awaitable`.
+
+        :return: list of results like :meth:`Session.run`.
+        """
+        await self._semaphore.acquire()
+        try:
+            future = self._session.run_awaitable(output_names, input_feed, run_options)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        self._in_flight_runs += 1
+        future.add_done_callback(self._on_run_done)
+        # The slot is released when the model run completes, even if the caller is cancelled before that.
+        return await asyncio.shield(future)
+
+
+class _BatchRequest:
+    def __init__(self, input_feed, batch_size, sequence_length, key):
+        self.input_feed = input_feed
+        self.batch_size = batch_size
+        self.sequence_length = sequence_length
+        self.key = key
+        self.arrival_time = time.monotonic()
+        self.future = concurrent.futures.Future()
+
+
+class DynamicBatcher:
+    """
+    Combines requests submitted concurrently into batches, so that the session runs once per batch.
+
+    Each request is an input feed with the batch axis as the first axis of every input. Requests are concatenated
+    along the batch axis until `max_batch_size` is reached, or until the oldest pending request has waited for
+    `max_wait_ms`. The outputs of the batch are then split along the batch axis and returned to each request.
+    Only requests with the same input names, data types and shapes (except the batch axis and padded sequence axis)
+    are batched together.
+
+    When `sequence_length_buckets` is given, inputs whose second axis is dynamic in the model are padded to the
+    smallest bucket that fits the longest request in the batch, with values of `pad_values` (0 by default).
+    Outputs whose second axis has the same symbolic dimension as those inputs are truncated back to the sequence
+    length of each request.
+
+    ::
+
+        batcher = onnxruntime.DynamicBatcher(sess, max_batch_size=16, max_wait_ms=2)
+        results = batcher.run({input_name: x})  # blocks until the batch containing x is completed
+        results = await asyncio.wrap_future(batcher.submit({input_name: x}))
+        batcher.close()
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 1.0,
+        output_names: Sequence[str] | None = None,
+        sequence_length_buckets: Sequence[int] | None = None,
+        pad_values: dict[str, Any] | None = None,
+        run_options=None,
+    ):
+        """
+        :param session: the session to run. The first axis of all its inputs shall be dynamic.
+        :param max_batch_size: maximum number of samples in a batch. A request larger than that runs alone.
+        :param max_wait_ms: maximum time in milliseconds that a request waits for other requests to join its batch.
+        :param output_names: name of the outputs. All outputs are returned by default.
+        :param sequence_length_buckets: sequence lengths that padded inputs are padded to.
+        :param pad_values: dictionary ``{ input_name: value }`` of values used to pad inputs.
+        :param run_options: See :class:`onnxruntime.RunOptions`.
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size shall be positive, got {max_batch_size}.")
+
+        inputs = session.get_inputs()
+        fixed_batch_inputs = [i.name for i in inputs if not i.shape or isinstance(i.shape[0], int)]
+        if fixed_batch_inputs:
+            raise ValueError(f"Inputs ({fixed_batch_inputs}) do not have a dynamic batch axis.")
+
+        self._session = session
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000.0
+        self._output_names = list(output_names) if output_names else [o.name for o in session.get_outputs()]
+        self._run_options = run_options
+        self._pad_values = pad_values or {}
+
+        self._sequence_length_buckets = sorted(sequence_length_buckets) if sequence_length_buckets else None
+        self._padded_inputs = set()
+        self._truncated_outputs = set()
+        if self._sequence_length_buckets:
+            self._padded_inputs = {i.name for i in inputs if len(i.shape) > 1 and not isinstance(i.shape[1], int)}
+            sequence_dims = {
+                i.shape[1] for i in inputs if i.name in self._padded_inputs and isinstance(i.shape[1], str)
+            }
+            self._truncated_outputs = {
+                o.name
+                for o in session.get_outputs()
+                if o.shape and len(o.shape) > 1 and isinstance(o.shape[1], str) and o.shape[1] in sequence_dims
+            }
+
+        self._requests = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._process_batches, name="DynamicBatcher", daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, input_feed: dict[str, Any]) -> concurrent.futures.Future:
+        """
+        Submit a request to run in a batch.
+
+        :param input_feed: dictionary ``{ input_name: input_value }``. The first axis of each input is the batch axis.
+        :return: a :class:`concurrent.futures.Future` of the list of results like :meth:`Session.run`.
+        """
+        input_feed = {name: np.asarray(value) for name, value in input_feed.items()}
+        self._session._validate_input(input_feed)
+
+        batch_sizes = {value.shape[0] for value in input_feed.values() if value.ndim > 0}
+        if len(batch_sizes) != 1:
+            raise ValueError(f"Inputs shall have the same size of batch axis, got {batch_sizes}.")
+        sequence_lengths = {input_feed[name].shape[1] for name in self._padded_inputs if name in input_feed}
+        if len(sequence_lengths) > 1:
+            raise ValueError(f"Padded inputs shall have the same sequence length, got {sequence_lengths}.")
+
+        # Requests with the same key can be concatenated along the batch axis.
+        key = tuple(
+            (name, value.dtype.str, (None,) + value.shape[2:] if name in self._padded_inputs else value.shape[1:])
+            for name, value in sorted(input_feed.items())
+        )
+        request = _BatchRequest(input_feed, batch_sizes.pop(), sequence_lengths.pop() if sequence_lengths else 0, key)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("DynamicBatcher is closed.")
+            self._requests.append(request)
+            self._condition.notify()
+        return request.future
+
+    def run(self, input_feed: dict[str, Any]):
+        """
+        Compute the predictions in a batch. It blocks until the batch is completed.
+
+        :param input_feed: dictionary ``{ input_name: input_value }``. The first axis of each input is the batch axis.
+        :return: list of results like :meth:`Session.run`.
+        """
+        return self.submit(input_feed).result()
+
+    def close(self):
+        """
+        Stop batching. Requests that are submitted already are completed before the worker thread stops.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def _get_batch(self):
+        with self._condition:
+            while not self._requests and not self._closed:
+                self._condition.wait()
+            if not self._requests:
+                return None
+
+            first = self._requests[0]
+            while not self._closed:
+                batch_size = sum(r.batch_size for r in self._requests if r.key == first.key)
+                timeout = first.arrival_time + self._max_wait - time.monotonic()
+                if batch_size >= self._max_batch_size or timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+
+            batch = [first]
+            batch_size = first.batch_size
+            for request in list(self._requests)[1:]:
+                if request.key == first.key and batch_size + request.batch_size <= self._max_batch_size:
+                    batch.append(request)
+                    batch_size += request.batch_size
+            for request in batch:
+                self._requests.remove(request)
+
+        # Requests cancelled by callers are dropped.
+        return [request for request in batch if request.future.set_running_or_notify_cancel()]
+
+    def _run_batch(self, batch):
+        sequence_length = 0
+        if self._padded_inputs:
+            sequence_length = max(request.sequence_length for request in batch)
+            index = bisect.bisect_left(self._sequence_length_buckets, sequence_length)
+            if index < len(self._sequence_length_buckets):
+                sequence_length = self._sequence_length_buckets[index]
+
+        input_feed = {}
+        for name in batch[0].input_feed:
+            values = [request.input_feed[name] for request in batch]
+            if name in self._padded_inputs:
+                values = [
+                    np.pad(
+                        value,
+                        [(0, 0), (0, sequence_length - value.shape[1])] + [(0, 0)] * (value.ndim - 2),
+                        constant_values=self._pad_values.get(name, 0),
+                    )
+                    if value.shape[1] < sequence_length
+                    else value
+                    for value in values
+                ]
+            input_feed[name] = values[0] if len(values) == 1 else np.concatenate(values)
+
+        outputs = self._session.run(self._output_names, input_feed, self._run_options)
+
+        total_batch_size = sum(request.batch_size for request in batch)
+        start = 0
+        for request in batch:
+            end = start + request.batch_size
+            results = []
+            for name, output in zip(self._output_names, outputs, strict=False):
+                if not isinstance(output, np.ndarray) or output.ndim == 0 or output.shape[0] != total_batch_size:
+                    # The output does not have a batch axis, so every request gets all of it.
+                    results.append(output)
+                elif name in self._truncated_outputs and request.sequence_length:
+                    results.append(output[start:end, : request.sequence_length])
+                else:
+                    results.append(output[start:end])
+            request.future.set_result(results)
+            start = end
+
+    def _process_batches(self):
+        while True:
+            batch = self._get_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+
+def _register_shared_cpu_allocator():
+    """
+    Register a CPU arena allocator in the environment, which sessions use with session.use_env_allocators.
+    An allocator already registered by the application is left as is, and used instead.
+    """
+    memory_info = C.OrtMemoryInfo("Cpu", C.OrtAllocatorType.ORT_ARENA_ALLOCATOR, 0, C.OrtMemType.DEFAULT)
+    try:
+        C.create_and_register_allocator(memory_info, None)
+    except RuntimeError as err:
+        if "already been registered" not in str(err):
+            raise
+
+
+def _get_available_cpus() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class InferenceSessionPool:
+    """
+    Creates replicas of a model in this process, and routes each run to the replica with the fewest runs in flight.
+
+    Each replica is an :class:`InferenceSession` whose intra-op threadpool is pinned to its own set of CPUs with
+    the `session.intra_op_thread_affinities` config entry, so replicas do not oversubscribe cores. By default,
+    the CPUs available to this process are split into consecutive and disjoint sets, which usually keeps each
+    replica within one socket. The thread calling :meth:`run` is not pinned since it is managed by the application.
+
+    Replicas share memory of the model:
+
+    * Initializers of the main graph are loaded once by the `onnx` package, and added to the session options of all
+      replicas with :meth:`SessionOptions.add_external_initializers`. Weights pre-packed by kernels are still per
+      replica, since the pre-packed weights container is only available in the C API.
+    * Optionally, a CPU arena allocator registered in the environment is used by all replicas
+      (`session.use_env_allocators`).
+
+    ::
+
+        pool = onnxruntime.InferenceSessionPool("model.onnx", num_replicas=2, providers=["CPUExecutionProvider"])
+        results = pool.run([output_name], {input_name: x})  # thread-safe
+    """
+
+    def __init__(
+        self,
+        path_or_bytes: str | bytes | os.PathLike,
+        num_replicas: int,
+        sess_options: onnxruntime.SessionOptions | None = None,
+        providers: Sequence[str | tuple[str, dict[Any, Any]]] | None = None,
+        provider_options: Sequence[dict[Any, Any]] | None = None,
+        cpu_sets: Sequence[Sequence[int]] | None = None,
+        share_initializers: bool = True,
+        share_allocator: bool = False,
+        **kwargs,
+    ) -> None:
+        """
+        :param path_or_bytes: Filename or serialized ONNX or ORT format model in a byte string.
+        :param num_replicas: Number of sessions to create.
+        :param sess_options: Session options used by all replicas. Note that it is modified, since session options
+            cannot be copied: intra_op_num_threads, the `session.intra_op_thread_affinities` config entry, shared
+            initializers (see :meth:`SessionOptions.add_external_initializers`) and the `session.use_env_allocators`
+            config entry are set for the replicas. It should not be used to create other sessions.
+        :param providers: Optional sequence of providers in order of decreasing precedence.
+            See :class:`InferenceSession`.
+        :param provider_options: Optional sequence of options dicts corresponding to the providers listed in
+            'providers'.
+        :param cpu_sets: Optional sequence of logical CPU ids (starting from 0) for each replica. Each replica has
+            one intra-op thread per CPU in its set. By default, CPUs available to this process are split evenly.
+        :param share_initializers: Whether replicas share initializers of the main graph. It needs the `onnx`
+            package, and the model shall be less than 2GB.
+        :param share_allocator: Whether replicas share a CPU arena allocator registered in the environment. If the
+            application has not registered one with :func:`create_and_register_allocator`, it is registered for the
+            whole process, and the application cannot register its own CPU allocator afterwards.
+        """
+        if num_replicas < 1:
+            raise ValueError(f"num_replicas shall be positive, got {num_replicas}.")
+
+        if cpu_sets is None:
+            cpus = _get_available_cpus()
+            if num_replicas > len(cpus):
+                raise ValueError(f"Cannot split {len(cpus)} CPUs for {num_replicas} replicas. Please set cpu_sets.")
+            cpus_per_replica = len(cpus) // num_replicas
+            cpu_sets = [cpus[i * cpus_per_replica : (i + 1) * cpus_per_replica] for i in range(num_replicas)]
+        elif len(cpu_sets) != num_replicas or not all(cpu_sets):
+            raise ValueError(f"Expect {num_replicas} non-empty CPU sets, got {cpu_sets}.")
+        self._cpu_sets = [list(cpu_set) for cpu_set in cpu_sets]
+
+        if sess_options is None:
+            sess_options = C.SessionOptions()
+
+        # OrtValues of shared initializers shall be alive as long as the replicas.
+        self._shared_initializers = []
+        if share_initializers:
+            path_or_bytes = self._add_shared_initializers(path_or_bytes, sess_options)
+
+        if share_allocator:
+            _register_shared_cpu_allocator()
+            sess_options.add_session_config_entry("session.use_env_allocators", "1")
+
+        self._replicas = [None] * num_replicas
+        # The affinity config entry cannot be removed once added, so replicas with one CPU are created first.
+        for index in sorted(range(num_replicas), key=lambda i: len(self._cpu_sets[i]) > 1):
+            cpu_set = self._cpu_sets[index]
+            sess_options.intra_op_num_threads = len(cpu_set)
+            if len(cpu_set) > 1:
+                # The first CPU is left for the calling thread, and each thread of the threadpool is pinned to one CPU.
+                # Logical processor ids in the config entry start from 1.
+                affinities = ";".join(str(cpu + 1) for cpu in cpu_set[1:])
+                sess_options.add_session_config_entry("session.intra_op_thread_affinities", affinities)
+            self._replicas[index] = InferenceSession(path_or_bytes, sess_options, providers, provider_options, **kwargs)
+
+        self._lock = threading.Lock()
+        self._in_flight_runs = [0] * num_replicas
+
+    def _add_shared_initializers(self, path_or_bytes, sess_options):
+        try:
+            import onnx
+            from onnx import numpy_helper
+        except ImportError:
+            warnings.warn("Initializers are not shared among replicas since onnx is not installed.")
+            return path_or_bytes
+
+        if isinstance(path_or_bytes, bytes):
+            model = onnx.load_model_from_string(path_or_bytes)
+        else:
+            model = onnx.load_model(str(path_or_bytes))
+
+        names = []
+        for tensor in model.graph.initializer:
+            if tensor.data_location == onnx.TensorProto.EXTERNAL or tensor.data_type == onnx.TensorProto.STRING:
+                continue
+            array = numpy_helper.to_array(tensor)
+            # Small tensors like shapes are not worth sharing.
+            if array.nbytes < 1024:
+                continue
+            self._shared_initializers.append(OrtValue.ortvalue_from_numpy(array))
+            names.append(tensor.name)
+
+            # Data is removed from the model, and provided from memory when the model is loaded, so that each replica
+            # does not keep its own copy in the graph.
+            for field in ["raw_data", "float_data", "int32_data", "int64_data", "double_data", "uint64_data"]:
+                tensor.ClearField(field)
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+            del tensor.external_data[:]
+            entry = tensor.external_data.add()
+            entry.key = "location"
+            entry.value = "shared_initializer"
+
+        if names:
+            sess_options.add_external_initializers(names, self._shared_initializers)
+        return model.SerializeToString()
+
+    @property
+    def replicas(self) -> list[InferenceSession]:
+        "Return the sessions of the replicas."
+        return self._replicas
+
+    @property
+    def cpu_sets(self) -> list[list[int]]:
+        "Return the logical CPU ids of each replica."
+        return self._cpu_sets
+
+    @property
+    def in_flight_runs(self) -> list[int]:
+        "Return the number of runs in flight of each replica."
+        with self._lock:
+            return list(self._in_flight_runs)
+
+    def get_inputs(self):
+        "Return the inputs metadata as a list of :class:`onnxruntime.NodeArg`."
+        return self._replicas[0].get_inputs()
+
+    def get_outputs(self):
+        "Return the outputs metadata as a list of :class:`onnxruntime.NodeArg`."
+        return self._replicas[0].get_outputs()
+
+    def run(self, output_names, input_feed, run_options=None):
+        """
+        Compute the predictions with the replica that has the fewest runs in flight. See :meth:`Session.run`.
+        """
+        with self._lock:
+            index = min(range(len(self._replicas)), key=self._in_flight_runs.__getitem__)
+            self._in_flight_runs[index] += 1
+        try:
+            return self._replicas[index].run(output_names, input_feed, run_options)
+        finally:
+            with self._lock:
+                self._in_flight_runs[index] -= 1
+
+
 class IOBinding:
     """
     This class provides API to bind input/output to a specified device, e.g. GPU.
@@ -714,6 +1288,117 @@ class IOBinding:
         self._iobinding.clear_binding_outputs()
 
 
+class IOBindingArena:
+    """
+    Runs a session with :class:`IOBinding` on CPU, and reuses preallocated buffers for outputs across runs.
+
+    Output shapes are learned from the first run with each combination of input shapes, where outputs are
+    allocated by the session. Later runs with the same input shapes bind outputs to views of one buffer per output,
+    so steady-state inference has no large allocations. The buffer of an output grows to the next power of two
+    elements when a larger output is needed. If output shapes depend on input data, a run that does not fit the
+    learned shapes is retried with outputs allocated by the session, which is used for those input shapes from then on.
+
+    Results are zero-copy numpy views of the buffers, so they are overwritten by the next run. Copy them if they
+    are needed after that. An instance shall not be used by multiple threads at the same time.
+
+    ::
+
+        arena = onnxruntime.IOBindingArena(sess)
+        for x in inputs:
+            results = arena.run({input_name: x})
+    """
+
+    def __init__(self, session: Session, output_names: Sequence[str] | None = None, max_cached_shapes: int = 256):
+        """
+        :param session: the session to run.
+        :param output_names: name of the outputs. All outputs are computed by default.
+        :param max_cached_shapes: maximum number of input shapes to remember output shapes for.
+        """
+        outputs_meta = {output.name: output for output in session.get_outputs()}
+        self._output_names = list(output_names) if output_names else list(outputs_meta)
+        non_tensor_outputs = [name for name in self._output_names if not outputs_meta[name].type.startswith("tensor")]
+        if non_tensor_outputs:
+            raise ValueError(f"Outputs ({non_tensor_outputs}) are not tensors.")
+
+        self._session = session
+        self._io_binding = session.io_binding()
+        self._max_cached_shapes = max_cached_shapes
+        # input shapes -> output shapes, in least recently used order
+        self._output_shapes = collections.OrderedDict()
+        # output name -> data type and flat buffer
+        self._dtypes = {}
+        self._buffers = {}
+        # (output name, shape) -> numpy view of the buffer and the OrtValue on top of it
+        self._views = {}
+
+    def _get_output_view(self, name, shape):
+        view = self._views.get((name, shape))
+        if view is None:
+            size = int(np.prod(shape))
+            buffer = self._buffers.get(name)
+            dtype = self._dtypes[name]
+            if buffer is None or buffer.size < size or buffer.dtype != dtype:
+                buffer = np.empty(1 << max(size - 1, 0).bit_length(), dtype=dtype)
+                self._buffers[name] = buffer
+                # Views of the previous buffer are released.
+                self._views = {key: value for key, value in self._views.items() if key[0] != name}
+            elif len(self._views) >= self._max_cached_shapes * len(self._output_names):
+                self._views.clear()
+            array = buffer[:size].reshape(shape)
+            view = (array, OrtValue.ortvalue_from_numpy(array))
+            self._views[(name, shape)] = view
+        return view
+
+    def run(self, input_feed, run_options=None):
+        """
+        Compute the predictions.
+
+        :param input_feed: dictionary ``{ input_name: input_value }`` of numpy arrays.
+        :param run_options: See :class:`onnxruntime.RunOptions`.
+        :return: list of numpy arrays, which are valid until the next run.
+        """
+        io_binding = self._io_binding
+        for name, value in input_feed.items():
+            io_binding.bind_cpu_input(name, value)
+
+        input_shapes = tuple((name, value.shape) for name, value in input_feed.items())
+        # None when output shapes are not learned yet, and empty when they depend on input data.
+        output_shapes = self._output_shapes.get(input_shapes)
+        failed = False
+        if output_shapes:
+            self._output_shapes.move_to_end(input_shapes)
+            results = []
+            for name, shape in zip(self._output_names, output_shapes, strict=True):
+                array, ortvalue = self._get_output_view(name, shape)
+                io_binding.bind_ortvalue_output(name, ortvalue)
+                results.append(array)
+            try:
+                self._session.run_with_iobinding(io_binding, run_options)
+                return results
+            except RuntimeError:
+                # Output shapes might depend on input data. Run again with outputs allocated by the session.
+                failed = True
+
+        for name in self._output_names:
+            io_binding.bind_output(name, "cpu")
+        self._session.run_with_iobinding(io_binding, run_options)
+        results = io_binding.copy_outputs_to_cpu()
+
+        if output_shapes is None:
+            for name, result in zip(self._output_names, results, strict=True):
+                self._dtypes[name] = result.dtype
+            output_shapes = tuple(result.shape for result in results)
+        elif failed and output_shapes != tuple(result.shape for result in results):
+            # Output shapes depend on input data, so outputs are allocated by the session from now on.
+            # Buffers are still reused when the failure was not caused by the shapes.
+            output_shapes = ()
+        self._output_shapes[input_shapes] = output_shapes
+        self._output_shapes.move_to_end(input_shapes)
+        if len(self._output_shapes) > self._max_cached_shapes:
+            self._output_shapes.popitem(last=False)
+        return results
+
+
 class OrtValue:
     """
     A data structure that supports all ONNX data formats (tensors and non-tensors) that allows users
@@ -53,6 +53,8 @@ void QuantizeMatMul4BitsBlockwise(
   py::buffer_info scale_buf = scale.request();
   py::buffer_info zp_buf = zero_points.request();
 
+  // The buffers are only accessed through their pointers, other python threads can run meanwhile.
+  py::gil_scoped_release release;
   MlasQuantizeBlockwise<T, 4>(
       reinterpret_cast<uint8_t*>(dst_buf.ptr),
       reinterpret_cast<T*>(scale_buf.ptr),
@@ -85,6 +87,7 @@ bool QuantizeQDQMatMul4BitsBlockwise(
   py::buffer_info scale_buf = scale.request();
   py::buffer_info zp_buf = zero_points.request();
 
+  py::gil_scoped_release release;
   return MlasQDQQuantizeBlockwise<T, 4>(
       reinterpret_cast<const T*>(src_buf.ptr),
       reinterpret_cast<T*>(scale_buf.ptr),
@@ -114,6 +117,7 @@ void QuantizeMatMulBnb4Blockwise(
   py::buffer_info src_buf = src.request();
   py::buffer_info absmax_buf = absmax.request();
 
+  py::gil_scoped_release release;
   contrib::QuantizeBlockwiseBnb4<T>(
       static_cast<uint8_t*>(dst_buf.ptr),
       static_cast<const T*>(src_buf.ptr),
@@ -1,8 +1,10 @@
 from .calibrate import (  # noqa: F401
     CalibraterBase,
+    CalibrationCache,
     CalibrationDataReader,
     CalibrationMethod,
     MinMaxCalibrater,
+    compute_data_fingerprint,
     create_calibrator,
 )
 from .qdq_quantizer import QDQQuantizer  # noqa: F401
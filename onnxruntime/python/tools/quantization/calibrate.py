@@ -6,11 +6,17 @@
 # --------------------------------------------------------------------------
 import abc
 import copy
+import hashlib
 import itertools
+import json
 import os
+import pickle
+import tempfile
 import uuid
 from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Enum
+from multiprocessing import shared_memory
 from pathlib import Path
 
 import numpy as np
@@ -19,7 +25,7 @@ from onnx import ModelProto, TensorProto, helper, numpy_helper
 
 import onnxruntime
 
-from .quant_utils import apply_plot, load_model_with_shape_infer, smooth_distribution
+from .quant_utils import apply_plot, load_model_with_shape_infer
 
 
 def rel_entr(pk: np.ndarray, qk: np.ndarray) -> np.ndarray:
@@ -183,6 +189,14 @@ class CalibrationDataReader(metaclass=abc.ABCMeta):
     def set_range(self, start_index: int, end_index: int):
         raise NotImplementedError
 
+    def fingerprint(self) -> str | None:
+        """
+        Returns a string identifying the calibration data, used as part of the key of the calibration cache
+        (see CalibrationCache). None means the data cannot be identified, which disables the cache.
+        :func:`compute_data_fingerprint` can be used to compute it from the input data.
+        """
+        return None
+
 
 class CalibraterBase:
     def __init__(
@@ -217,7 +231,10 @@ class CalibraterBase:
 
         self.augment_model = None
         self.infer_session = None
+        self.infer_sessions = []
         self.execution_providers = ["CPUExecutionProvider"]
+        # Number of inference sessions running the calibration batches concurrently.
+        self.num_inference_sessions = 1
 
     def set_execution_providers(self, execution_providers=["CPUExecutionProvider"]):  # noqa: B006
         """
@@ -229,14 +246,53 @@ class CalibraterBase:
     def create_inference_session(self):
         """
         create an OnnxRuntime InferenceSession.
+        If num_inference_sessions is greater than 1, as many sessions are created and the intra-op threads
+        are split between them.
         """
         sess_options = onnxruntime.SessionOptions()
         sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
-        self.infer_session = onnxruntime.InferenceSession(
-            self.augmented_model_path,
-            sess_options=sess_options,
-            providers=self.execution_providers,
-        )
+        num_sessions = max(1, self.num_inference_sessions or 1)
+        if num_sessions > 1:
+            sess_options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // num_sessions)
+        self.infer_sessions = [
+            onnxruntime.InferenceSession(
+                self.augmented_model_path,
+                sess_options=sess_options,
+                providers=self.execution_providers,
+            )
+            for _ in range(num_sessions)
+        ]
+        self.infer_session = self.infer_sessions[0]
+
+    def run_data_reader(self, data_reader: CalibrationDataReader, output_names=None):
+        """
+        Runs the inference sessions on every batch of the data reader.
+        The batches are read in order and dispatched to the sessions, which run concurrently when there are
+        more than one of them. The outputs are yielded in the order of the batches, so the collected data
+        does not depend on the number of sessions.
+        :param data_reader: calibration data reader.
+        :param output_names: names of the outputs to fetch, all of them by default.
+        """
+        if len(self.infer_sessions) <= 1:
+            while True:
+                inputs = data_reader.get_next()
+                if not inputs:
+                    break
+                yield self.infer_session.run(output_names, inputs)
+            return
+
+        with ThreadPoolExecutor(max_workers=len(self.infer_sessions)) as executor:
+            while True:
+                futures = []
+                for session in self.infer_sessions:
+                    inputs = data_reader.get_next()
+                    if not inputs:
+                        break
+                    futures.append(executor.submit(session.run, output_names, inputs))
+                for future in futures:
+                    yield future.result()
+                if len(futures) < len(self.infer_sessions):
+                    break
 
     def select_tensors_to_calibrate(self, model: ModelProto):
         """
@@ -306,6 +362,8 @@ class MinMaxCalibrater(CalibraterBase):
         averaging_constant=0.01,
         max_intermediate_outputs=None,
         per_channel=False,
+        running_reduction=False,
+        use_io_binding=False,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -317,6 +375,11 @@ class MinMaxCalibrater(CalibraterBase):
         :param averaging_constant: constant smoothing factor to use when computing the moving average.
         :param max_intermediate_outputs: maximum number of intermediate outputs before an intermediate range is computed.
         :param per_channel: whether to compute ranges per each channel.
+        :param running_reduction: fold the reduced minimum and maximum values of each batch into running values
+            as soon as they are produced instead of keeping the outputs of every batch. Only the outputs of the added
+            ReduceMin/ReduceMax nodes are fetched, so memory usage only depends on the number of tensors.
+        :param use_io_binding: when running_reduction is enabled, fetch the reduced values through an IOBinding
+            with output buffers preallocated after the first batch. Ignored with several inference sessions.
         """
         super().__init__(
             model_path,
@@ -335,6 +398,11 @@ class MinMaxCalibrater(CalibraterBase):
             raise ValueError("Invalid averaging constant, which should not be < 0 or > 1.")
         self.averaging_constant = averaging_constant
         self.max_intermediate_outputs = max_intermediate_outputs
+        self.running_reduction = running_reduction
+        self.use_io_binding = use_io_binding
+        self.running_values = None
+        self.running_dtypes = None
+        self.num_running_batches = 0
 
     def augment_graph(self):
         """
@@ -411,13 +479,16 @@ class MinMaxCalibrater(CalibraterBase):
 
     def clear_collected_data(self):
         self.intermediate_outputs = []
+        self.running_values = None
+        self.num_running_batches = 0
 
     def collect_data(self, data_reader: CalibrationDataReader):
-        while True:
-            inputs = data_reader.get_next()
-            if not inputs:
-                break
-            self.intermediate_outputs.append(self.infer_session.run(None, inputs))
+        if self.running_reduction:
+            self.collect_data_running(data_reader)
+            return
+
+        for outputs in self.run_data_reader(data_reader):
+            self.intermediate_outputs.append(outputs)
             if (
                 self.max_intermediate_outputs is not None
                 and len(self.intermediate_outputs) == self.max_intermediate_outputs
@@ -432,6 +503,123 @@ class MinMaxCalibrater(CalibraterBase):
             raise TypeError(f"compute_data must return a TensorsData not {type(t)}.")
         self.clear_collected_data()
 
+    def collect_data_running(self, data_reader: CalibrationDataReader):
+        """
+        Collects the ranges like collect_data but folds the reduced values of every batch into
+        running values (minimum/maximum, or sum and count for the moving average) right away.
+        """
+        added_output_names = [output.name for output in self.infer_session.get_outputs()[self.num_model_outputs :]]
+        if self.use_io_binding and len(self.infer_sessions) <= 1:
+            batch_outputs = self.run_data_reader_with_io_binding(data_reader, added_output_names)
+        else:
+            batch_outputs = self.run_data_reader(data_reader, added_output_names)
+        for outputs in batch_outputs:
+            self.update_running_values(outputs)
+
+        if self.num_running_batches == 0:
+            if self.calibrate_tensors_range is None:
+                raise ValueError("No data is collected.")
+            return
+
+        if self.moving_average:
+            # Same as np.nanmean over the batches.
+            values = [
+                (total / count).astype(dtype)
+                for (total, count), dtype in zip(self.running_values, self.running_dtypes, strict=True)
+            ]
+        else:
+            values = self.running_values
+        self.update_calibrate_tensors_range(added_output_names, values)
+        self.clear_collected_data()
+
+    def run_data_reader_with_io_binding(self, data_reader: CalibrationDataReader, output_names):
+        """
+        Same as run_data_reader but binds the outputs to buffers preallocated after the first batch.
+        The yielded arrays are overwritten by the next batch.
+        """
+        io_binding = self.infer_session.io_binding()
+        output_buffers = None
+        while True:
+            inputs = data_reader.get_next()
+            if not inputs:
+                break
+            for name, value in inputs.items():
+                io_binding.bind_cpu_input(name, value)
+            if output_buffers is None:
+                for name in output_names:
+                    io_binding.bind_output(name)
+                self.infer_session.run_with_iobinding(io_binding)
+                outputs = io_binding.copy_outputs_to_cpu()
+                # The reduced outputs have the same shape for every batch, they are written
+                # to preallocated buffers from now on.
+                output_buffers = [np.empty_like(output) for output in outputs]
+                io_binding.clear_binding_outputs()
+                for name, buffer in zip(output_names, output_buffers, strict=True):
+                    io_binding.bind_output(name, "cpu", 0, buffer.dtype.type, buffer.shape, buffer.ctypes.data)
+            else:
+                self.infer_session.run_with_iobinding(io_binding)
+                outputs = output_buffers
+            yield outputs
+
+    def update_running_values(self, outputs):
+        """
+        Folds the reduced outputs of one batch into the running values.
+        """
+        if self.running_values is None:
+            self.running_dtypes = [output.dtype for output in outputs]
+            if self.moving_average:
+                self.running_values = [
+                    (np.zeros(output.shape, dtype=np.float64), np.zeros(output.shape, dtype=np.int64))
+                    for output in outputs
+                ]
+            else:
+                self.running_values = [np.array(output) for output in outputs]
+                self.num_running_batches += 1
+                return
+
+        for i, output in enumerate(outputs):
+            if self.moving_average:
+                total, count = self.running_values[i]
+                not_nan = ~np.isnan(output)
+                total += np.where(not_nan, output, 0)
+                count += not_nan
+            else:
+                # fmin/fmax ignore NaN values like np.nanmin/np.nanmax.
+                reduce = np.fmin if i % 2 == 0 else np.fmax
+                reduce(self.running_values[i], output, out=self.running_values[i])
+        self.num_running_batches += 1
+
+    def update_calibrate_tensors_range(self, added_output_names, values):
+        """
+        Merges the minimum and maximum values of the added outputs into the calibrated ranges.
+        :param added_output_names: names of the outputs of the added ReduceMin/ReduceMax nodes.
+        :param values: minimum and maximum values computed over the collected batches for each added output.
+        """
+        calibrate_tensor_names = [
+            added_output_names[i].rpartition("_")[0] for i in range(0, len(added_output_names), 2)
+        ]  # output names
+
+        pairs = []
+        for i in range(0, len(added_output_names), 2):
+            min_value_array = values[i]
+            max_value_array = values[i + 1]
+
+            if self.symmetric:
+                max_absolute_value = np.nanmax([np.abs(min_value_array), np.abs(max_value_array)], axis=0)
+                pairs.append((-max_absolute_value, max_absolute_value))
+            else:
+                pairs.append((min_value_array, max_value_array))
+
+        new_calibrate_tensors_range = TensorsData(
+            CalibrationMethod.MinMax, dict(zip(calibrate_tensor_names, pairs, strict=False))
+        )
+        if self.calibrate_tensors_range:
+            self.calibrate_tensors_range = self.merge_range(self.calibrate_tensors_range, new_calibrate_tensors_range)
+        else:
+            self.calibrate_tensors_range = new_calibrate_tensors_range
+
+        return self.calibrate_tensors_range
+
     def merge_range(self, old_range, new_range):
         if not old_range:
             return new_range
@@ -454,8 +642,9 @@ class MinMaxCalibrater(CalibraterBase):
                 min_value = old_min + self.averaging_constant * (new_min - old_min)
                 max_value = old_max + self.averaging_constant * (new_max - old_max)
             else:
-                min_value = min(old_min, new_min)
-                max_value = max(old_max, new_max)
+                # Per-channel ranges are arrays.
+                min_value = np.minimum(old_min, new_min)
+                max_value = np.maximum(old_max, new_max)
 
             # If structured as TensorData, wrap the result accordingly
             if isinstance(value, TensorData) or isinstance(new_range[key], TensorData):
@@ -485,38 +674,56 @@ class MinMaxCalibrater(CalibraterBase):
             for k, v in d.items():
                 merged_output_dict.setdefault(k, []).append(v)
         added_output_names = output_names[self.num_model_outputs :]
-        calibrate_tensor_names = [
-            added_output_names[i].rpartition("_")[0] for i in range(0, len(added_output_names), 2)
-        ]  # output names
 
         merged_added_output_dict = {
             i: merged_output_dict[i] for i in merged_output_dict if i not in self.model_original_outputs
         }
 
-        pairs = []
+        values = []
         for i in range(0, len(added_output_names), 2):
             if self.moving_average:
-                min_value_array = np.nanmean(merged_added_output_dict[added_output_names[i]], axis=0)
-                max_value_array = np.nanmean(merged_added_output_dict[added_output_names[i + 1]], axis=0)
+                values.append(np.nanmean(merged_added_output_dict[added_output_names[i]], axis=0))
+                values.append(np.nanmean(merged_added_output_dict[added_output_names[i + 1]], axis=0))
             else:
-                min_value_array = np.nanmin(merged_added_output_dict[added_output_names[i]], axis=0)
-                max_value_array = np.nanmax(merged_added_output_dict[added_output_names[i + 1]], axis=0)
+                values.append(np.nanmin(merged_added_output_dict[added_output_names[i]], axis=0))
+                values.append(np.nanmax(merged_added_output_dict[added_output_names[i + 1]], axis=0))
 
-            if self.symmetric:
-                max_absolute_value = np.nanmax([np.abs(min_value_array), np.abs(max_value_array)], axis=0)
-                pairs.append((-max_absolute_value, max_absolute_value))
-            else:
-                pairs.append((min_value_array, max_value_array))
+        return self.update_calibrate_tensors_range(added_output_names, values)
 
-        new_calibrate_tensors_range = TensorsData(
-            CalibrationMethod.MinMax, dict(zip(calibrate_tensor_names, pairs, strict=False))
-        )
-        if self.calibrate_tensors_range:
-            self.calibrate_tensors_range = self.merge_range(self.calibrate_tensors_range, new_calibrate_tensors_range)
-        else:
-            self.calibrate_tensors_range = new_calibrate_tensors_range
 
-        return self.calibrate_tensors_range
+class _RecordingDataReader(CalibrationDataReader):
+    """
+    Reads the batches of a data reader and writes them to a file, so they can be read again with _FileDataReader
+    without keeping them in memory.
+    """
+
+    def __init__(self, data_reader: CalibrationDataReader, file):
+        self.data_reader = data_reader
+        self.file = file
+        self.num_batches = 0
+
+    def get_next(self) -> dict:
+        inputs = self.data_reader.get_next()
+        if inputs:
+            pickle.dump(inputs, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.num_batches += 1
+        return inputs
+
+
+class _FileDataReader(CalibrationDataReader):
+    """
+    Reads the batches written to a file by _RecordingDataReader.
+    """
+
+    def __init__(self, file, num_batches: int):
+        self.file = file
+        self.num_batches = num_batches
+
+    def get_next(self) -> dict:
+        if self.num_batches == 0:
+            return None
+        self.num_batches -= 1
+        return pickle.load(self.file)
 
 
 class HistogramCalibrater(CalibraterBase):
@@ -532,6 +739,8 @@ class HistogramCalibrater(CalibraterBase):
         num_quantized_bins=2048,
         percentile=99.999,
         scenario="same",
+        max_intermediate_outputs=None,
+        num_workers=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path.
@@ -544,6 +753,11 @@ class HistogramCalibrater(CalibraterBase):
         :param num_quantized_bins: number of quantized bins. Default 128.
         :param percentile: A float number between [0, 100]. Default 99.99.
         :param scenario: see :class:`DistributionCalibrater`
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are merged
+            into the histograms. By default, all the outputs of a call to collect_data are kept. The histograms
+            are the same, but the model runs twice on the inputs, which are written to a temporary file.
+        :param num_workers: number of processes computing the ranges of the tensors in parallel.
+            By default, the ranges are computed sequentially.
         """
         super().__init__(
             model_path,
@@ -563,6 +777,8 @@ class HistogramCalibrater(CalibraterBase):
         self.percentile = percentile
         self.tensors_to_calibrate = None
         self.scenario = scenario
+        self.max_intermediate_outputs = max_intermediate_outputs
+        self.num_workers = num_workers
 
     def augment_graph(self):
         """
@@ -586,55 +802,101 @@ class HistogramCalibrater(CalibraterBase):
     def collect_data(self, data_reader: CalibrationDataReader):
         """
         Entropy Calibrator collects operators' tensors as well as generates tensor histogram for each operator.
+        If max_intermediate_outputs is set, the tensors are collected in chunks of max_intermediate_outputs
+        batches, so memory usage does not grow with the number of batches. The inputs are written to a temporary
+        file and the model runs twice on every batch: the first time to find the ranges of the tensors, the second
+        time to count the tensors in the bins of the histograms. The histograms are the same as without chunks.
         """
-        input_names_set = {node_arg.name for node_arg in self.infer_session.get_inputs()}
-        output_names = [node_arg.name for node_arg in self.infer_session.get_outputs()]
-
-        while True:
-            inputs = data_reader.get_next()
-            if not inputs:
-                break
-            outputs = self.infer_session.run(None, inputs)
-
-            # Copy np.ndarray only for graph outputs that are also graph inputs to workaround bug:
-            # https://github.com/microsoft/onnxruntime/issues/21922
-            fixed_outputs = []
-            for output_index, output in enumerate(outputs):
-                if output_names[output_index] in input_names_set:
-                    fixed_outputs.append(copy.copy(output))
-                else:
-                    fixed_outputs.append(output)
-
-            self.intermediate_outputs.append(fixed_outputs)
-
-        if len(self.intermediate_outputs) == 0:
-            raise ValueError("No data is collected.")
+        if self.max_intermediate_outputs is None:
+            input_names_set = {node_arg.name for node_arg in self.infer_session.get_inputs()}
+            output_names = [node_arg.name for node_arg in self.infer_session.get_outputs()]
+
+            for outputs in self.run_data_reader(data_reader):
+                # Copy np.ndarray only for graph outputs that are also graph inputs to workaround bug:
+                # https://github.com/microsoft/onnxruntime/issues/21922
+                fixed_outputs = []
+                for output_index, output in enumerate(outputs):
+                    if output_names[output_index] in input_names_set:
+                        fixed_outputs.append(copy.copy(output))
+                    else:
+                        fixed_outputs.append(output)
+                self.intermediate_outputs.append(fixed_outputs)
+
+            if len(self.intermediate_outputs) == 0:
+                raise ValueError("No data is collected.")
+
+            self.update_histograms(output_names)
+            return
 
-        output_dicts_list = [
-            dict(zip(output_names, intermediate_output, strict=False))
-            for intermediate_output in self.intermediate_outputs
+        if not self.collector:
+            self.collector = self.create_collector()
+        with tempfile.TemporaryFile() as file:
+            recording_reader = _RecordingDataReader(data_reader, file)
+            self._collect_chunks(recording_reader, self.collector.collect_range)
+            if recording_reader.num_batches == 0:
+                raise ValueError("No data is collected.")
+            file.seek(0)
+            self._collect_chunks(_FileDataReader(file, recording_reader.num_batches), self.collector.collect_chunk)
+        self.collector.finish_chunks()
+
+    def _collect_chunks(self, data_reader: CalibrationDataReader, collect):
+        """
+        Runs the model on every batch and calls collect with the tensors to calibrate of every
+        max_intermediate_outputs batches.
+        """
+        input_names_set = {node_arg.name for node_arg in self.infer_session.get_inputs()}
+        output_names = [
+            node_arg.name for node_arg in self.infer_session.get_outputs() if node_arg.name in self.tensors_to_calibrate
         ]
 
+        chunk = {}
+        num_batches = 0
+        for outputs in self.run_data_reader(data_reader, output_names):
+            for name, output in zip(output_names, outputs, strict=True):
+                # Same workaround as above for https://github.com/microsoft/onnxruntime/issues/21922
+                chunk.setdefault(name, []).append(copy.copy(output) if name in input_names_set else output)
+            num_batches += 1
+            if num_batches == self.max_intermediate_outputs:
+                collect(chunk)
+                chunk = {}
+                num_batches = 0
+        if num_batches > 0:
+            collect(chunk)
+
+    def update_histograms(self, output_names):
+        """
+        Merge the intermediate outputs collected so far into the histograms and release them.
+        """
         merged_dict = {}
-        for d in output_dicts_list:
-            for k, v in d.items():
-                merged_dict.setdefault(k, []).append(v)
-
-        clean_merged_dict = {i: merged_dict[i] for i in merged_dict if i in self.tensors_to_calibrate}
+        for intermediate_output in self.intermediate_outputs:
+            for k, v in zip(output_names, intermediate_output, strict=False):
+                if k in self.tensors_to_calibrate:
+                    merged_dict.setdefault(k, []).append(v)
 
         if not self.collector:
-            self.collector = HistogramCollector(
-                method=self.method,
-                symmetric=self.symmetric,
-                num_bins=self.num_bins,
-                num_quantized_bins=self.num_quantized_bins,
-                percentile=self.percentile,
-                scenario=self.scenario,
-            )
-        self.collector.collect(clean_merged_dict)
+            self.collector = self.create_collector()
+        self.collector.collect(merged_dict)
 
         self.clear_collected_data()
 
+    def create_collector(self):
+        return HistogramCollector(
+            method=self.method,
+            symmetric=self.symmetric,
+            num_bins=self.num_bins,
+            num_quantized_bins=self.num_quantized_bins,
+            percentile=self.percentile,
+            scenario=self.scenario,
+            num_workers=self.num_workers,
+        )
+
+    def set_histograms(self, histogram_dict):
+        """
+        Replaces the collected histograms, for example with histograms loaded from a CalibrationCache.
+        """
+        self.collector = self.create_collector()
+        self.collector.histogram_dict = histogram_dict
+
     def compute_data(self) -> TensorsData:
         """
         Compute the min-max range of tensor
@@ -665,6 +927,8 @@ class EntropyCalibrater(HistogramCalibrater):
         symmetric=False,
         num_bins=128,
         num_quantized_bins=128,
+        max_intermediate_outputs=None,
+        num_workers=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -675,6 +939,11 @@ class EntropyCalibrater(HistogramCalibrater):
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param num_bins: number of bins to create a new histogram for collecting tensor values.
         :param num_quantized_bins: number of quantized bins. Default 128.
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are merged
+            into the histograms. By default, all the outputs of a call to collect_data are kept. The histograms
+            are the same, but the model runs twice on the inputs, which are written to a temporary file.
+        :param num_workers: number of processes computing the ranges of the tensors in parallel.
+            By default, the ranges are computed sequentially.
         """
         super().__init__(
             model_path,
@@ -685,6 +954,8 @@ class EntropyCalibrater(HistogramCalibrater):
             symmetric=symmetric,
             num_bins=num_bins,
             num_quantized_bins=num_quantized_bins,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
 
@@ -699,6 +970,8 @@ class PercentileCalibrater(HistogramCalibrater):
         symmetric=False,
         num_bins=2048,
         percentile=99.999,
+        max_intermediate_outputs=None,
+        num_workers=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -709,6 +982,11 @@ class PercentileCalibrater(HistogramCalibrater):
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param num_quantized_bins: number of quantized bins. Default 128.
         :param percentile: A float number between [0, 100]. Default 99.99.
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are merged
+            into the histograms. By default, all the outputs of a call to collect_data are kept. The histograms
+            are the same, but the model runs twice on the inputs, which are written to a temporary file.
+        :param num_workers: number of processes computing the ranges of the tensors in parallel.
+            By default, the ranges are computed sequentially.
         """
         super().__init__(
             model_path,
@@ -719,6 +997,8 @@ class PercentileCalibrater(HistogramCalibrater):
             symmetric=symmetric,
             num_bins=num_bins,
             percentile=percentile,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
 
@@ -732,6 +1012,8 @@ class DistributionCalibrater(HistogramCalibrater):
         method="distribution",
         num_bins=128,
         scenario="same",
+        max_intermediate_outputs=None,
+        num_workers=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -745,6 +1027,11 @@ class DistributionCalibrater(HistogramCalibrater):
             the algorithm weights and float 8 follow the same distribution,
             if `scenario="p3"`, it assumes the weights follow
             a gaussian law and float 8 ~ X^3 where X is a gaussian law
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are merged
+            into the histograms. By default, all the outputs of a call to collect_data are kept. The histograms
+            are the same, but the model runs twice on the inputs, which are written to a temporary file.
+        :param num_workers: number of processes computing the ranges of the tensors in parallel.
+            By default, the ranges are computed sequentially.
         """
         super().__init__(
             model_path,
@@ -754,6 +1041,8 @@ class DistributionCalibrater(HistogramCalibrater):
             method=method,
             num_bins=num_bins,
             scenario=scenario,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
 
@@ -788,7 +1077,11 @@ class HistogramCollector(CalibrationDataCollector):
                  pytorch_quantization/calib/histogram.html
     """
 
-    def __init__(self, method, symmetric, num_bins, num_quantized_bins, percentile, scenario):
+    def __init__(self, method, symmetric, num_bins, num_quantized_bins, percentile, scenario, num_workers=None):
+        """
+        :param num_workers: number of processes used to compute the results of the tensors in parallel.
+            By default, the results are computed sequentially in the current process.
+        """
         self.histogram_dict = {}
         self.method = method
         self.symmetric = symmetric
@@ -796,6 +1089,10 @@ class HistogramCollector(CalibrationDataCollector):
         self.num_quantized_bins = num_quantized_bins
         self.percentile = percentile
         self.scenario = scenario
+        self.num_workers = num_workers
+        # Statistics and counts of the data collected in chunks, see collect_range().
+        self.chunk_statistics = {}
+        self.chunk_histograms = {}
 
     def get_histogram_dict(self):
         return self.histogram_dict
@@ -805,138 +1102,215 @@ class HistogramCollector(CalibrationDataCollector):
 
         # TODO: Currently we have different collect() for entropy and percentile method respectively.
         #       Need unified collect in the future.
+        if self._use_absolute_value():
+            return self.collect_absolute_value(name_to_arr)
+        return self.collect_value(name_to_arr)
+
+    def _use_absolute_value(self):
         if self.method in {"distribution", "entropy"}:
-            return self.collect_value(name_to_arr)
+            return False
         elif self.method == "percentile":
-            if self.symmetric:
-                return self.collect_absolute_value(name_to_arr)
-            else:
-                return self.collect_value(name_to_arr)
+            return self.symmetric
         else:
             raise ValueError("Only 'entropy', 'percentile' or 'distribution' methods are supported")
 
-    def collect_absolute_value(self, name_to_arr):
+    def collect_range(self, name_to_arr):
         """
-        Collect histogram on absolute value
+        Collects data in chunks, with the same histograms as collecting all the data at once with collect().
+        It takes two passes over the chunks: collect_range() is called with every chunk to find the range of the
+        data, then collect_chunk() is called with every chunk again to count the data in the bins, and
+        finish_chunks() merges the counts into the histograms.
         """
+        absolute = self._use_absolute_value()
         for tensor, data_arr in name_to_arr.items():
-            if isinstance(data_arr, list):
-                for arr in data_arr:
-                    assert isinstance(arr, np.ndarray), f"Unexpected type {type(arr)} for tensor={tensor!r}"
-                dtypes = {a.dtype for a in data_arr}
-                assert len(dtypes) == 1, (
-                    f"The calibration expects only one element type but got {dtypes} for tensor={tensor!r}"
-                )
-                data_arr_np = np.asarray(data_arr)
-            elif not isinstance(data_arr, np.ndarray):
-                raise ValueError(f"Unexpected type {type(data_arr)} for tensor={tensor!r}")
-            else:
-                data_arr_np = data_arr
-            data_arr_np = data_arr_np.flatten()
-            if data_arr_np.size > 0:
-                min_value = np.nanmin(data_arr_np)
-                max_value = np.nanmax(data_arr_np)
+            data_arr_np = self._to_flat_array(tensor, data_arr, absolute)
+            statistics = self._get_statistics(data_arr_np, absolute)
+            if tensor in self.chunk_statistics:
+                statistics = self._merge_statistics(self.chunk_statistics[tensor][1], statistics)
+            self.chunk_statistics[tensor] = (data_arr_np.dtype, statistics)
+
+    def collect_chunk(self, name_to_arr):
+        """
+        Counts a chunk of data in the bins of the histograms, after the range of all the chunks is collected
+        with collect_range().
+        """
+        absolute = self._use_absolute_value()
+        for tensor, data_arr in name_to_arr.items():
+            data_arr_np = self._to_flat_array(tensor, data_arr, absolute)
+            if absolute:
+                data_arr_np = np.absolute(data_arr_np)
+            if tensor not in self.chunk_histograms:
+                dtype, statistics = self.chunk_statistics[tensor]
+                bins, hist_range = self._get_bins(self.histogram_dict.get(tensor), statistics, dtype, absolute)
+                hist, hist_edges = np.histogram(data_arr_np, bins, range=hist_range)
+                self.chunk_histograms[tensor] = (hist, hist_edges, hist_range)
             else:
-                min_value = np.array(0, dtype=data_arr_np.dtype)
-                max_value = np.array(0, dtype=data_arr_np.dtype)
+                hist, hist_edges, hist_range = self.chunk_histograms[tensor]
+                # Bins are the same for all the chunks, so counts of a value do not depend on other values.
+                hist += np.histogram(data_arr_np, hist_edges if absolute else len(hist), range=hist_range)[0]
 
-            data_arr_np = np.absolute(data_arr_np)  # only consider absolute value
+    def finish_chunks(self):
+        """
+        Merges the counts of the chunks into the histograms.
+        """
+        absolute = self._use_absolute_value()
+        for tensor, (hist, hist_edges, hist_range) in self.chunk_histograms.items():
+            dtype, statistics = self.chunk_statistics[tensor]
+            self.histogram_dict[tensor] = self._merge_histogram(
+                self.histogram_dict.get(tensor), hist, hist_edges, hist_range, statistics, dtype, absolute
+            )
+        self.chunk_statistics = {}
+        self.chunk_histograms = {}
 
-            if tensor not in self.histogram_dict:
-                # first time it uses num_bins to compute histogram.
-                hist, hist_edges = np.histogram(data_arr_np, bins=self.num_bins)
-                hist_edges = hist_edges.astype(data_arr_np.dtype)
-                assert data_arr_np.dtype != np.float64, (
-                    "only float32 or float16 is supported, every constant must be explicitly typed"
-                )
-                self.histogram_dict[tensor] = (hist, hist_edges, min_value, max_value)
-            else:
-                old_histogram = self.histogram_dict[tensor]
-                old_min = old_histogram[2]
-                old_max = old_histogram[3]
-                assert hasattr(old_min, "dtype"), f"old_min should be a numpy array but is {type(old_min)}"
-                assert hasattr(old_max, "dtype"), f"old_min should be a numpy array but is {type(old_max)}"
-                old_hist = old_histogram[0]
-                old_hist_edges = old_histogram[1]
-                temp_amax = np.nanmax(data_arr_np)
-                if temp_amax > old_hist_edges[-1]:
-                    # increase the number of bins
-                    width = old_hist_edges[1] - old_hist_edges[0]
-                    # NOTE: np.arange may create an extra bin after the one containing temp_amax
-                    new_bin_edges = np.arange(old_hist_edges[-1] + width, temp_amax + width, width)
-                    old_hist_edges = np.hstack((old_hist_edges, new_bin_edges))
-                hist, hist_edges = np.histogram(data_arr_np, bins=old_hist_edges)
-                hist_edges = hist_edges.astype(data_arr_np.dtype)
-                hist[: len(old_hist)] += old_hist
-                assert data_arr_np.dtype != np.float64, (
-                    "only float32 or float16 is supported, every constant must be explicitly typed"
-                )
-                self.histogram_dict[tensor] = (hist, hist_edges, min(old_min, min_value), max(old_max, max_value))
+    @staticmethod
+    def _to_flat_array(tensor, data_arr, absolute):
+        if not absolute:
+            return np.asarray(data_arr).flatten()
+        if isinstance(data_arr, list):
+            for arr in data_arr:
+                assert isinstance(arr, np.ndarray), f"Unexpected type {type(arr)} for tensor={tensor!r}"
+            dtypes = {a.dtype for a in data_arr}
+            assert len(dtypes) == 1, (
+                f"The calibration expects only one element type but got {dtypes} for tensor={tensor!r}"
+            )
+            data_arr_np = np.asarray(data_arr)
+        elif not isinstance(data_arr, np.ndarray):
+            raise ValueError(f"Unexpected type {type(data_arr)} for tensor={tensor!r}")
+        else:
+            data_arr_np = data_arr
+        return data_arr_np.flatten()
 
-    def collect_value(self, name_to_arr):
+    @staticmethod
+    def _get_statistics(data_arr, absolute):
         """
-        Collect histogram on real value
+        Gets the statistics of flattened data that decide the bins of its histogram, or None if data is empty.
+        Statistics of chunks of data could be merged with _merge_statistics.
         """
-        for tensor, data_arr in name_to_arr.items():
-            data_arr = np.asarray(data_arr)  # noqa: PLW2901
-            data_arr = data_arr.flatten()  # noqa: PLW2901
+        if data_arr.size == 0:
+            return None
+        statistics = [np.nanmin(data_arr), np.nanmax(data_arr)]
+        if absolute:
+            abs_arr = np.absolute(data_arr)
+            # np.histogram finds its range with min and max, which do not ignore NaN.
+            statistics += [abs_arr.min(), abs_arr.max(), np.nanmax(abs_arr)]
+        return statistics
 
-            if data_arr.size > 0:
-                min_value = np.nanmin(data_arr)
-                max_value = np.nanmax(data_arr)
-            else:
-                min_value = np.array(0, dtype=data_arr.dtype)
-                max_value = np.array(0, dtype=data_arr.dtype)
+    @staticmethod
+    def _merge_statistics(statistics1, statistics2):
+        if statistics1 is None or statistics2 is None:
+            return statistics2 if statistics1 is None else statistics1
+        merged = [np.fmin(statistics1[0], statistics2[0]), np.fmax(statistics1[1], statistics2[1])]
+        if len(statistics1) > 2:
+            merged += [
+                np.minimum(statistics1[2], statistics2[2]),
+                np.maximum(statistics1[3], statistics2[3]),
+                np.fmax(statistics1[4], statistics2[4]),
+            ]
+        return merged
 
-            threshold = np.array(max(abs(min_value), abs(max_value)), dtype=data_arr.dtype)
+    @staticmethod
+    def _get_min_max_threshold(statistics, dtype):
+        if statistics is None:
+            min_value = np.array(0, dtype=dtype)
+            max_value = np.array(0, dtype=dtype)
+        else:
+            min_value, max_value = statistics[0], statistics[1]
+        threshold = np.array(max(abs(min_value), abs(max_value)), dtype=dtype)
+        return min_value, max_value, threshold
 
-            if tensor in self.histogram_dict:
-                old_histogram = self.histogram_dict[tensor]
-                self.histogram_dict[tensor] = self.merge_histogram(
-                    old_histogram, data_arr, min_value, max_value, threshold
-                )
-            else:
-                hist, hist_edges = np.histogram(data_arr, self.num_bins, range=(-threshold, threshold))
-                self.histogram_dict[tensor] = (
-                    hist,
-                    hist_edges,
-                    min_value,
-                    max_value,
-                    threshold,
-                )
+    def _get_bins(self, old_histogram, statistics, dtype, absolute):
+        """
+        Gets the arguments (bins, range) of np.histogram for new data of a tensor, from statistics of the data and
+        the histogram collected before (None if there is not).
+        """
+        if absolute:
+            if old_histogram is None:
+                # first time it uses num_bins to compute histogram. The range is the same as np.histogram finds.
+                return self.num_bins, (0, 1) if statistics is None else (statistics[2], statistics[3])
+            old_hist_edges = old_histogram[1]
+            if statistics is not None and statistics[4] > old_hist_edges[-1]:
+                # increase the number of bins
+                width = old_hist_edges[1] - old_hist_edges[0]
+                # NOTE: np.arange may create an extra bin after the one containing temp_amax
+                new_bin_edges = np.arange(old_hist_edges[-1] + width, statistics[4] + width, width)
+                old_hist_edges = np.hstack((old_hist_edges, new_bin_edges))
+            return old_hist_edges, None
+
+        _, _, new_threshold = self._get_min_max_threshold(statistics, dtype)
+        if old_histogram is None:
+            return self.num_bins, (-new_threshold, new_threshold)
+        old_hist, old_threshold = old_histogram[0], old_histogram[4]
+        if new_threshold <= old_threshold or old_threshold == 0:
+            threshold = max(new_threshold, old_threshold)
+            return len(old_hist), (-threshold, threshold)
+        old_num_bins = len(old_hist)
+        old_stride = 2 * old_threshold / old_num_bins
+        half_increased_bins = int((new_threshold - old_threshold) // old_stride + 1)
+        new_num_bins = old_num_bins + 2 * half_increased_bins
+        new_threshold = half_increased_bins * old_stride + old_threshold
+        return new_num_bins, (-new_threshold, new_threshold)
+
+    def _merge_histogram(self, old_histogram, hist, hist_edges, hist_range, statistics, dtype, absolute):
+        """
+        Merges the histogram of new data of a tensor, whose bins are from _get_bins, with the histogram
+        collected before (None if there is not).
+        """
+        min_value, max_value, new_threshold = self._get_min_max_threshold(statistics, dtype)
+        if old_histogram is not None:
+            old_hist, old_hist_edges, old_min, old_max = old_histogram[:4]
+            assert hasattr(old_min, "dtype"), f"old_min should be a numpy array but is {type(old_min)}"
+            assert hasattr(old_max, "dtype"), f"old_min should be a numpy array but is {type(old_max)}"
+            min_value, max_value = min(old_min, min_value), max(old_max, max_value)
+
+        if absolute:
+            hist_edges = hist_edges.astype(dtype)
+            if old_histogram is not None:
+                hist[: len(old_hist)] += old_hist
+            assert dtype != np.float64, "only float32 or float16 is supported, every constant must be explicitly typed"
+            return (hist, hist_edges, min_value, max_value)
 
-    def merge_histogram(self, old_histogram, data_arr, new_min, new_max, new_threshold):
-        (old_hist, old_hist_edges, old_min, old_max, old_threshold) = old_histogram
-
-        if new_threshold <= old_threshold:
-            new_hist, _ = np.histogram(data_arr, len(old_hist), range=(-old_threshold, old_threshold))
-            return (
-                new_hist + old_hist,
-                old_hist_edges,
-                min(old_min, new_min),
-                max(old_max, new_max),
-                old_threshold,
+        if old_histogram is not None:
+            old_threshold = old_histogram[4]
+            if new_threshold <= old_threshold:
+                return (hist + old_hist, old_hist_edges, min_value, max_value, old_threshold)
+            half_increased_bins = (len(hist) - len(old_hist)) // 2
+            hist[half_increased_bins : len(hist) - half_increased_bins] += old_hist
+        return (hist, hist_edges, min_value, max_value, hist_range[1])
+
+    def collect_absolute_value(self, name_to_arr):
+        """
+        Collect histogram on absolute value
+        """
+        for tensor, data_arr in name_to_arr.items():
+            data_arr_np = self._to_flat_array(tensor, data_arr, absolute=True)
+            statistics = self._get_statistics(data_arr_np, absolute=True)
+            old_histogram = self.histogram_dict.get(tensor)
+            bins, hist_range = self._get_bins(old_histogram, statistics, data_arr_np.dtype, absolute=True)
+            hist, hist_edges = np.histogram(np.absolute(data_arr_np), bins, range=hist_range)
+            self.histogram_dict[tensor] = self._merge_histogram(
+                old_histogram, hist, hist_edges, hist_range, statistics, data_arr_np.dtype, absolute=True
             )
-        else:
-            if old_threshold == 0:
-                hist, hist_edges = np.histogram(data_arr, len(old_hist), range=(-new_threshold, new_threshold))
-                hist += old_hist
-            else:
-                old_num_bins = len(old_hist)
-                old_stride = 2 * old_threshold / old_num_bins
-                half_increased_bins = int((new_threshold - old_threshold) // old_stride + 1)
-                new_num_bins = old_num_bins + 2 * half_increased_bins
-                new_threshold = half_increased_bins * old_stride + old_threshold
-                hist, hist_edges = np.histogram(data_arr, new_num_bins, range=(-new_threshold, new_threshold))
-                hist[half_increased_bins : new_num_bins - half_increased_bins] += old_hist
-            return (
-                hist,
-                hist_edges,
-                min(old_min, new_min),
-                max(old_max, new_max),
-                new_threshold,
+
+    def collect_value(self, name_to_arr):
+        """
+        Collect histogram on real value
+        """
+        for tensor, data_arr in name_to_arr.items():
+            data_arr_np = self._to_flat_array(tensor, data_arr, absolute=False)
+            statistics = self._get_statistics(data_arr_np, absolute=False)
+            old_histogram = self.histogram_dict.get(tensor)
+            bins, hist_range = self._get_bins(old_histogram, statistics, data_arr_np.dtype, absolute=False)
+            hist, hist_edges = np.histogram(data_arr_np, bins, range=hist_range)
+            self.histogram_dict[tensor] = self._merge_histogram(
+                old_histogram, hist, hist_edges, hist_range, statistics, data_arr_np.dtype, absolute=False
             )
 
+    def merge_histogram(self, old_histogram, data_arr, new_min, new_max, new_threshold):
+        statistics = [new_min, new_max]
+        bins, hist_range = self._get_bins(old_histogram, statistics, data_arr.dtype, absolute=False)
+        hist, hist_edges = np.histogram(data_arr, bins, range=hist_range)
+        return self._merge_histogram(old_histogram, hist, hist_edges, hist_range, statistics, data_arr.dtype, False)
+
     def compute_collection_result(self):
         if not self.histogram_dict or len(self.histogram_dict) == 0:
             raise ValueError("Histogram has not been collected. Please run collect() first.")
@@ -951,6 +1325,69 @@ class HistogramCollector(CalibrationDataCollector):
         else:
             raise ValueError("Only 'entropy', 'percentile' or 'distribution' methods are supported")
 
+    def compute_per_tensor(self, compute):
+        """
+        Calls compute(histogram) for every tensor and returns a dictionary of the results.
+        If num_workers > 1, the histograms are copied into shared memory and the results are
+        computed by a pool of processes.
+        """
+        histogram_dict = self.histogram_dict
+        num_workers = min(self.num_workers or 1, len(histogram_dict))
+        if num_workers <= 1:
+            return {tensor: compute(histogram) for tensor, histogram in histogram_dict.items()}
+
+        # The histograms are shared with a collector which does not hold any histogram.
+        worker = HistogramCollector(
+            self.method, self.symmetric, self.num_bins, self.num_quantized_bins, self.percentile, self.scenario
+        )
+        arrays = [array for histogram in histogram_dict.values() for array in histogram[:2]]
+        shm, layouts = _copy_to_shared_memory(arrays)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=num_workers, initializer=_attach_shared_memory, initargs=(shm.name,)
+            ) as executor:
+                results = executor.map(
+                    _compute_on_shared_histogram,
+                    itertools.repeat(getattr(worker, compute.__name__)),
+                    layouts[0::2],
+                    layouts[1::2],
+                    [histogram[2:] for histogram in histogram_dict.values()],
+                    chunksize=max(1, len(histogram_dict) // (4 * num_workers)),
+                )
+                return dict(zip(histogram_dict, results, strict=True))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def get_percentile_threshold(self, histogram):
+        hist = histogram[0]
+        hist_edges = histogram[1]
+        percentile = self.percentile
+        total = hist.sum()
+        cdf = np.cumsum(hist / total)
+        if self.symmetric:
+            idx_right = np.searchsorted(cdf, percentile / 100.0)
+
+            threshold = (
+                -np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+                np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+            )
+        else:
+            percent_to_cut_one_side = (100.0 - percentile) / 200.0
+            idx_right = np.searchsorted(cdf, 1.0 - percent_to_cut_one_side)
+            idx_left = np.searchsorted(cdf, percent_to_cut_one_side)
+            threshold = (
+                np.array(hist_edges[idx_left], dtype=hist_edges.dtype),
+                np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+            )
+        min_value = histogram[2]
+        max_value = histogram[3]
+        if threshold[0] < min_value:
+            threshold = (min_value, threshold[1])
+        if threshold[1] > max_value:
+            threshold = (threshold[0], max_value)
+        return threshold
+
     def compute_percentile(self):
         if self.percentile < 0 or self.percentile > 100:
             raise ValueError("Invalid percentile. Must be in range 0 <= percentile <= 100.")
@@ -958,38 +1395,14 @@ class HistogramCollector(CalibrationDataCollector):
         histogram_dict = self.histogram_dict
         percentile = self.percentile
 
-        thresholds_dict = {}  # per tensor thresholds
-
         print(f"Number of tensors : {len(histogram_dict)}")
         print(f"Number of histogram bins : {self.num_bins}")
         print(f"Percentile : ({100.0 - percentile},{percentile})")
 
+        thresholds_dict = self.compute_per_tensor(self.get_percentile_threshold)  # per tensor thresholds
         for tensor, histogram in histogram_dict.items():
             hist = histogram[0]
             hist_edges = histogram[1]
-            total = hist.sum()
-            cdf = np.cumsum(hist / total)
-            if self.symmetric:
-                idx_right = np.searchsorted(cdf, percentile / 100.0)
-
-                thresholds_dict[tensor] = (
-                    -np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                    np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                )
-            else:
-                percent_to_cut_one_side = (100.0 - percentile) / 200.0
-                idx_right = np.searchsorted(cdf, 1.0 - percent_to_cut_one_side)
-                idx_left = np.searchsorted(cdf, percent_to_cut_one_side)
-                thresholds_dict[tensor] = (
-                    np.array(hist_edges[idx_left], dtype=hist_edges.dtype),
-                    np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                )
-            min_value = histogram[2]
-            max_value = histogram[3]
-            if thresholds_dict[tensor][0] < min_value:
-                thresholds_dict[tensor] = (min_value, thresholds_dict[tensor][1])
-            if thresholds_dict[tensor][1] > max_value:
-                thresholds_dict[tensor] = (thresholds_dict[tensor][0], max_value)
             thresholds_dict[tensor] = (*thresholds_dict[tensor], *hist[:2])
             # Plot histogram for debug only
             if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
@@ -999,18 +1412,14 @@ class HistogramCollector(CalibrationDataCollector):
 
     def compute_entropy(self):
         histogram_dict = self.histogram_dict
-        num_quantized_bins = self.num_quantized_bins
-
-        thresholds_dict = {}  # per tensor thresholds
 
         print(f"Number of tensors : {len(histogram_dict)}")
         print(f"Number of histogram bins : {self.num_bins} (The number may increase depends on the data it collects)")
         print(f"Number of quantized bins : {self.num_quantized_bins}")
 
+        thresholds_dict = self.compute_per_tensor(self.get_entropy_threshold)  # per tensor thresholds
         for tensor, histogram in histogram_dict.items():
-            optimal_threshold = self.get_entropy_threshold(histogram, num_quantized_bins)
-            thresholds_dict[tensor] = optimal_threshold
-            thresholds_dict[tensor] = (*optimal_threshold, *histogram[:2])
+            thresholds_dict[tensor] = (*thresholds_dict[tensor], *histogram[:2])
 
             # Plot histogram for debug only
             if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
@@ -1040,30 +1449,39 @@ class HistogramCollector(CalibrationDataCollector):
         std = ((hist * values**2).sum() / hist.sum() - avg**2) ** 0.5
         return np.array(avg, dtype=hist_edges.dtype), np.array(std, dtype=hist_edges.dtype)
 
+    def get_distribution_avg_std(self, histogram):
+        hist = histogram[0]
+        hist_edges = histogram[1]
+
+        assert hist_edges.dtype != np.float64
+        if self.scenario == "same":
+            avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1)
+        elif self.scenario == "p3":
+            avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1.0 / 3.0)
+        else:
+            raise ValueError("Invalid scenario. Must be in {'same', 'p3'}.")
+        assert avg_coef.dtype != np.float64
+        assert std_coef.dtype != np.float64
+        return avg_coef, std_coef
+
     def compute_distribution(self):
         if self.num_bins < 512:
             raise ValueError("Invalid num_bins. Must be in range 512 <= num_bins.")
+        if self.scenario not in ("same", "p3"):
+            raise ValueError("Invalid scenario. Must be in {'same', 'p3'}.")
 
         histogram_dict = self.histogram_dict
-        thresholds_dict = {}  # per tensor thresholds
 
         print(f"Number of tensors : {len(histogram_dict)}")
         print(f"Number of histogram bins : {self.num_bins}")
         print(f"Scenario : {self.scenario!r})")
 
+        thresholds_dict = self.compute_per_tensor(self.get_distribution_avg_std)  # per tensor thresholds
         for tensor, histogram in histogram_dict.items():
             hist = histogram[0]
             hist_edges = histogram[1]
+            avg_coef, std_coef = thresholds_dict[tensor]
 
-            assert hist_edges.dtype != np.float64
-            if self.scenario == "same":
-                avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1)
-            elif self.scenario == "p3":
-                avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1.0 / 3.0)
-            else:
-                raise ValueError("Invalid scenario. Must be in {'same', 'p3'}.")
-            assert avg_coef.dtype != np.float64
-            assert std_coef.dtype != np.float64
             assert hist_edges.dtype != np.float64
             thresholds_dict[tensor] = TensorData(
                 avg=avg_coef,
@@ -1080,12 +1498,15 @@ class HistogramCollector(CalibrationDataCollector):
 
         return thresholds_dict
 
-    def get_entropy_threshold(self, histogram, num_quantized_bins):
+    def get_entropy_threshold(self, histogram, num_quantized_bins=None):
         """Given a dataset, find the optimal threshold for quantizing it.
         The reference distribution is `q`, and the candidate distribution is `p`.
         `q` is a truncated version of the original distribution.
         Ref: http://on-demand.gputechconf.com/gtc/2017/presentation/s7310-8-bit-inference-with-tensorrt.pdf
+        The KL divergences of all the candidate thresholds are computed together, see `_compute_kl_divergences`.
         """
+        if num_quantized_bins is None:
+            num_quantized_bins = self.num_quantized_bins
         hist = histogram[0]
         hist_edges = histogram[1]
         num_bins = hist.size
@@ -1094,7 +1515,6 @@ class HistogramCollector(CalibrationDataCollector):
 
         dtype = histogram[1].dtype
         kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
-        thresholds = [(np.array(0, dtype=dtype), np.array(0, dtype=dtype)) for i in range(kl_divergence.size)]
 
         # <------------ num bins ---------------->
         #        <--- quantized bins ---->
@@ -1110,56 +1530,24 @@ class HistogramCollector(CalibrationDataCollector):
         # |                                      |
         # start index                    end index       (end of iteration)
 
-        for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
-            start_index = zero_bin_index - i
-            end_index = min(zero_bin_index + i + 1, num_bins)
-
-            thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
-
-            sliced_distribution = copy.deepcopy(hist[start_index:end_index])
-
-            # reference distribution p
-            p = sliced_distribution.copy()  # a copy of np array
-            left_outliers_count = sum(hist[:start_index])
-            right_outliers_count = sum(hist[end_index:])
-            p[0] += left_outliers_count
-            p[-1] += right_outliers_count
-
-            # nonzeros[i] incidates whether p[i] is non-zero
-            nonzeros = (p != 0).astype(np.int64)
-
-            # quantize p.size bins into quantized bins (default 128 bins)
-            quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
-            num_merged_bins = sliced_distribution.size // num_quantized_bins
-
-            # merge bins into quantized bins
-            for index in range(num_quantized_bins):
-                start = index * num_merged_bins
-                end = start + num_merged_bins
-                quantized_bins[index] = sum(sliced_distribution[start:end])
-            quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
-
-            # in order to compare p and q, we need to make length of q equals to length of p
-            # expand quantized bins into p.size bins
-            q = np.zeros(p.size, dtype=np.int64)
-            for index in range(num_quantized_bins):
-                start = index * num_merged_bins
-                end = start + num_merged_bins
-
-                norm = sum(nonzeros[start:end])
-                if norm != 0:
-                    q[start:end] = quantized_bins[index] / norm
-
-            p = smooth_distribution(p)
-            q = smooth_distribution(q)
-            if p is None or q is None:
-                div = np.array(np.inf, dtype=dtype)
-            else:
-                div = np.array(entropy(p, q), dtype=dtype)
-            kl_divergence[i - num_half_quantized_bin] = div
+        half_widths = np.arange(num_half_quantized_bin, zero_bin_index + 1, dtype=np.int64)
+        start_indices = zero_bin_index - half_widths
+        end_indices = np.minimum(zero_bin_index + half_widths + 1, num_bins)
+
+        # Candidates are evaluated by chunks to bound the size of the (candidates x bins) matrices.
+        chunk_size = max(1, (1 << 20) // num_bins)
+        for chunk_start in range(0, kl_divergence.size, chunk_size):
+            chunk = slice(chunk_start, chunk_start + chunk_size)
+            divergences = self._compute_kl_divergences(
+                hist, start_indices[chunk], end_indices[chunk], num_quantized_bins
+            )
+            kl_divergence[chunk] = divergences.astype(dtype)
 
         min_kl_divergence_idx = np.argmin(kl_divergence)
-        optimal_threshold = thresholds[min_kl_divergence_idx]
+        optimal_threshold = (
+            hist_edges[start_indices[min_kl_divergence_idx]],
+            hist_edges[end_indices[min_kl_divergence_idx]],
+        )
         min_value = histogram[2]
         max_value = histogram[3]
         if optimal_threshold[0] < min_value:
@@ -1170,6 +1558,269 @@ class HistogramCollector(CalibrationDataCollector):
         assert hasattr(optimal_threshold[1], "dtype")
         return optimal_threshold
 
+    @staticmethod
+    def _compute_kl_divergences(hist, start_indices, end_indices, num_quantized_bins, eps=0.0001):
+        """
+        Computes the KL divergence between the reference distribution `p` and its quantized version `q`
+        for every candidate slice hist[start_indices[i]:end_indices[i]] at once.
+        Bin sums are taken from cumulative sums of the histogram and the smoothed distributions are computed
+        on (candidates x bins) matrices. It follows the same steps, with the same rounding, as quantizing,
+        expanding and smoothing the distributions one candidate at a time with :func:`smooth_distribution`.
+        The divergence of every candidate is then computed with :func:`entropy`.
+        """
+        rows = np.arange(start_indices.size)
+        lengths = end_indices - start_indices
+        columns = np.arange(int(lengths.max()))
+        valid = columns < lengths[:, None]
+        hist_cumsum = np.concatenate(([0], np.cumsum(hist, dtype=np.int64)))
+        nonzeros_cumsum = np.concatenate(([0], np.cumsum(hist != 0, dtype=np.int64)))
+
+        # reference distribution p: the outliers are added to the first and the last bins
+        first = hist[start_indices] + hist_cumsum[start_indices]
+        last = np.where(lengths > 1, hist[end_indices - 1], first) + hist_cumsum[-1] - hist_cumsum[end_indices]
+        padded_hist = np.zeros(hist.size + columns.size, dtype=np.float32)
+        padded_hist[: hist.size] = hist
+        p = np.lib.stride_tricks.sliding_window_view(padded_hist, columns.size)[start_indices]
+        p[~valid] = 0
+        p[rows, 0] = first
+        p[rows, lengths - 1] = last
+        # number of nonzero bins in p[:k] for a given offset k < lengths
+        first_correction = np.where(lengths > 1, (first != 0).astype(np.int64) - (hist[start_indices] != 0), 0)
+        last_correction = (last != 0).astype(np.int64) - (hist[end_indices - 1] != 0)
+
+        def count_nonzeros(offsets):
+            counts = nonzeros_cumsum[start_indices[:, None] + offsets] - nonzeros_cumsum[start_indices, None]
+            counts += np.where(offsets > 0, first_correction[:, None], 0)
+            counts += np.where(offsets >= lengths[:, None], last_correction[:, None], 0)
+            return counts
+
+        # quantize p.size bins into quantized bins, the remaining bins are merged into the last one
+        num_merged_bins = lengths // num_quantized_bins
+        bounds = num_merged_bins[:, None] * np.arange(num_quantized_bins + 1)
+        quantized_bins = np.diff(hist_cumsum[start_indices[:, None] + bounds], axis=1)
+        quantized_bins[:, -1] = hist_cumsum[end_indices] - hist_cumsum[start_indices + bounds[:, -2]]
+        norms = np.diff(count_nonzeros(bounds), axis=1)
+
+        # expand quantized bins into p.size bins, the remaining bins are left to 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expanded_bins = np.where(norms != 0, quantized_bins / norms, 0).astype(np.int64)
+
+        def smooth_eps(n_zeros):
+            n_nonzeros = lengths - n_zeros
+            with np.errstate(divide="ignore"):
+                eps1 = (eps * n_zeros / n_nonzeros).astype(np.float32)
+            assert (eps1[n_nonzeros != 0] < 1.0).all(), f"eps1={eps1} must be lower than 1"
+            return eps1, n_nonzeros != 0
+
+        p_eps1, p_is_valid = smooth_eps(lengths - count_nonzeros(lengths[:, None])[:, 0])
+        q_n_zeros = lengths - bounds[:, -1] + num_merged_bins * (expanded_bins == 0).sum(axis=1)
+        q_eps1, q_is_valid = smooth_eps(q_n_zeros)
+
+        # smoothed distributions, q is constant within every merged bins and equal to eps after them
+        p_smoothed = p
+        p_smoothed += np.where(p == 0, np.float32(eps), -p_eps1[:, None])
+        p_smoothed[~valid] = 0
+        q_values = expanded_bins.astype(np.float32)
+        q_values += np.where(expanded_bins == 0, np.float32(eps), -q_eps1[:, None])
+        q_smoothed = np.where(valid, np.float32(eps), np.float32(0))
+        for merged_bins in np.unique(num_merged_bins):
+            same_merged_bins = num_merged_bins == merged_bins
+            q_smoothed[same_merged_bins, : num_quantized_bins * merged_bins] = np.repeat(
+                q_values[same_merged_bins], merged_bins, axis=1
+            )
+
+        # The sums are taken on every candidate separately: float32 sums of the padded rows are not rounded the
+        # same way, and close divergences would then select another threshold.
+        divergences = np.full(start_indices.size, np.inf, dtype=np.float32)
+        for row in np.flatnonzero(p_is_valid & q_is_valid):
+            length = lengths[row]
+            divergences[row] = entropy(p_smoothed[row, :length], q_smoothed[row, :length])
+        return divergences
+
+
+# Shared memory attached by the processes computing the histogram results, see HistogramCollector.compute_per_tensor.
+_shared_memory = None
+
+
+def _copy_to_shared_memory(arrays):
+    """
+    Copies arrays into a new block of shared memory.
+    Returns the shared memory and the (offset, dtype, shape) of every array.
+    """
+    layouts = []
+    size = 0
+    for array in arrays:
+        layouts.append((size, array.dtype.str, array.shape))
+        size += (array.nbytes + 7) // 8 * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for array, (offset, dtype, shape) in zip(arrays, layouts, strict=True):
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+    return shm, layouts
+
+
+def _attach_shared_memory(name):
+    global _shared_memory  # noqa: PLW0603
+    _shared_memory = shared_memory.SharedMemory(name=name)
+
+
+def _compute_on_shared_histogram(compute, hist_layout, hist_edges_layout, others):
+    hist, hist_edges = (
+        np.ndarray(shape, dtype=dtype, buffer=_shared_memory.buf, offset=offset)
+        for offset, dtype, shape in (hist_layout, hist_edges_layout)
+    )
+    return compute((hist, hist_edges, *others))
+
+
+def compute_data_fingerprint(data) -> str:
+    """
+    Computes a fingerprint of calibration data from the names, types, shapes and values of the inputs.
+    :param data: iterable of input dictionaries, as returned by CalibrationDataReader.get_next.
+    :return: hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    for inputs in data:
+        for name in sorted(inputs):
+            value = np.ascontiguousarray(inputs[name])
+            digest.update(f"{name}:{value.dtype.str}:{value.shape}".encode())
+            digest.update(value.view(np.uint8).reshape(-1))
+    return digest.hexdigest()
+
+
+def compute_model_hash(model: ModelProto) -> str:
+    """
+    Computes a hash of the graph of a model and its initializers.
+    Every initializer is serialized separately, so models larger than 2GB are supported
+    as long as their external data is loaded.
+    """
+    digest = hashlib.sha256()
+    for opset in model.opset_import:
+        digest.update(opset.SerializeToString())
+    for function in model.functions:
+        digest.update(function.SerializeToString())
+    graph = model.graph
+    for proto in itertools.chain(graph.input, graph.output, graph.node, graph.initializer, graph.sparse_initializer):
+        digest.update(proto.SerializeToString())
+    return digest.hexdigest()
+
+
+class CalibrationCache:
+    """
+    On-disk cache of calibration results.
+
+    The ranges are stored in a numpy archive named after a key computed from the model, the tensors to calibrate,
+    the calibration method and its options, and a fingerprint of the calibration data. For the histogram-based
+    methods, the histograms are stored as well, under a key which ignores the options only used to compute the
+    ranges from the histograms (num_quantized_bins, percentile, scenario). Changing these options reuses the
+    cached histograms instead of running the calibration data again.
+    """
+
+    # Options changing how fast the calibration runs but not its results.
+    performance_options = frozenset(["num_workers", "running_reduction", "use_io_binding", "num_inference_sessions"])
+    # Options changing how fast the histograms are collected but not the histograms. MinMaxCalibrater still drops
+    # the collected outputs every max_intermediate_outputs batches, so it changes the ranges of MinMax.
+    histogram_performance_options = frozenset(["max_intermediate_outputs"])
+    # Options of the histogram-based methods only used to compute the ranges from the histograms.
+    histogram_compute_options = frozenset(["num_quantized_bins", "percentile", "scenario"])
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        model: ModelProto,
+        op_types_to_calibrate: Sequence[str] | None,
+        calibrate_method: CalibrationMethod,
+        extra_options: dict,
+        data_fingerprint: str,
+    ):
+        """
+        :param cache_dir: directory storing the cached results. It is created if it does not exist.
+        :param model: model to calibrate.
+        :param op_types_to_calibrate: operator types to calibrate, see :func:`create_calibrator`.
+        :param calibrate_method: calibration method.
+        :param extra_options: options given to :func:`create_calibrator`.
+        :param data_fingerprint: string identifying the calibration data, see :func:`compute_data_fingerprint`.
+        """
+        self.cache_dir = Path(cache_dir)
+        key = {
+            "model": compute_model_hash(model),
+            "op_types_to_calibrate": sorted(op_types_to_calibrate or []),
+            "calibrate_method": calibrate_method.name,
+            "data": data_fingerprint,
+        }
+        ignored_options = self.performance_options
+        if calibrate_method != CalibrationMethod.MinMax:
+            ignored_options = ignored_options | self.histogram_performance_options
+        options = {k: v for k, v in extra_options.items() if k not in ignored_options}
+        collect_options = {k: v for k, v in options.items() if k not in self.histogram_compute_options}
+        self.histograms_path = self.cache_dir / f"histograms_{self._hash({**key, 'options': collect_options})}.npz"
+        self.tensors_range_path = self.cache_dir / f"ranges_{self._hash({**key, 'options': options})}.npz"
+
+    @staticmethod
+    def _hash(key: dict) -> str:
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def _save(path: Path, names, values, **metadata):
+        """
+        Saves named tuples or dictionaries of arrays without pickling them.
+        """
+        arrays = {}
+        structure = []
+        for i, value in enumerate(values):
+            keys = list(value.keys()) if isinstance(value, dict) else list(range(len(value)))
+            structure.append({"dict": isinstance(value, dict), "keys": keys})
+            for key in keys:
+                arrays[f"{i}_{key}"] = np.asarray(value[key])
+        metadata = json.dumps({**metadata, "names": list(names), "structure": structure})
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that an interrupted run does not leave a truncated archive.
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, metadata=np.array(metadata), **arrays)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _load(path: Path):
+        with np.load(path, allow_pickle=False) as archive:
+            metadata = json.loads(str(archive["metadata"]))
+            values = []
+            for i, structure in enumerate(metadata["structure"]):
+                # 0-d arrays are restored as numpy scalars.
+                items = [(key, archive[f"{i}_{key}"]) for key in structure["keys"]]
+                items = [(key, value[()] if value.ndim == 0 else value) for key, value in items]
+                values.append(dict(items) if structure["dict"] else tuple(value for _, value in items))
+        return metadata, dict(zip(metadata["names"], values, strict=True))
+
+    def load_tensors_range(self) -> TensorsData | None:
+        """
+        :return: the cached ranges or None if they were not cached.
+        """
+        if not self.tensors_range_path.exists():
+            return None
+        metadata, values = self._load(self.tensors_range_path)
+        return TensorsData(
+            CalibrationMethod[metadata["calibration_method"]],
+            {name: TensorData(**value) for name, value in values.items()},
+        )
+
+    def save_tensors_range(self, tensors_range: TensorsData):
+        self._save(
+            self.tensors_range_path,
+            tensors_range.keys(),
+            [{k: getattr(v, k) for k in v._attrs} for v in tensors_range.values()],
+            calibration_method=tensors_range.calibration_method.name,
+        )
+
+    def load_histograms(self) -> dict | None:
+        """
+        :return: the cached histograms (see HistogramCollector.get_histogram_dict) or None if they were not cached.
+        """
+        if not self.histograms_path.exists():
+            return None
+        _, histogram_dict = self._load(self.histograms_path)
+        return histogram_dict
+
+    def save_histograms(self, histogram_dict: dict):
+        self._save(self.histograms_path, histogram_dict.keys(), histogram_dict.values())
+
 
 def create_calibrator(
     model: str | Path,
@@ -1188,6 +1839,8 @@ def create_calibrator(
         averaging_constant = extra_options.get("averaging_constant", 0.01)
         max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
         per_channel = extra_options.get("per_channel", False)
+        running_reduction = extra_options.get("running_reduction", False)
+        use_io_binding = extra_options.get("use_io_binding", False)
         calibrator = MinMaxCalibrater(
             model,
             op_types_to_calibrate,
@@ -1198,12 +1851,16 @@ def create_calibrator(
             averaging_constant=averaging_constant,
             max_intermediate_outputs=max_intermediate_outputs,
             per_channel=per_channel,
+            running_reduction=running_reduction,
+            use_io_binding=use_io_binding,
         )
     elif calibrate_method == CalibrationMethod.Entropy:
         # default settings for entropy algorithm
         num_bins = extra_options.get("num_bins", 128)
         num_quantized_bins = extra_options.get("num_quantized_bins", 128)
         symmetric = extra_options.get("symmetric", False)
+        max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
+        num_workers = extra_options.get("num_workers", None)
         calibrator = EntropyCalibrater(
             model,
             op_types_to_calibrate,
@@ -1212,12 +1869,16 @@ def create_calibrator(
             symmetric=symmetric,
             num_bins=num_bins,
             num_quantized_bins=num_quantized_bins,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
     elif calibrate_method == CalibrationMethod.Percentile:
         # default settings for percentile algorithm
         num_bins = extra_options.get("num_bins", 2048)
         percentile = extra_options.get("percentile", 99.999)
         symmetric = extra_options.get("symmetric", True)
+        max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
+        num_workers = extra_options.get("num_workers", None)
         calibrator = PercentileCalibrater(
             model,
             op_types_to_calibrate,
@@ -1226,12 +1887,16 @@ def create_calibrator(
             symmetric=symmetric,
             num_bins=num_bins,
             percentile=percentile,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
     elif calibrate_method == CalibrationMethod.Distribution:
         # default settings for percentile algorithm
         num_bins = extra_options.get("num_bins", 2048)
         scenario = extra_options.get("scenario", "same")
+        max_intermediate_outputs = extra_options.get("max_intermediate_outputs", None)
+        num_workers = extra_options.get("num_workers", None)
 
         calibrator = DistributionCalibrater(
             model,
@@ -1240,12 +1905,15 @@ def create_calibrator(
             use_external_data_format=use_external_data_format,
             num_bins=num_bins,
             scenario=scenario,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
         )
 
     if calibrator:
         calibrator.augment_graph()
         if providers:
             calibrator.execution_providers = providers
+        calibrator.num_inference_sessions = extra_options.get("num_inference_sessions", 1)
         calibrator.create_inference_session()
         return calibrator
 
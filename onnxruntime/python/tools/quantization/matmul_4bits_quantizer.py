@@ -9,8 +9,11 @@ from __future__ import annotations
 import argparse
 import copy
 import importlib
+import itertools
 import logging
 import os
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import numpy as np
 import numpy.typing as npt
@@ -22,7 +25,7 @@ from onnxruntime.capi._pybind_state import quantize_matmul_4bits, quantize_qdq_m
 
 from .calibrate import CalibrationDataReader
 from .onnx_model import ONNXModel
-from .quant_utils import QuantFormat, attribute_to_kwarg
+from .quant_utils import ExternalDataReader, QuantFormat, attribute_to_kwarg
 
 logging.basicConfig(format="%(asctime)s %(name)s [%(levelname)s] - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -475,6 +478,10 @@ def is_divisible(val1, val2):
     return int(val2 * np.ceil(val1 / val2)) == val1
 
 
+# Default parameters of HQQWeightOnlyQuantizer.optimize_weights. Missing keys of opt_params are taken from here.
+HQQ_DEFAULT_OPT_PARAMS = {"lp_norm": 0.7, "beta": 1e1, "kappa": 1.01, "iters": 20, "patience": 3}
+
+
 class HQQWeightOnlyQuantizer:
     def __init__(
         self,
@@ -493,20 +500,30 @@ class HQQWeightOnlyQuantizer:
         opt_params: dict | None = None,
         verbose=False,
     ):
+        """
+        Optimizes the zero points of all the blocks of tensor at once. The blocks are along the given axis.
+        A block stops once its error has not decreased for `patience` iterations and keeps the zero point
+        with the lowest error, the remaining iterations only run on the blocks which are still improving.
+        Parameters not given in opt_params are from HQQ_DEFAULT_OPT_PARAMS.
+        """
         import torch
 
-        opt_params = {"lp_norm": 0.7, "beta": 1e1, "kappa": 1.01, "iters": 20} if opt_params is None else opt_params
-        lp_norm, beta, kappa, iters = (
+        opt_params = {**HQQ_DEFAULT_OPT_PARAMS, **(opt_params or {})}
+        lp_norm, beta, kappa, iters, patience = (
             opt_params["lp_norm"],
             opt_params["beta"],
             opt_params["kappa"],
             opt_params["iters"],
+            opt_params["patience"],
         )
 
         dtype = torch.float16 if tensor.is_cuda else torch.float32
         w_f = tensor.to(dtype)
         scale = scale.to(dtype)
         zero = zero.to(dtype)
+        if axis == 0:
+            # One block per row.
+            w_f, scale, zero = w_f.T.contiguous(), scale.T, zero.T
 
         def shrink_op(x, beta, p=lp_norm):
             if p == 1:
@@ -516,37 +533,59 @@ class HQQWeightOnlyQuantizer:
                     torch.abs(x) - (1.0 / beta) * torch.pow(torch.abs(x) + 1e-8, p - 1)
                 )
 
-        best_error = 1e4
+        best_zero = zero.clone()
+        best_error = torch.full((w_f.shape[0],), torch.inf, dtype=torch.float32, device=w_f.device)
+        # Indices of the blocks still being optimized, their weights, scales, zero points and the number of
+        # iterations since their last improvement.
+        active = torch.arange(w_f.shape[0], device=w_f.device)
+        w_a, scale_a, zero_a = w_f, scale, zero
+        misses = torch.zeros_like(active)
         for i in range(iters):
-            w_q = torch.round(w_f * scale + zero).clamp(min_max[0], min_max[1])
-            w_r = (w_q - zero) / scale
-            w_e = shrink_op(w_f - w_r, beta)
-            zero = torch.mean(w_q - (w_f - w_e) * scale, axis=axis, keepdim=True)
-            beta *= kappa
-
-            current_error = float(torch.abs(w_f - w_r).mean())
+            w_q = torch.round(w_a * scale_a + zero_a).clamp(min_max[0], min_max[1])
+            w_r = (w_q - zero_a) / scale_a
+            current_error = torch.abs(w_a - w_r).mean(axis=1, dtype=torch.float32)
+            improved = current_error < best_error[active]
+            best_error[active] = torch.where(improved, current_error, best_error[active])
+            best_zero[active] = torch.where(improved.unsqueeze(1), zero_a, best_zero[active])
+            misses = torch.where(improved, 0, misses + 1)
             if verbose:
-                print(i, np.round(current_error, 6))
-            if current_error < best_error:
-                best_error = current_error
-            else:
-                break
+                print(i, np.round(float(current_error.mean()), 6), int(improved.sum()))
+            if not bool((misses < patience).all()):
+                kept = (misses < patience).nonzero().squeeze(1)
+                if kept.numel() == 0:
+                    break
+                active, w_a, scale_a, zero_a = active[kept], w_a[kept], scale_a[kept], zero_a[kept]
+                w_q, w_r, misses = w_q[kept], w_r[kept], misses[kept]
+            w_e = shrink_op(w_a - w_r, beta)
+            zero_a = torch.mean(w_q - (w_a - w_e) * scale_a, axis=1, keepdim=True)
+            beta *= kappa
 
-        del w_f, w_q, w_r, w_e
+        del w_f, w_a, w_q, w_r
 
-        return scale, zero
+        if axis == 0:
+            return scale.T, best_zero.T
+        return scale, best_zero
 
     @staticmethod
     def pack_on_row_fast_248bit(pack_tensor, ori_int_tensor, bits):
+        """
+        Packs the values of ori_int_tensor into pack_tensor, the first value in the lowest bits. The values
+        are packed along the rows if both tensors have the same number of rows, along the columns otherwise.
+        """
+        import torch
+
+        if bits not in [2, 4, 8]:
+            raise NotImplementedError("Only 2,4,8 bits are supported.")
+        compress_ratio = pack_tensor.element_size() * 8 // bits
+        shifts = torch.arange(0, bits * compress_ratio, bits, dtype=pack_tensor.dtype, device=pack_tensor.device)
+        values = ori_int_tensor.to(pack_tensor.dtype)
         if pack_tensor.shape[0] == ori_int_tensor.shape[0]:
-            ori_int_tensor = ori_int_tensor.T
-            pack_tensor = pack_tensor.T
-        if bits in [2, 4, 8]:
-            compress_ratio = pack_tensor.element_size() * 8 // bits
-            for j in range(compress_ratio):
-                pack_tensor[0:] |= ori_int_tensor[j::compress_ratio] << (bits * (j))
+            values = values.reshape(pack_tensor.shape[0], -1, compress_ratio) << shifts
+            packed = values.sum(dim=2, dtype=torch.int32)
         else:
-            raise NotImplementedError("Only 2,4,8 bits are supported.")
+            values = values.reshape(-1, compress_ratio, pack_tensor.shape[1]) << shifts.unsqueeze(1)
+            packed = values.sum(dim=1, dtype=torch.int32)
+        pack_tensor |= packed.to(pack_tensor.dtype)
 
     # from Official implementation of Half-Quadratic Quantization (HQQ)
     def quantize_internal(
@@ -643,6 +682,8 @@ class HQQWeightOnlyQuantizer:
         if len(b_array.shape) != 2:
             logger.info("MatMul weight is not 2D. Skip to quantize")
             return [node]  # can only process 2-D matrix
+        # The weight is converted between numpy and torch only once before and after quantization, and both
+        # conversions share memory on CPU. All the iterations of optimize_weights run on torch tensors.
         b_array_torch = torch.from_numpy(b_array)
         if torch.cuda.is_available():
             b_array_torch = b_array_torch.cuda()
@@ -1085,6 +1126,20 @@ class MatMul4BitsQuantizer:
     Note:
       - for quantized gather, the memory usage of "DequantizeLinear + Gather" is the same as the original Gather
         during runtime. Therefor it is not recommended.
+    Large models (HQQ and DEFAULT algorithms):
+      - if num_workers > 1, the weights of the target nodes are quantized concurrently by a pool of threads.
+        Each node is quantized on a copy of its own initializers and the results are merged in the order of
+        the nodes, so the quantized model is the same as with a single worker.
+      - a float weight is removed from the model as soon as all the nodes using it are quantized.
+      - if external_data_path is set, the quantized weights are written to this file as soon as they are
+        computed instead of being kept in memory until the model is saved. The file must not exist and must be
+        the external data file of the output model, i.e. `<output_model>.data` in the directory of the output
+        model when it is saved with `save_model_to_file(output_model, True)`.
+      - if load_external_data is False, model must be the path of a model with external data. The model is loaded
+        without its external data, which is memory-mapped and read one quantized node at a time. The external
+        tensors which are not quantized are copied to external_data_path by chunks, or loaded in memory if
+        external_data_path is not set. With external_data_path, the peak memory usage is about the size of the
+        largest weights quantized concurrently.
     """
 
     def __init__(
@@ -1099,10 +1154,26 @@ class MatMul4BitsQuantizer:
         op_types_to_quantize: tuple[str, ...] | None = None,
         quant_axes: tuple[tuple[str, int], ...] | None = None,
         algo_config: WeightOnlyQuantConfig | None = None,
+        num_workers: int | None = None,
+        external_data_path: str | None = None,
+        load_external_data: bool = True,
     ):
         if nodes_to_exclude is None:
             nodes_to_exclude = []
-        self.model = ONNXModel(onnx.load(model)) if isinstance(model, str) else ONNXModel(model)
+        algorithm = "DEFAULT" if algo_config is None else algo_config.algorithm
+        if (not load_external_data or external_data_path is not None) and algorithm not in ["HQQ", "DEFAULT"]:
+            # Other algorithms load the whole model again from its path.
+            raise ValueError(
+                f"load_external_data=False and external_data_path are not supported by the {algorithm} algorithm, "
+                "only by HQQ and DEFAULT."
+            )
+        if not load_external_data and not isinstance(model, str):
+            raise ValueError("load_external_data=False requires the path of the model.")
+        self.model = (
+            ONNXModel(onnx.load(model, load_external_data=load_external_data))
+            if isinstance(model, str)
+            else ONNXModel(model)
+        )
         self.model_path = model if isinstance(model, str) else None
         self.block_size = block_size
         self.is_symmetric = is_symmetric
@@ -1110,6 +1181,12 @@ class MatMul4BitsQuantizer:
         self.nodes_to_exclude = set(nodes_to_exclude)
         self.nodes_to_include = set(nodes_to_include) if nodes_to_include else None
         self.node_quantizer = None
+        self.num_workers = num_workers
+        self.external_data_path = external_data_path
+        self.load_external_data = load_external_data
+        self._executor = None
+        self._external_data_reader = None
+        self._initializer_uses = Counter()
 
         if algo_config is None:
             algo_config = DefaultWeightOnlyQuantConfig(
@@ -1131,6 +1208,8 @@ class MatMul4BitsQuantizer:
     def _process_subgraph(self, graph_stack: list[GraphProto]):
         new_nodes = []
         graph = graph_stack[-1]
+        # Quantizations running in the thread pool, merged in the order of the nodes.
+        pending = deque()
 
         for node in graph.node:
             graph_attrs = [
@@ -1139,6 +1218,8 @@ class MatMul4BitsQuantizer:
                 if attr.type == onnx.AttributeProto.GRAPH or attr.type == onnx.AttributeProto.GRAPHS
             ]
             if len(graph_attrs):
+                # Merge the pending quantizations first so the initializers are added in the same order.
+                self._merge_pending(pending, new_nodes, graph_stack, 0)
                 kwargs = {}
                 for attr in node.attribute:
                     if attr.type == onnx.AttributeProto.GRAPH:
@@ -1165,17 +1246,153 @@ class MatMul4BitsQuantizer:
             elif (self.nodes_to_include and node.name in self.nodes_to_include) or (
                 node.op_type in self.algo_config.op_types_to_quantize
             ):
+                if self._executor is not None or self._external_data_reader is not None:
+                    pending.append((len(new_nodes), node, *self._submit_node(node, graph_stack)))
+                    new_nodes.append(None)
+                    self._merge_pending(pending, new_nodes, graph_stack, 2 * self.num_workers if self._executor else 0)
+                    continue
+                initializer_counts = [len(g.initializer) for g in graph_stack]
                 out_nodes = self.node_quantizer.quantize(node, graph_stack)
+                self._write_external_data(
+                    itertools.chain.from_iterable(
+                        g.initializer[n:] for g, n in zip(graph_stack, initializer_counts, strict=True)
+                    )
+                )
+                self._release_weights(node, out_nodes, graph_stack)
             else:
                 logger.info(f"skip to quantize {node.name} ...")
                 out_nodes = [node]
-            new_nodes.extend(out_nodes)
+            new_nodes.append(out_nodes)
 
+        self._merge_pending(pending, new_nodes, graph_stack, 0)
         graph.ClearField("node")
-        graph.node.extend(new_nodes)
+        graph.node.extend(itertools.chain.from_iterable(new_nodes))
         graph_stack.pop()
         return graph
 
+    def _submit_node(self, node: NodeProto, graph_stack: list[GraphProto]):
+        """
+        Submits the quantization of a node to the thread pool, or runs it if there is none. The node quantizer
+        runs on private graphs holding a copy of the initializers (and matching graph inputs) of the node at the
+        same depth as in graph_stack, so the threads never access the model. The external data of the copies is
+        loaded if the model was loaded without it.
+        """
+        private_stack = [GraphProto() for _ in graph_stack]
+        for name in dict.fromkeys(node.input):
+            for level in range(len(graph_stack) - 1, -1, -1):
+                graph = graph_stack[level]
+                tensor = next((t for t in graph.initializer if t.name == name), None)
+                if tensor is not None:
+                    private_tensor = private_stack[level].initializer.add()
+                    private_tensor.CopyFrom(tensor)
+                    if self._external_data_reader is not None:
+                        self._external_data_reader.load(private_tensor)
+                    private_stack[level].input.extend(i for i in graph.input if i.name == name)
+                    break
+        initializer_counts = [len(g.initializer) for g in private_stack]
+        input_names = [{i.name for i in g.input} for g in private_stack]
+        if self._executor is not None:
+            future = self._executor.submit(self.node_quantizer.quantize, node, private_stack)
+        else:
+            future = Future()
+            future.set_result(self.node_quantizer.quantize(node, private_stack))
+        return future, private_stack, initializer_counts, input_names
+
+    def _merge_pending(self, pending: deque, new_nodes: list, graph_stack: list[GraphProto], max_pending: int):
+        """
+        Waits for the oldest pending quantizations until at most max_pending remain and merges the initializers
+        they created and the graph inputs they removed into the model.
+        """
+        while len(pending) > max_pending:
+            index, node, future, private_stack, initializer_counts, input_names = pending.popleft()
+            out_nodes = future.result()
+            for graph, private_graph, count, names in zip(
+                graph_stack, private_stack, initializer_counts, input_names, strict=True
+            ):
+                new_initializers = private_graph.initializer[count:]
+                self._write_external_data(new_initializers)
+                graph.initializer.extend(new_initializers)
+                removed_inputs = names - {i.name for i in private_graph.input}
+                if removed_inputs:
+                    kept_inputs = [i for i in graph.input if i.name not in removed_inputs]
+                    graph.ClearField("input")
+                    graph.input.extend(kept_inputs)
+            self._release_weights(node, out_nodes, graph_stack)
+            new_nodes[index] = out_nodes
+
+    def _release_weights(self, node: NodeProto, out_nodes: list[NodeProto], graph_stack: list[GraphProto]):
+        """
+        Removes the initializers of a quantized node which are not used anymore, to release the float weights
+        before the end of the quantization.
+        """
+        unused = Counter(node.input)
+        unused.subtract(itertools.chain.from_iterable(n.input for n in out_nodes))
+        for name, count in unused.items():
+            if count <= 0 or name not in self._initializer_uses:
+                continue
+            self._initializer_uses[name] -= count
+            if self._initializer_uses[name] > 0:
+                continue
+            for graph in reversed(graph_stack):
+                index = next((i for i, t in enumerate(graph.initializer) if t.name == name), None)
+                if index is not None:
+                    del graph.initializer[index]
+                    break
+
+    def _write_external_data(self, tensors):
+        """
+        Moves the data of the tensors to the external data file if external_data_path is set.
+        """
+        if self.external_data_path is None:
+            return
+        location = os.path.basename(self.external_data_path)
+        base_path = os.path.dirname(os.path.abspath(self.external_data_path))
+        for tensor in tensors:
+            # Same size threshold as onnx.external_data_helper.convert_model_to_external_data.
+            if tensor.HasField("raw_data") and len(tensor.raw_data) >= 1024:
+                onnx.external_data_helper.set_external_data(tensor, location)
+                onnx.external_data_helper.save_external_data(tensor, base_path)
+                tensor.ClearField("raw_data")
+
+    def _iter_tensors(self, graph: GraphProto):
+        """Iterates over the initializers and the tensor attributes of a graph and its sub-graphs."""
+        yield from graph.initializer
+        for node in graph.node:
+            for attr in node.attribute:
+                if attr.type == onnx.AttributeProto.TENSOR:
+                    yield attr.t
+                elif attr.type == onnx.AttributeProto.TENSORS:
+                    yield from attr.tensors
+                elif attr.type == onnx.AttributeProto.GRAPH:
+                    yield from self._iter_tensors(attr.g)
+                elif attr.type == onnx.AttributeProto.GRAPHS:
+                    for subgraph in attr.graphs:
+                        yield from self._iter_tensors(subgraph)
+
+    def _move_external_data(self, names: set[str]):
+        """
+        Moves the external data of the input model which is still used by the tensors with the given names to
+        external_data_path, or into the model if external_data_path is not set.
+        """
+        for tensor in self._iter_tensors(self.model.graph()):
+            if tensor.name not in names or not onnx.external_data_helper.uses_external_data(tensor):
+                continue
+            if self.external_data_path is None:
+                self._external_data_reader.load(tensor)
+            else:
+                self._external_data_reader.copy_to(tensor, self.external_data_path)
+
+    def _count_initializer_uses(self, graph: GraphProto):
+        for node in graph.node:
+            self._initializer_uses.update(node.input)
+            for attr in node.attribute:
+                if attr.type == onnx.AttributeProto.GRAPH:
+                    self._count_initializer_uses(attr.g)
+                elif attr.type == onnx.AttributeProto.GRAPHS:
+                    for subgraph in attr.graphs:
+                        self._count_initializer_uses(subgraph)
+        self._initializer_uses.update(output.name for output in graph.output)
+
     def _generate_q4_node_config(self):
         """Generate weight only quant configuration for nodes."""
         q4_node_config = {}
@@ -1263,8 +1480,35 @@ class MatMul4BitsQuantizer:
                         )
                         self.model.set_opset_import(opset.domain, 21)
 
-            self._process_subgraph(graph_stack)
-            self.model.clean_initializers()
+            if self.external_data_path is not None and os.path.exists(self.external_data_path):
+                raise ValueError(f"External data file {self.external_data_path!r} already exists.")
+            self._initializer_uses.clear()
+            self._count_initializer_uses(self.model.graph())
+            external_tensors = set()
+            if not self.load_external_data:
+                external_tensors = {
+                    tensor.name
+                    for tensor in self._iter_tensors(self.model.graph())
+                    if onnx.external_data_helper.uses_external_data(tensor)
+                }
+                self._external_data_reader = ExternalDataReader(os.path.dirname(os.path.abspath(self.model_path)))
+            try:
+                if self.num_workers is not None and self.num_workers > 1:
+                    with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                        self._executor = executor
+                        try:
+                            self._process_subgraph(graph_stack)
+                        finally:
+                            self._executor = None
+                else:
+                    self._process_subgraph(graph_stack)
+                self.model.clean_initializers()
+                if self._external_data_reader is not None:
+                    self._move_external_data(external_tensors)
+            finally:
+                if self._external_data_reader is not None:
+                    self._external_data_reader.close()
+                    self._external_data_reader = None
         elif self.algo_config.algorithm == "nvidia_awq":
             # Handle nvidia_awq quantization
             logger.info("Processing nvidia_awq quantization...")
@@ -1384,6 +1628,18 @@ set of 4b integers with a scaling factor and an optional offset.
         "Specify the axis to quantize for an op. Default {MatMul:0, Gather:1}"
         "Example: --quant_axes MatMul:0 Gather:1",
     )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=None,
+        help="Number of threads quantizing the weights concurrently for the hqq and default methods.",
+    )
+    parser.add_argument(
+        "--stream_external_data",
+        action="store_true",
+        help="Memory-map the external data of the input model and write the quantized weights to "
+        "<output_model>.data as soon as they are computed to reduce the memory usage (hqq and default methods).",
+    )
     # Group arguments specific to nvidia_awq
     nv_awq_config = parser.add_argument_group("nvidia_awq", "Arguments specific to nvidia_awq quantization")
     nv_awq_config.add_argument(
@@ -1433,7 +1689,7 @@ if __name__ == "__main__":
         logger.warning("symmetric is not supportted by hqq, will force to symmetric=False")
         args.symmetric = False
 
-    model = onnx.load(input_model_path)
+    model = input_model_path if args.stream_external_data else onnx.load(input_model_path)
     if args.quant_method == "hqq":
         quant_config = HQQWeightOnlyQuantConfig(
             block_size=args.block_size, bits=args.bits, op_types_to_quantize=op_types_to_quantize, quant_axes=quant_axes
@@ -1480,6 +1736,9 @@ if __name__ == "__main__":
         nodes_to_exclude=args.nodes_to_exclude,
         nodes_to_include=args.nodes_to_include,
         algo_config=quant_config,
+        num_workers=args.num_workers,
+        external_data_path=output_model_path + ".data" if args.stream_external_data else None,
+        load_external_data=not args.stream_external_data,
     )
     quant.process()
     quant.model.save_model_to_file(output_model_path, True)
@@ -32,12 +32,22 @@ Example Usage:
 `tensor_dict` points to a dictionary where the keys are tensor names and each value
 is a list of tensors, one from each model run
 
+Keeping the activations of every run may not fit in memory on large models or datasets.
+`compute_activation_error_streaming` runs the augmented QDQ and float models side by side
+and only keeps the activations of one batch:
+
+```python
+    errors = compute_activation_error_streaming(
+        augmented_qdq_model_path, input_data_reader, augmented_float_model_path
+    )
+```
+
 """
 
 import logging
 import math
 import time
-from collections.abc import Callable, Sequence
+from collections.abc import Callable, Collection, Sequence
 from pathlib import Path
 
 import numpy
@@ -112,6 +122,22 @@ def modify_model_output_intermediate_tensors(
     )
 
 
+def _create_inference_session(
+    augmented_model: str, session_options=None, execution_providers: Sequence[str] | None = None
+) -> onnxruntime.InferenceSession:
+    if session_options is None:
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+    if execution_providers is None:
+        execution_providers = ["CPUExecutionProvider"]
+
+    return onnxruntime.InferenceSession(
+        augmented_model,
+        sess_options=session_options,
+        providers=execution_providers,
+    )
+
+
 def collect_activations(
     augmented_model: str,
     input_reader: CalibrationDataReader,
@@ -133,17 +159,7 @@ def collect_activations(
         A dictionary where the key is tensor name and values are list of tensors from each batch
     """
 
-    if session_options is None:
-        session_options = onnxruntime.SessionOptions()
-        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
-    if execution_providers is None:
-        execution_providers = ["CPUExecutionProvider"]
-
-    inference_session = onnxruntime.InferenceSession(
-        augmented_model,
-        sess_options=session_options,
-        providers=execution_providers,
-    )
+    inference_session = _create_inference_session(augmented_model, session_options, execution_providers)
 
     intermediate_outputs = []
     for input_d in input_reader:
@@ -165,16 +181,24 @@ def collect_activations(
 _POST_QDQ_POSTFIX1 = DEQUANT_OUTPUT_SUFFIX + "_1"
 
 
-def _add_pre_post_qdq_pair(
-    qdq_cmp: dict[str, dict[str, Sequence[numpy.ndarray]]],
-    activation_name: str,
-    pre_qdq_tensors: Sequence[numpy.ndarray] | None,
-    post_qdq_tensors: Sequence[numpy.ndarray] | None,
-) -> None:
-    if post_qdq_tensors is not None and pre_qdq_tensors is not None:
-        qdq_cmp[activation_name] = {}
-        qdq_cmp[activation_name]["pre_qdq"] = pre_qdq_tensors
-        qdq_cmp[activation_name]["post_qdq"] = post_qdq_tensors
+def _match_pre_post_qdq_tensors(tensor_names: Collection[str]) -> dict[str, tuple[str, str]]:
+    """Maps the activations of a QDQ model to the names of their tensors before and after QDQ."""
+    matches: dict[str, tuple[str, str]] = {}
+    for tensor_name in tensor_names:
+        if tensor_name.endswith(QUANT_INPUT_SUFFIX):
+            activation_name = tensor_name[: -len(QUANT_INPUT_SUFFIX)]
+            pre_qdq_name, post_qdq_name = tensor_name, activation_name
+        elif tensor_name.endswith(DEQUANT_OUTPUT_SUFFIX):
+            activation_name = tensor_name[: -len(DEQUANT_OUTPUT_SUFFIX)]
+            pre_qdq_name, post_qdq_name = activation_name, tensor_name
+        elif tensor_name.endswith(_POST_QDQ_POSTFIX1):
+            activation_name = tensor_name[: -len(_POST_QDQ_POSTFIX1)]
+            pre_qdq_name, post_qdq_name = activation_name, tensor_name
+        else:
+            continue
+        if pre_qdq_name in tensor_names and post_qdq_name in tensor_names:
+            matches[activation_name] = (pre_qdq_name, post_qdq_name)
+    return matches
 
 
 def create_activation_matching(
@@ -211,22 +235,11 @@ def create_activation_matching(
     """
 
     qdq_cmp: dict[str, dict[str, Sequence[numpy.ndarray]]] = {}
-    for tensor_name, tensors in qdq_activations.items():
-        if tensor_name.endswith(QUANT_INPUT_SUFFIX):
-            pre_name = tensor_name[: -len(QUANT_INPUT_SUFFIX)]
-            post_qdq_tensors = qdq_activations.get(pre_name)
-            pre_qdq_tensors = tensors
-            _add_pre_post_qdq_pair(qdq_cmp, pre_name, pre_qdq_tensors, post_qdq_tensors)
-        elif tensor_name.endswith(DEQUANT_OUTPUT_SUFFIX):
-            pre_name = tensor_name[: -len(DEQUANT_OUTPUT_SUFFIX)]
-            pre_qdq_tensors = qdq_activations.get(pre_name)
-            post_qdq_tensors = tensors
-            _add_pre_post_qdq_pair(qdq_cmp, pre_name, pre_qdq_tensors, post_qdq_tensors)
-        elif tensor_name.endswith(_POST_QDQ_POSTFIX1):
-            pre_name = tensor_name[: -len(_POST_QDQ_POSTFIX1)]
-            pre_qdq_tensors = qdq_activations.get(pre_name)
-            post_qdq_tensors = tensors
-            _add_pre_post_qdq_pair(qdq_cmp, pre_name, pre_qdq_tensors, post_qdq_tensors)
+    for activation_name, (pre_qdq_name, post_qdq_name) in _match_pre_post_qdq_tensors(qdq_activations).items():
+        qdq_cmp[activation_name] = {
+            "pre_qdq": qdq_activations[pre_qdq_name],
+            "post_qdq": qdq_activations[post_qdq_name],
+        }
 
     if not float_activations:
         return qdq_cmp
@@ -387,3 +400,94 @@ def compute_activation_error(
             err_result["xmodel_err"] = err_func(float_activation, match["post_qdq"])
         result[name] = err_result
     return result
+
+
+class _SignalToQuantizationNoiseRatio:
+    """Accumulates `compute_signal_to_quantization_noice_ratio` over batches."""
+
+    def __init__(self):
+        self.signal_norm2 = 0.0
+        self.noise_norm2 = 0.0
+
+    def update(self, x: numpy.ndarray, y: numpy.ndarray) -> None:
+        left = x.reshape(-1).astype(numpy.float64)
+        noise = left - y.reshape(-1)
+        self.signal_norm2 += float(numpy.dot(left, left))
+        self.noise_norm2 += float(numpy.dot(noise, noise))
+
+    def value(self) -> float:
+        epsilon = numpy.finfo("float").eps
+        tensor_norm = max(math.sqrt(self.signal_norm2), epsilon)
+        diff_norm = max(math.sqrt(self.noise_norm2), epsilon)
+        return 20 * math.log10(tensor_norm / diff_norm)
+
+
+def compute_activation_error_streaming(
+    qdq_augmented_model: str,
+    input_reader: CalibrationDataReader,
+    float_augmented_model: str | None = None,
+    session_options=None,
+    execution_providers: Sequence[str] | None = None,
+) -> dict[str, dict[str, float]]:
+    """Compute the activation errors of the QDQ model batch by batch.
+
+    This gives the same result as `compute_activation_error` with the default error function on the
+    activations matched by `create_activation_matching`, but the activations are never collected: the
+    augmented models are run side by side on each input and the signal to quantization noise ratios
+    are accumulated, so only the activations of one batch are in memory at a time.
+
+    Args:
+        qdq_augmented_model: Path to the QDQ model augmented by modify_model_output_intermediate_tensors ()
+        input_reader: Logic for reading input for the models, each input is fed to both models.
+        float_augmented_model: Optional path to the float model augmented by
+            modify_model_output_intermediate_tensors (), to compute the cross model errors.
+        session_options: Optional OnnxRuntime session options for controlling model run.
+            By default graph optimization is turned off
+        execution_providers: Collection of execution providers for running the model.
+            Only CPU EP is used by default.
+
+    Returns:
+        A dictionary where the key is the activation name and the value is a dictionary with the
+        error before and after QDQ ("qdq_err") and, with a float model, the cross model error ("xmodel_err").
+    """
+    qdq_session = _create_inference_session(qdq_augmented_model, session_options, execution_providers)
+    saved_names = dict.fromkeys(
+        output.name[:-_TENSOR_SAVE_POSTFIX_LEN]
+        for output in qdq_session.get_outputs()
+        if output.name.endswith(_TENSOR_SAVE_POSTFIX)
+    )
+    matches = _match_pre_post_qdq_tensors(saved_names)
+    qdq_names = list(dict.fromkeys(name for pair in matches.values() for name in pair))
+    qdq_output_names = [name + _TENSOR_SAVE_POSTFIX for name in qdq_names]
+    qdq_errors = {activation_name: _SignalToQuantizationNoiseRatio() for activation_name in matches}
+
+    float_session = None
+    float_names = []
+    xmodel_errors = {}
+    if float_augmented_model is not None:
+        float_session = _create_inference_session(float_augmented_model, session_options, execution_providers)
+        float_outputs = {output.name for output in float_session.get_outputs()}
+        float_names = [name for name in matches if name + _TENSOR_SAVE_POSTFIX in float_outputs]
+        xmodel_errors = {activation_name: _SignalToQuantizationNoiseRatio() for activation_name in float_names}
+    float_output_names = [name + _TENSOR_SAVE_POSTFIX for name in float_names]
+
+    num_batches = 0
+    for input_d in input_reader:
+        num_batches += 1
+        qdq_activations = dict(zip(qdq_names, qdq_session.run(qdq_output_names, input_d), strict=True))
+        for activation_name, (pre_qdq_name, post_qdq_name) in matches.items():
+            qdq_errors[activation_name].update(qdq_activations[pre_qdq_name], qdq_activations[post_qdq_name])
+        if float_session is not None and float_output_names:
+            float_activations = float_session.run(float_output_names, input_d)
+            for activation_name, float_activation in zip(float_names, float_activations, strict=True):
+                xmodel_errors[activation_name].update(float_activation, qdq_activations[matches[activation_name][1]])
+        del qdq_activations
+    if num_batches == 0:
+        raise RuntimeError("No data is collected while running augmented model!")
+
+    result: dict[str, dict[str, float]] = {}
+    for activation_name, qdq_error in qdq_errors.items():
+        result[activation_name] = {"qdq_err": qdq_error.value()}
+        if activation_name in xmodel_errors:
+            result[activation_name]["xmodel_err"] = xmodel_errors[activation_name].value()
+    return result
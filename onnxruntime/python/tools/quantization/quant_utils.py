@@ -7,6 +7,7 @@ from __future__ import annotations
 
 import copy
 import logging
+import mmap
 import os
 import tempfile
 from enum import Enum
@@ -921,6 +922,80 @@ def model_has_external_data(model_path: Path):
     return any(external_data_helper.uses_external_data(intializer) for intializer in model.graph.initializer)
 
 
+class ExternalDataReader:
+    """
+    Reads the external data of the tensors of a model loaded with `load_external_data=False`.
+    The external data files are memory-mapped, so only the pages of the tensors being read are loaded
+    and the memory usage does not depend on the size of the files.
+    """
+
+    def __init__(self, base_dir: str, chunk_size: int = 1 << 26):
+        self.base_dir = base_dir
+        self.chunk_size = chunk_size
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for file, data in self._files.values():
+            data.close()
+            file.close()
+        self._files.clear()
+
+    def _map(self, tensor: TensorProto) -> tuple[mmap.mmap, int, int]:
+        info = external_data_helper.ExternalDataInfo(tensor)
+        if os.path.isabs(info.location) or os.path.normpath(info.location).startswith(os.pardir):
+            raise ValueError(f"External data of tensor {tensor.name!r} is outside of the model directory.")
+        if info.location not in self._files:
+            file = open(os.path.join(self.base_dir, info.location), "rb")  # noqa: SIM115
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except BaseException:
+                file.close()
+                raise
+            self._files[info.location] = (file, data)
+        data = self._files[info.location][1]
+        offset = info.offset or 0
+        length = info.length if info.length is not None else len(data) - offset
+        if offset + length > len(data):
+            raise ValueError(f"External data of tensor {tensor.name!r} is out of the bounds of {info.location!r}.")
+        return data, offset, length
+
+    def load(self, tensor: TensorProto):
+        """Reads the external data of the tensor into its raw_data. Nothing is done if it has no external data."""
+        if not external_data_helper.uses_external_data(tensor):
+            return
+        data, offset, length = self._map(tensor)
+        del tensor.external_data[:]
+        tensor.data_location = TensorProto.DEFAULT
+        tensor.raw_data = data[offset : offset + length]
+
+    def copy_to(self, tensor: TensorProto, external_data_path: str):
+        """
+        Appends the external data of the tensor to the file external_data_path by chunks and updates the
+        tensor to refer to it. The location is relative to the directory of external_data_path.
+        """
+        data, offset, length = self._map(tensor)
+        with open(external_data_path, "ab") as file:
+            new_offset = file.tell()
+            for start in range(offset, offset + length, self.chunk_size):
+                file.write(data[start : min(start + self.chunk_size, offset + length)])
+        # external_data_helper.set_external_data requires raw_data.
+        del tensor.external_data[:]
+        for key, value in [
+            ("location", os.path.basename(external_data_path)),
+            ("offset", new_offset),
+            ("length", length),
+        ]:
+            entry = tensor.external_data.add()
+            entry.key = key
+            entry.value = str(value)
+
+
 def optimize_model(model_path: Path, opt_model_path: Path):
     """
         Generate model that applies graph optimization (constant folding, etc.)
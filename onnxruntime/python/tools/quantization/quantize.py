@@ -14,7 +14,14 @@ from typing import Any
 
 import onnx
 
-from .calibrate import CalibrationDataReader, CalibrationMethod, TensorsData, create_calibrator
+from .calibrate import (
+    CalibrationCache,
+    CalibrationDataReader,
+    CalibrationMethod,
+    HistogramCalibrater,
+    TensorsData,
+    create_calibrator,
+)
 from .onnx_quantizer import ONNXQuantizer
 from .qdq_quantizer import QDQQuantizer
 from .quant_utils import (
@@ -362,6 +369,10 @@ def get_qdq_config(
             ("averaging_constant", "CalibMovingAverageConstant"),
             ("max_intermediate_outputs", "CalibMaxIntermediateOutputs"),
             ("percentile", "CalibPercentile"),
+            ("num_workers", "CalibNumWorkers"),
+            ("running_reduction", "CalibRunningReduction"),
+            ("use_io_binding", "CalibUseIOBinding"),
+            ("num_inference_sessions", "CalibNumInferenceSessions"),
         ]
         calib_extra_options = {
             key: calibrate_args.get(name) for (name, key) in calib_extra_options_keys if name in calibrate_args
@@ -583,7 +594,39 @@ def quantize_static(
                 CalibMaxIntermediateOutputs = Optional[int] :
                     Default is None. If set to an integer, during calculation of the min-max range of the tensors
                     it will load at max value number of outputs before computing and merging the range. This will
-                    produce the same result as all computing with None, but is more memory efficient.
+                    produce the same result as all computing with None, but is more memory efficient. For the
+                    histogram-based methods (Entropy, Percentile, Distribution), the histograms are updated every
+                    value number of outputs and the outputs are released, which keeps memory usage constant
+                    regardless of the number of calibration samples. The calibration inputs are written to a temporary
+                    file and the model runs twice on them, first to find the ranges of the histograms, so the result
+                    is the same as computing with None.
+                CalibNumWorkers = Optional[int] :
+                    Default is None. If set to an integer greater than 1, the ranges of the tensors are computed
+                    from their histograms by a pool of value processes sharing the histograms through shared
+                    memory. Effective only when the calibration method selected is Entropy, Percentile or
+                    Distribution.
+                CalibRunningReduction = True/False :
+                    Default is False. If enabled, the minimum and maximum values of each calibration batch are folded
+                    into running values as soon as they are computed instead of keeping the outputs of every batch,
+                    which keeps memory usage proportional to the number of tensors. Effective only when the
+                    calibration method selected is MinMax.
+                CalibUseIOBinding = True/False :
+                    Default is False. If enabled, the minimum and maximum values are written to preallocated buffers
+                    bound with IOBinding. Effective only when CalibRunningReduction is set to True.
+                CalibCacheDir = Optional[str] :
+                    Default is None. If set, the calibration results are cached in this directory, keyed by the
+                    model, the tensors to calibrate, the calibration method and its options and the fingerprint of
+                    the calibration data. Calibration is skipped when the same configuration was already
+                    calibrated. For the histogram-based methods, the histograms are cached as well so changing
+                    CalibPercentile only recomputes the ranges. Requires CalibDataFingerprint or a
+                    calibration_data_reader implementing CalibrationDataReader.fingerprint.
+                CalibDataFingerprint = Optional[str] :
+                    Default is None. String identifying the calibration data in the key of the calibration cache,
+                    takes precedence over CalibrationDataReader.fingerprint.
+                CalibNumInferenceSessions = int :
+                    Default is 1. Number of inference sessions running the calibration batches concurrently, the
+                    intra-op threads being split between them. The batches are still read and merged in order, so
+                    the ranges are the same as with a single session. Each session holds its own copy of the model.
                 SmoothQuant = True/False :
                     Default is False. If enabled, SmoothQuant algorithm will be applied before quantization to do
                     fake input channel quantization.
@@ -666,6 +709,10 @@ def quantize_static(
         ("CalibMovingAverageConstant", "averaging_constant"),
         ("CalibMaxIntermediateOutputs", "max_intermediate_outputs"),
         ("CalibPercentile", "percentile"),
+        ("CalibNumWorkers", "num_workers"),
+        ("CalibRunningReduction", "running_reduction"),
+        ("CalibUseIOBinding", "use_io_binding"),
+        ("CalibNumInferenceSessions", "num_inference_sessions"),
     ]
     calib_extra_options = {
         key: extra_options.get(name) for (name, key) in calib_extra_options_keys if name in extra_options
@@ -700,45 +747,77 @@ def quantize_static(
         nodes_to_exclude.extend([i.name for i in model.model.graph.node if i.name not in orig_nodes])
         model = load_model_with_shape_infer(Path(model_input))  # use smooth quant model for calibration
 
-    with tempfile.TemporaryDirectory(prefix="ort.quant.") as quant_tmp_dir:
-        if isinstance(model_input, onnx.ModelProto):
-            output_path = str(Path(quant_tmp_dir) / "model_input.onnx")
-            onnx.save_model(
-                model_input,
-                output_path,
-                save_as_external_data=True,
+    stride = extra_options.get("CalibStridedMinMax", None)
+    calibration_cache = None
+    if extra_options.get("CalibCacheDir"):
+        data_fingerprint = extra_options.get("CalibDataFingerprint")
+        if data_fingerprint is None and hasattr(calibration_data_reader, "fingerprint"):
+            data_fingerprint = calibration_data_reader.fingerprint()
+        if data_fingerprint is None:
+            logging.warning(
+                "CalibCacheDir is ignored because the calibration data cannot be identified, "
+                "set CalibDataFingerprint or implement CalibrationDataReader.fingerprint."
             )
-            model_input = output_path
-
-        calibrator = create_calibrator(
-            Path(model_input),
-            op_types_to_quantize,
-            augmented_model_path=Path(quant_tmp_dir).joinpath("augmented_model.onnx").as_posix(),
-            calibrate_method=calibrate_method,
-            use_external_data_format=use_external_data_format,
-            providers=calibration_providers,
-            extra_options=calib_extra_options,
-        )
-
-        stride = extra_options.get("CalibStridedMinMax", None)
-        if stride:
-            total_data_size = len(calibration_data_reader)
-            if total_data_size % stride != 0:
-                raise ValueError(f"Total data size ({total_data_size}) is not divisible by stride size ({stride}).")
-
-            for start in range(0, total_data_size, stride):
-                end_index = start + stride
-                calibration_data_reader.set_range(start_index=start, end_index=end_index)
-                calibrator.collect_data(calibration_data_reader)
         else:
-            calibrator.collect_data(calibration_data_reader)
-        tensors_range = calibrator.compute_data()
-        if not isinstance(tensors_range, TensorsData):
-            raise TypeError(
-                f"Unexpected type {type(tensors_range)} for tensors_range and calibrator={type(calibrator)}."
+            calibration_cache = CalibrationCache(
+                extra_options["CalibCacheDir"],
+                model,
+                op_types_to_quantize,
+                calibrate_method,
+                {**calib_extra_options, "strided_min_max": stride},
+                data_fingerprint,
             )
-        del calibrator
 
+    tensors_range = calibration_cache.load_tensors_range() if calibration_cache else None
+    if tensors_range is None:
+        with tempfile.TemporaryDirectory(prefix="ort.quant.") as quant_tmp_dir:
+            if isinstance(model_input, onnx.ModelProto):
+                output_path = str(Path(quant_tmp_dir) / "model_input.onnx")
+                onnx.save_model(
+                    model_input,
+                    output_path,
+                    save_as_external_data=True,
+                )
+                model_input = output_path
+
+            calibrator = create_calibrator(
+                Path(model_input),
+                op_types_to_quantize,
+                augmented_model_path=Path(quant_tmp_dir).joinpath("augmented_model.onnx").as_posix(),
+                calibrate_method=calibrate_method,
+                use_external_data_format=use_external_data_format,
+                providers=calibration_providers,
+                extra_options=calib_extra_options,
+            )
+
+            histograms = None
+            if calibration_cache and isinstance(calibrator, HistogramCalibrater):
+                histograms = calibration_cache.load_histograms()
+
+            if histograms is not None:
+                calibrator.set_histograms(histograms)
+            elif stride:
+                total_data_size = len(calibration_data_reader)
+                if total_data_size % stride != 0:
+                    raise ValueError(f"Total data size ({total_data_size}) is not divisible by stride size ({stride}).")
+
+                for start in range(0, total_data_size, stride):
+                    end_index = start + stride
+                    calibration_data_reader.set_range(start_index=start, end_index=end_index)
+                    calibrator.collect_data(calibration_data_reader)
+            else:
+                calibrator.collect_data(calibration_data_reader)
+            tensors_range = calibrator.compute_data()
+            if not isinstance(tensors_range, TensorsData):
+                raise TypeError(
+                    f"Unexpected type {type(tensors_range)} for tensors_range and calibrator={type(calibrator)}."
+                )
+
+            if calibration_cache:
+                calibration_cache.save_tensors_range(tensors_range)
+                if isinstance(calibrator, HistogramCalibrater) and histograms is None:
+                    calibration_cache.save_histograms(calibrator.collector.get_histogram_dict())
+            del calibrator
     check_static_quant_arguments(quant_format, activation_type, weight_type)
 
     if quant_format is QuantFormat.QOperator:
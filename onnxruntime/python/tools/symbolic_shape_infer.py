@@ -3,6 +3,8 @@
 
 # -*- coding: UTF-8 -*-
 import argparse
+import heapq
+import itertools
 import logging
 
 import numpy as np
@@ -122,6 +124,92 @@ def sympy_reduce_product(x):
     return value
 
 
+def get_node_prerequisites(node):
+    """Get names that a node depends on, including implicit inputs used by nodes in subgraphs of If, Loop and Scan.
+    Subgraphs of other operators, like BeamSearch, are not visited."""
+    names = {i for i in node.input if i}
+    if node.op_type == "If":
+        subgraphs = [get_attribute(node, "then_branch"), get_attribute(node, "else_branch")]
+    elif node.op_type in ["Loop", "Scan"]:
+        subgraphs = [get_attribute(node, "body")]
+    else:
+        subgraphs = []
+    for g in subgraphs:
+        # subgraph inputs, initializers and node outputs are local-only
+        g_local_names = {i.name for i in g.input} | {i.name for i in g.initializer}
+        for n in g.node:
+            g_local_names.update(n.output)
+        for n in g.node:
+            names.update(i for i in get_node_prerequisites(n) if i not in g_local_names)
+    return names
+
+
+def topological_sort_nodes(nodes, known_names, is_deterministic=False, required_outputs=None, skip_produced=False):
+    """Sort nodes in topological order with Kahn's algorithm in O(N log N) time.
+
+    The order is the same as sweeping the nodes repeatedly and appending those with all prerequisites available,
+    so nodes of a sorted graph keep their order. Nodes in a cycle, or depending on an unknown name, are not returned.
+
+    Args:
+        nodes: nodes of a graph.
+        known_names: names available before running any node, like graph inputs and initializers.
+        is_deterministic: visit nodes by name so that the order does not depend on the original order of nodes.
+        required_outputs: when specified, stop after the sweep that makes all of them available like
+            SymbolicShapeInference does, so some nodes not needed for those outputs might not be returned.
+        skip_produced: skip a node when its first output is already available like SymbolicShapeInference does,
+            so only the first producer of a duplicated output is returned.
+
+    Returns:
+        list of sorted nodes.
+    """
+    if is_deterministic:
+        nodes = sorted(nodes, key=lambda node: node.name)
+
+    known = set(known_names)
+    # the key of a node is (sweep, index) that it is appended in, and initially the first sweep
+    keys = [(1, index) for index in range(len(nodes))]
+    pending_count = [0] * len(nodes)
+    waiting_nodes = {}  # map from name to indices of nodes that wait for it
+    ready = []
+    for index, node in enumerate(nodes):
+        pending = get_node_prerequisites(node) - known
+        pending_count[index] = len(pending)
+        if pending:
+            for name in pending:
+                waiting_nodes.setdefault(name, []).append(index)
+        else:
+            ready.append(keys[index])
+    heapq.heapify(ready)
+
+    pending_outputs = set() if required_outputs is None else set(required_outputs) - known
+    last_sweep = None if required_outputs is None or pending_outputs else 0
+
+    sorted_nodes = []
+    while ready:
+        sweep, index = heapq.heappop(ready)
+        if last_sweep is not None and sweep > last_sweep:
+            break
+        node = nodes[index]
+        if skip_produced and node.output and node.output[0] in known:
+            continue
+        sorted_nodes.append(node)
+        for name in node.output:
+            if not name or name in known:
+                continue
+            known.add(name)
+            pending_outputs.discard(name)
+            # a node before this one in the sweep order is appended in the next sweep
+            for waiting in waiting_nodes.pop(name, []):
+                keys[waiting] = max(keys[waiting], (sweep if waiting > index else sweep + 1, waiting))
+                pending_count[waiting] -= 1
+                if pending_count[waiting] == 0:
+                    heapq.heappush(ready, keys[waiting])
+        if last_sweep is None and required_outputs is not None and not pending_outputs:
+            last_sweep = sweep
+
+    return sorted_nodes
+
+
 class SymbolicShapeInference:
     def __init__(self, int_max, auto_merge, guess_output_rank, verbose, prefix=""):
         self.dispatcher_ = {
@@ -259,6 +347,14 @@ class SymbolicShapeInference:
         self.int_max_ = int_max
         self.subgraph_id_ = 0
         self.prefix_ = prefix
+        # Optional cache of inference results of nodes, which could be shared by runs on edited versions of a model.
+        # Key is from _get_node_cache_key, and value is output value infos, sympy data and new symbolic dims.
+        # Entries not used by the last complete inference are dropped, so its size is bounded by the graph size.
+        self.node_cache_ = None
+        self.num_new_symbolic_dims_ = 0  # number of dims created by _new_symbolic_dim, which depend on node position
+        # Results of onnx single node inference in canonical form, which are shared by identical nodes (like those
+        # in repeated transformer layers). Key is from _get_onnx_infer_cache_key, and value is output types.
+        self.onnx_infer_cache_ = {}
 
     def _add_suggested_merge(self, symbols, apply=False):
         assert all((type(s) is str and s in self.symbolic_dims_) or is_literal(s) for s in symbols)
@@ -322,6 +418,7 @@ class SymbolicShapeInference:
         self.out_mp_.CopyFrom(in_mp)
         self.graph_inputs_ = {i.name: i for i in list(self.out_mp_.graph.input)}
         self.initializers_ = {i.name: i for i in self.out_mp_.graph.initializer}
+        self.initializer_cache_keys_ = {}
         self.known_vi_ = {i.name: i for i in list(self.out_mp_.graph.input)}
         self.known_vi_.update(
             {
@@ -525,29 +622,101 @@ class SymbolicShapeInference:
                         if len(in_dims) > 1:
                             self._check_merged_dims(in_dims, allow_broadcast=True)
 
-            # run single node inference with self.known_vi_ shapes
-            tmp_graph = helper.make_graph(
-                [node],
-                "tmp",
-                [self.known_vi_[i] for i in node.input if i],
-                [make_named_value_info(i) for i in node.output],
-                initializers,
-            )
+            cache_key, dim_params = self._get_onnx_infer_cache_key(node, initializers)
+            output_types = self.onnx_infer_cache_.get(cache_key) if cache_key is not None else None
+            if output_types is None:
+                # run single node inference with self.known_vi_ shapes
+                tmp_graph = helper.make_graph(
+                    [node],
+                    "tmp",
+                    [self.known_vi_[i] for i in node.input if i],
+                    [make_named_value_info(i) for i in node.output],
+                    initializers,
+                )
 
-            self.tmp_mp_.graph.CopyFrom(tmp_graph)
+                self.tmp_mp_.graph.CopyFrom(tmp_graph)
 
-            self.tmp_mp_ = shape_inference.infer_shapes(self.tmp_mp_)
+                self.tmp_mp_ = shape_inference.infer_shapes(self.tmp_mp_)
+                output_types = [output.type for output in self.tmp_mp_.graph.output]
+                if cache_key is not None:
+                    self._add_onnx_infer_cache(cache_key, dim_params, output_types)
+            else:
+                output_types = self._rename_dim_params(output_types, {v: k for k, v in dim_params.items()})
 
         for i_o in range(len(node.output)):
             o = node.output[i_o]
             if o:  # skip optional output
                 vi = self.out_mp_.graph.value_info.add()
-                if not skip_infer:
-                    vi.CopyFrom(self.tmp_mp_.graph.output[i_o])
-                else:
-                    vi.name = o
+                vi.name = o
+                if not skip_infer and output_types[i_o].ListFields():
+                    vi.type.CopyFrom(output_types[i_o])
                 self.known_vi_[o] = vi
 
+    @staticmethod
+    def _rename_dim_params(types, dim_params):
+        """Get copies of tensor types with symbolic dims renamed by the given mapping."""
+        renamed_types = []
+        for type_proto in types:
+            renamed = onnx.TypeProto()
+            renamed.CopyFrom(type_proto)
+            for dim in renamed.tensor_type.shape.dim:
+                if dim.HasField("dim_param"):
+                    dim.dim_param = dim_params[dim.dim_param]
+            renamed_types.append(renamed)
+        return renamed_types
+
+    def _get_onnx_infer_cache_key(self, node, initializers):
+        """Get canonical form of onnx single node inference, where names of inputs, outputs and symbolic dims are
+        replaced by their order of appearance. Returns the key and the mapping of symbolic dims to canonical names.
+        """
+        input_names = [i for i in node.input if i]
+        if any(self.known_vi_[i].type.WhichOneof("value") != "tensor_type" for i in input_names):
+            return None, None
+
+        dim_params = {}
+        for i in input_names:
+            for dim in self.known_vi_[i].type.tensor_type.shape.dim:
+                if dim.HasField("dim_param") and dim.dim_param not in dim_params:
+                    dim_params[dim.dim_param] = f"d{len(dim_params)}"
+        input_types = self._rename_dim_params([self.known_vi_[i].type for i in input_names], dim_params)
+
+        names = {}
+        for name in itertools.chain(node.input, node.output):
+            if name and name not in names:
+                names[name] = f"v{len(names)}"
+        canonical_node = onnx.NodeProto()
+        canonical_node.CopyFrom(node)
+        canonical_node.ClearField("name")
+        canonical_node.ClearField("doc_string")
+        for i, name in enumerate(node.input):
+            canonical_node.input[i] = names.get(name, "")
+        for i, name in enumerate(node.output):
+            canonical_node.output[i] = names.get(name, "")
+
+        canonical_initializers = []
+        for tensor in initializers:
+            canonical_tensor = onnx.TensorProto()
+            canonical_tensor.CopyFrom(tensor)
+            canonical_tensor.name = names[tensor.name]
+            canonical_initializers.append(canonical_tensor.SerializeToString())
+
+        key = (
+            canonical_node.SerializeToString(),
+            tuple(t.SerializeToString() for t in input_types),
+            tuple(canonical_initializers),
+        )
+        return key, dim_params
+
+    def _add_onnx_infer_cache(self, cache_key, dim_params, output_types):
+        for type_proto in output_types:
+            if type_proto.WhichOneof("value") not in ["tensor_type", None]:
+                return
+            # dims created by onnx (like unk__0) are not cached since their names depend on the inference.
+            for dim in type_proto.tensor_type.shape.dim:
+                if dim.HasField("dim_param") and dim.dim_param not in dim_params:
+                    return
+        self.onnx_infer_cache_[cache_key] = self._rename_dim_params(output_types, dim_params)
+
     def _onnx_infer_subgraph(self, node, subgraph, use_node_input=True, inc_subgraph_id=True):
         if self.verbose_ > 2:
             logger.debug(f"Inferencing subgraph of node {node.name} with output({node.output[0]}...): {node.op_type}")
@@ -679,6 +848,7 @@ class SymbolicShapeInference:
         )
 
     def _new_symbolic_dim(self, prefix, dim):
+        self.num_new_symbolic_dims_ += 1
         new_dim = f"{prefix}_d{dim}"
         if new_dim in self.suggested_merge_:
             v = self.suggested_merge_[new_dim]
@@ -2616,6 +2786,83 @@ class SymbolicShapeInference:
                 return out
         return None
 
+    def _get_node_cache_token(self):
+        """Get the part of node cache key from the state that is shared by all nodes."""
+        return (
+            tuple(sorted(self.suggested_merge_.items(), key=lambda item: item[0])),
+            self.int_max_,
+            self.auto_merge_,
+            self.guess_output_rank_,
+        )
+
+    @staticmethod
+    def _get_value_cache_key(value):
+        if isinstance(value, np.ndarray):
+            return (value.dtype.str, value.shape, value.tobytes())
+        if isinstance(value, (list, tuple)):
+            return (type(value).__name__, tuple(SymbolicShapeInference._get_value_cache_key(v) for v in value))
+        return (type(value).__name__, str(value))
+
+    @staticmethod
+    def _copy_value(value):
+        # sympy expressions are immutable, so only containers need to be copied. It is much faster than deepcopy.
+        if isinstance(value, np.ndarray):
+            return value.copy()
+        if isinstance(value, list):
+            return [SymbolicShapeInference._copy_value(v) for v in value]
+        return value
+
+    def _get_initializer_cache_key(self, name):
+        if name not in self.initializer_cache_keys_:
+            tensor = self.initializers_[name]
+            # Values are only used in shape computation for small tensors (like shape of Reshape), so data of
+            # large tensors (like weights) is not part of the key to avoid serializing them.
+            if np.prod(tensor.dims) <= 1024:
+                self.initializer_cache_keys_[name] = tensor.SerializeToString()
+            else:
+                self.initializer_cache_keys_[name] = (tensor.data_type, tuple(tensor.dims))
+        return self.initializer_cache_keys_[name]
+
+    def _get_node_cache_key(self, node, token):
+        """Get key of inference result of a node from the node and the type, shape and value of its inputs.
+        Returns None when the node is not cacheable.
+        """
+        if any(attr.type in [onnx.AttributeProto.GRAPH, onnx.AttributeProto.GRAPHS] for attr in node.attribute):
+            return None
+        inputs = []
+        for name in node.input:
+            if not name:
+                inputs.append(None)
+                continue
+            inputs.append(
+                (
+                    self.known_vi_[name].type.SerializeToString(),
+                    self._get_value_cache_key(self.sympy_data_[name]) if name in self.sympy_data_ else None,
+                    self._get_initializer_cache_key(name) if name in self.initializers_ else None,
+                )
+            )
+        return (token, node.SerializeToString(), tuple(inputs))
+
+    def _reuse_node_cache(self, node, cached):
+        output_value_infos, sympy_data, symbolic_dims = cached
+        for o, cached_vi in zip([o for o in node.output if o], output_value_infos, strict=True):
+            vi = self.out_mp_.graph.value_info.add()
+            vi.CopyFrom(cached_vi)
+            self.known_vi_[o] = vi
+        self.sympy_data_.update({name: self._copy_value(value) for name, value in sympy_data.items()})
+        self.symbolic_dims_.update(symbolic_dims)
+
+    def _add_node_cache(self, node, cache_key, num_symbolic_dims):
+        output_value_infos = []
+        for o in node.output:
+            if o:
+                vi = onnx.ValueInfoProto()
+                vi.CopyFrom(self.known_vi_[o])
+                output_value_infos.append(vi)
+        sympy_data = {o: self._copy_value(self.sympy_data_[o]) for o in node.output if o in self.sympy_data_}
+        symbolic_dims = dict(itertools.islice(self.symbolic_dims_.items(), num_symbolic_dims, None))
+        self.node_cache_[cache_key] = (output_value_infos, sympy_data, symbolic_dims)
+
     def _infer_impl(self, start_sympy_data=None):
         self.sympy_data_ = start_sympy_data or {}
         self.out_mp_.graph.ClearField("value_info")
@@ -2653,59 +2900,43 @@ class SymbolicShapeInference:
         self.tmp_mp_.CopyFrom(self.out_mp_)
         self.tmp_mp_.graph.ClearField("initializer")
 
-        # compute prerequesite for node for topological sort
+        # topological sort nodes, note there might be dead nodes so we stop when all graph outputs are reached
         # node with subgraphs may have dependency on implicit inputs, which will affect topological sort
-        prereq_for_node = {}  # map from node to all its inputs, including implicit ones in subgraph
-
-        def get_prereq(node):
-            names = {i for i in node.input if i}
-            subgraphs = []
-            if node.op_type == "If":
-                subgraphs = [
-                    get_attribute(node, "then_branch"),
-                    get_attribute(node, "else_branch"),
-                ]
-            elif node.op_type in ["Loop", "Scan"]:
-                subgraphs = [get_attribute(node, "body")]
-            for g in subgraphs:
-                g_outputs_and_initializers = {i.name for i in g.initializer}
-                g_prereq = set()
-                for n in g.node:
-                    g_outputs_and_initializers.update(n.output)
-                for n in g.node:
-                    g_prereq.update([i for i in get_prereq(n) if i not in g_outputs_and_initializers])
-                names.update(g_prereq)
-                # remove subgraph inputs from g_prereq since those are local-only
-                for i in g.input:
-                    if i.name in names:
-                        names.remove(i.name)
-            return names
-
-        for n in self.tmp_mp_.graph.node:
-            prereq_for_node[n.output[0]] = get_prereq(n)
-
-        # topological sort nodes, note there might be dead nodes so we check if all graph outputs are reached to terminate
-        sorted_nodes = []
-        sorted_known_vi = {i.name for i in list(self.out_mp_.graph.input) + list(self.out_mp_.graph.initializer)}
-        if any(o.name in sorted_known_vi for o in self.out_mp_.graph.output):
+        known_names = {i.name for i in list(self.out_mp_.graph.input) + list(self.out_mp_.graph.initializer)}
+        if any(o.name in known_names for o in self.out_mp_.graph.output):
             # Loop/Scan will have some graph output in graph inputs, so don't do topological sort
             sorted_nodes = self.out_mp_.graph.node
         else:
-            while not all(o.name in sorted_known_vi for o in self.out_mp_.graph.output):
-                old_sorted_nodes_len = len(sorted_nodes)
-                for node in self.out_mp_.graph.node:
-                    if (node.output[0] not in sorted_known_vi) and all(
-                        i in sorted_known_vi for i in prereq_for_node[node.output[0]] if i
-                    ):
-                        sorted_known_vi.update(node.output)
-                        sorted_nodes.append(node)
-                if old_sorted_nodes_len == len(sorted_nodes) and not all(
-                    o.name in sorted_known_vi for o in self.out_mp_.graph.output
-                ):
-                    raise Exception("Invalid model with cyclic graph")
+            graph_outputs = [o.name for o in self.out_mp_.graph.output]
+            sorted_nodes = topological_sort_nodes(
+                self.out_mp_.graph.node, known_names, required_outputs=graph_outputs, skip_produced=True
+            )
+            sorted_outputs = {o for node in sorted_nodes for o in node.output}
+            if not all(o in sorted_outputs for o in graph_outputs):
+                raise Exception("Invalid model with cyclic graph")
 
+        if self.node_cache_ is not None:
+            token, merges = self._get_node_cache_token(), dict(self.suggested_merge_)
+            used_cache_keys = set()
         for node in sorted_nodes:
             assert all(i in self.known_vi_ for i in node.input if i)
+            cache_key = None
+            if self.node_cache_ is not None:
+                if self.suggested_merge_ != merges:
+                    token, merges = self._get_node_cache_token(), dict(self.suggested_merge_)
+                cache_key = self._get_node_cache_key(node, token)
+                if cache_key is not None:
+                    used_cache_keys.add(cache_key)
+                    cached = self.node_cache_.get(cache_key)
+                    if cached is not None:
+                        self._reuse_node_cache(node, cached)
+                        continue
+                run, num_symbolic_dims, num_new_symbolic_dims = (
+                    self.run_,
+                    len(self.symbolic_dims_),
+                    self.num_new_symbolic_dims_,
+                )
+
             self._onnx_infer_single_node(node)
             known_aten_op = False
             if node.op_type in self.dispatcher_:
@@ -2927,6 +3158,20 @@ class SymbolicShapeInference:
                             logger.debug("Merging: " + str(self.suggested_merge_))  # noqa: G003
                     return False
 
+            # Cache the result unless the inference changed other state, like merges or dims named by node position.
+            if (
+                cache_key is not None
+                and self.run_ == run
+                and self.num_new_symbolic_dims_ == num_new_symbolic_dims
+                and self.suggested_merge_ == merges
+            ):
+                self._add_node_cache(node, cache_key, num_symbolic_dims)
+
+        if self.node_cache_ is not None:
+            # Drop results of nodes that are no longer in the graph, so that the cache does not grow with edits.
+            for key in [key for key in self.node_cache_ if key not in used_cache_keys]:
+                del self.node_cache_[key]
+
         self.run_ = False
         return True
 
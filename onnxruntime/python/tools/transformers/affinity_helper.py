@@ -11,8 +11,9 @@ logger = logging.getLogger(__name__)
 
 
 class AffinitySetting:
-    def __init__(self):
-        self.pid = os.getpid()
+    def __init__(self, pid=None):
+        # pid could be the native id of a thread (like threading.get_native_id()) to set affinity of the thread only.
+        self.pid = os.getpid() if pid is None else pid
         self.affinity = None
         self.is_os_supported = hasattr(os, "sched_getaffinity") and hasattr(os, "sched_setaffinity")
         if not self.is_os_supported:
@@ -38,6 +38,8 @@ Example commands:
         python benchmark.py -g -m bert-base-cased --provider rocm --optimizer_info by_script --disable_embed_layer_norm
     Run OnnxRuntime with bfloat16 fastmath mode kernels on aarch64 platforms with bfloat16 support:
         python benchmark.py --enable_arm64_bfloat16_fastmath_mlas_gemm
+    Measure throughput of OnnxRuntime on CPU with 1, 2 and 4 concurrent requests, and sweep thread layouts:
+        python benchmark.py -m bert-base-cased -b 1 -s 128 --throughput --concurrency 1 2 4 --inter_op_num_threads 1 2
 
 It is recommended to use run_benchmark.sh to launch benchmark.
 """
@@ -61,6 +63,8 @@ from benchmark_helper import (
     output_details,
     output_fusion_statistics,
     output_summary,
+    output_throughput_results,
+    run_throughput_benchmark,
     setup_logger,
 )
 from fusion_options import FusionOptions
@@ -206,19 +210,21 @@ def run_onnxruntime(
             if not is_valid_onnx_model:
                 continue
 
-            ort_session = create_onnxruntime_session(
-                onnx_model_file,
-                use_gpu,
-                provider,
-                enable_all_optimization=True,
-                num_threads=num_threads,
-                verbose=verbose,
-                enable_mlas_gemm_fastmath_arm64_bfloat16=enable_arm64_bfloat16_fastmath_mlas_gemm,
-            )
-            if ort_session is None:
-                continue
+            # Sessions of throughput test are created for each thread layout.
+            if not args.throughput:
+                ort_session = create_onnxruntime_session(
+                    onnx_model_file,
+                    use_gpu,
+                    provider,
+                    enable_all_optimization=True,
+                    num_threads=num_threads,
+                    verbose=verbose,
+                    enable_mlas_gemm_fastmath_arm64_bfloat16=enable_arm64_bfloat16_fastmath_mlas_gemm,
+                )
+                if ort_session is None:
+                    continue
 
-            ort_output_names = [node_arg.name for node_arg in ort_session.get_outputs()]
+                ort_output_names = [node_arg.name for node_arg in ort_session.get_outputs()]
             output_buffers = []
             device = "cuda" if use_gpu else "cpu"
             config = AutoConfig.from_pretrained(model_name, cache_dir=cache_dir)
@@ -270,6 +276,22 @@ def run_onnxruntime(
                     else:
                         logger.info(f"Run onnxruntime on {model_name} with input shape {[batch_size, sequence_length]}")
 
+                    if args.throughput:
+                        results += run_throughput_benchmark(
+                            onnx_model_file,
+                            ort_inputs,
+                            {**result_template, "io_binding": False},
+                            repeat_times,
+                            batch_size,
+                            args.concurrency,
+                            use_gpu,
+                            provider,
+                            inter_op_num_threads_list=args.inter_op_num_threads,
+                            warm_up_repeat=max(warm_up_repeat, 1),
+                            enable_mlas_gemm_fastmath_arm64_bfloat16=enable_arm64_bfloat16_fastmath_mlas_gemm,
+                        )
+                        continue
+
                     if disable_ort_io_binding:
                         result = inference_ort(
                             ort_session,
@@ -757,6 +779,40 @@ def parse_arguments():
         help="Threads to use",
     )
 
+    parser.add_argument(
+        "--throughput",
+        required=False,
+        action="store_true",
+        help="Measure throughput of onnxruntime with concurrent requests instead of latency. "
+        "Thread layouts are swept for each concurrency, so --num_threads is not used.",
+    )
+    parser.set_defaults(throughput=False)
+
+    parser.add_argument(
+        "--concurrency",
+        required=False,
+        nargs="+",
+        type=int,
+        default=[1, 2, 4],
+        help="Number of concurrent requests in throughput mode",
+    )
+
+    parser.add_argument(
+        "--inter_op_num_threads",
+        required=False,
+        nargs="+",
+        type=int,
+        default=[1],
+        help="Inter-op threads to sweep in throughput mode. Values larger than 1 use parallel execution mode.",
+    )
+
+    parser.add_argument(
+        "--throughput_csv",
+        required=False,
+        default=None,
+        help="CSV file for saving throughput results.",
+    )
+
     parser.add_argument(
         "--force_num_layers",
         required=False,
@@ -797,6 +853,13 @@ def main():
 
     args.num_threads = sorted({cpu_count if x <= 0 else x for x in args.num_threads})
 
+    if args.throughput:
+        if args.engines != ["onnxruntime"]:
+            logger.error("Throughput mode is for onnxruntime engine only")
+            return
+        # Thread layouts are swept by the throughput test, so run it once.
+        args.num_threads = args.num_threads[:1]
+
     logger.info(f"Arguments: {args}")
 
     if not os.path.exists(args.cache_dir):
@@ -934,6 +997,11 @@ def main():
             logger.warning("No any result available.")
         return
 
+    if args.throughput:
+        csv_filename = args.throughput_csv or f"benchmark_throughput_{time_stamp}.csv"
+        output_throughput_results(results, csv_filename)
+        return
+
     csv_filename = args.detail_csv or f"benchmark_detail_{time_stamp}.csv"
     output_details(results, csv_filename)
 
@@ -9,6 +9,7 @@ import logging
 import os
 import random
 import sys
+import threading
 import time
 import timeit
 from abc import ABC, abstractmethod
@@ -22,12 +23,28 @@ import coloredlogs
 import numpy
 import torch
 import transformers
+from affinity_helper import AffinitySetting
 from packaging import version
 
 import onnxruntime
 
 logger = logging.getLogger(__name__)
 
+THROUGHPUT_COLUMN_NAMES = [
+    "concurrency",
+    "sessions",
+    "threads",
+    "inter_op_threads",
+    "test_times",
+    "QPS",
+    "average_latency_ms",
+    "latency_50_percentile",
+    "latency_90_percentile",
+    "latency_99_percentile",
+    "latency_999_percentile",
+    "cpu_utilization",
+]
+
 
 class Precision(Enum):
     FLOAT32 = "fp32"
@@ -87,6 +104,7 @@ def create_onnxruntime_session(
     verbose=False,
     enable_mlas_gemm_fastmath_arm64_bfloat16=False,
     provider_options={},  # map execution provider name to its option  # noqa: B006
+    inter_op_num_threads=-1,
 ):
     session = None
     try:
@@ -104,6 +122,12 @@ def create_onnxruntime_session(
             sess_options.intra_op_num_threads = num_threads
             logger.debug(f"Session option: intra_op_num_threads={sess_options.intra_op_num_threads}")
 
+        if inter_op_num_threads > 1:
+            # Inter-op threads are only used in parallel execution mode.
+            sess_options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+            sess_options.inter_op_num_threads = inter_op_num_threads
+            logger.debug(f"Session option: inter_op_num_threads={sess_options.inter_op_num_threads}")
+
         if verbose:
             sess_options.log_severity_level = 0
         else:
@@ -385,6 +409,248 @@ def inference_ort_with_io_binding(
     return result
 
 
+def get_throughput_result(latency_list, batch_size, duration, cpu_time, num_cpus):
+    """Get throughput, latency percentiles and CPU utilization of requests that run concurrently.
+
+    Args:
+        latency_list (list): latency in seconds of each request.
+        batch_size (int): batch size of each request.
+        duration (float): wall-clock time in seconds to run all requests.
+        cpu_time (float): CPU time in seconds consumed by this process to run all requests.
+        num_cpus (int): number of CPUs that could be used by this process.
+    """
+    latency_ms = numpy.array(latency_list, dtype=numpy.float64) * 1000.0
+    p50, p90, p99, p999 = numpy.percentile(latency_ms, [50, 90, 99, 99.9])
+    throughput = len(latency_list) * batch_size / duration
+    cpu_utilization = cpu_time / (duration * num_cpus) * 100.0
+
+    return {
+        "test_times": len(latency_list),
+        "QPS": f"{throughput:.2f}",
+        "average_latency_ms": f"{numpy.mean(latency_ms):.2f}",
+        "latency_50_percentile": f"{p50:.2f}",
+        "latency_90_percentile": f"{p90:.2f}",
+        "latency_99_percentile": f"{p99:.2f}",
+        "latency_999_percentile": f"{p999:.2f}",
+        "cpu_utilization": f"{cpu_utilization:.1f}",
+    }
+
+
+def get_available_cpus():
+    """Get sorted list of CPUs that this process could run on."""
+    affinity_setting = AffinitySetting()
+    affinity_setting.get_affinity()
+    if affinity_setting.affinity:
+        return sorted(affinity_setting.affinity)
+    return list(range(os.cpu_count() or 1))
+
+
+def get_cpu_sets(num_sets, cpus=None):
+    """Split CPUs into num_sets disjoint sets of consecutive CPUs, one set per session."""
+    cpus = cpus or get_available_cpus()
+    if num_sets > len(cpus):
+        raise ValueError(f"Cannot split {len(cpus)} CPUs into {num_sets} sets")
+    cpus_per_set = len(cpus) // num_sets
+    return [set(cpus[i * cpus_per_set : (i + 1) * cpus_per_set]) for i in range(num_sets)]
+
+
+def inference_ort_throughput(
+    create_session,
+    ort_inputs,
+    result_template,
+    repeat_times,
+    batch_size,
+    concurrency,
+    per_worker_session=False,
+    cpu_sets=None,
+    warm_up_repeat=0,
+):
+    """Measure throughput of onnxruntime with concurrent requests.
+
+    Each of the concurrency workers is a thread that sends a request right after the previous one completes, until
+    repeat_times requests have been completed in total.
+
+    Args:
+        create_session (Callable): a function without arguments that creates an InferenceSession.
+        ort_inputs (dict): inputs of each request.
+        result_template (dict): fields to add to the result.
+        repeat_times (int): total number of requests to run.
+        batch_size (int): batch size of inputs.
+        concurrency (int): number of requests that run concurrently.
+        per_worker_session (bool): create one session per worker instead of sharing one session among workers.
+        cpu_sets (List[Set[int]], optional): CPUs that each worker and its session could run on. Only used when
+            per_worker_session is True. Threads of a session inherit the affinity of the thread that creates the session.
+        warm_up_repeat (int): number of requests that each worker runs before measurement.
+    """
+    if cpu_sets is not None and (not per_worker_session or len(cpu_sets) != concurrency):
+        raise ValueError("cpu_sets requires per_worker_session, and one CPU set per worker")
+
+    shared_session = None if per_worker_session else create_session()
+    # Workers and the main thread start measurement at the same time.
+    barrier = threading.Barrier(concurrency + 1)
+    request_lock = threading.Lock()
+    remaining_requests = [repeat_times]
+
+    def worker(index):
+        latency_list = []
+        try:
+            if cpu_sets is not None:
+                affinity_setting = AffinitySetting(threading.get_native_id())
+                affinity_setting.affinity = cpu_sets[index]
+                affinity_setting.set_affinity()
+            session = create_session() if shared_session is None else shared_session
+            for _ in range(warm_up_repeat):
+                session.run(None, ort_inputs)
+        except BaseException:
+            barrier.abort()
+            raise
+
+        barrier.wait()
+        while True:
+            with request_lock:
+                if remaining_requests[0] <= 0:
+                    break
+                remaining_requests[0] -= 1
+            start = time.perf_counter()
+            session.run(None, ort_inputs)
+            latency_list.append(time.perf_counter() - start)
+        return latency_list
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(worker, i) for i in range(concurrency)]
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            # Raise the exception of the worker that failed.
+            for future in futures:
+                future.result()
+            raise
+        start_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        latency_list = [latency for future in futures for latency in future.result()]
+        duration = time.perf_counter() - start_time
+        cpu_time = time.process_time() - start_cpu_time
+
+    num_cpus = len(set().union(*cpu_sets)) if cpu_sets is not None else len(get_available_cpus())
+    result = {}
+    result.update(result_template)
+    result.update(
+        {"io_binding": False, "concurrency": concurrency, "sessions": concurrency if per_worker_session else 1}
+    )
+    result.update(get_throughput_result(latency_list, batch_size, duration, cpu_time, num_cpus))
+    return result
+
+
+def get_throughput_configs(concurrency, num_cpus, inter_op_num_threads_list=(1,)):
+    """Get thread layouts to benchmark for a given concurrency.
+
+    When one session is shared by all requests, intra-op threads are swept from num_cpus down to 1 by halving, and
+    combined with each inter-op thread count that fits in num_cpus. When there are enough CPUs, there is also a layout
+    that each request has its own session pinned to num_cpus // concurrency CPUs.
+    """
+    intra_op_candidates = []
+    intra_op_num_threads = num_cpus
+    while intra_op_num_threads >= 1:
+        intra_op_candidates.append(intra_op_num_threads)
+        intra_op_num_threads //= 2
+
+    configs = []
+    for inter_op_num_threads in inter_op_num_threads_list:
+        for intra_op_num_threads in intra_op_candidates:
+            if inter_op_num_threads > 1 and intra_op_num_threads * inter_op_num_threads > num_cpus:
+                continue
+            configs.append(
+                {
+                    "per_worker_session": False,
+                    "intra_op_num_threads": intra_op_num_threads,
+                    "inter_op_num_threads": inter_op_num_threads,
+                }
+            )
+
+    if 1 < concurrency <= num_cpus:
+        configs.append(
+            {
+                "per_worker_session": True,
+                "intra_op_num_threads": num_cpus // concurrency,
+                "inter_op_num_threads": 1,
+            }
+        )
+    return configs
+
+
+def run_throughput_benchmark(
+    onnx_model_path,
+    ort_inputs,
+    result_template,
+    repeat_times,
+    batch_size,
+    concurrency_list,
+    use_gpu=False,
+    provider=None,
+    inter_op_num_threads_list=(1,),
+    warm_up_repeat=1,
+    enable_mlas_gemm_fastmath_arm64_bfloat16=False,
+):
+    """Sweep concurrency and thread layouts, and measure throughput of each configuration.
+
+    Sessions that do not share CPUs are pinned to their own CPU sets. Results are sorted by QPS in descending order.
+    """
+    cpus = get_available_cpus()
+    results = []
+    for concurrency in concurrency_list:
+        for config in get_throughput_configs(concurrency, len(cpus), inter_op_num_threads_list):
+
+            def create_session(config=config):
+                session = create_onnxruntime_session(
+                    onnx_model_path,
+                    use_gpu,
+                    provider,
+                    num_threads=config["intra_op_num_threads"],
+                    inter_op_num_threads=config["inter_op_num_threads"],
+                    enable_mlas_gemm_fastmath_arm64_bfloat16=enable_mlas_gemm_fastmath_arm64_bfloat16,
+                )
+                if session is None:
+                    raise RuntimeError(f"Failed to create session for {onnx_model_path}")
+                return session
+
+            per_worker_session = config["per_worker_session"]
+            config_result_template = {
+                **result_template,
+                "threads": config["intra_op_num_threads"],
+                "inter_op_threads": config["inter_op_num_threads"],
+            }
+            logger.info(f"Run throughput test with concurrency={concurrency} {config}")
+            result = inference_ort_throughput(
+                create_session,
+                ort_inputs,
+                config_result_template,
+                repeat_times,
+                batch_size,
+                concurrency,
+                per_worker_session=per_worker_session,
+                cpu_sets=get_cpu_sets(concurrency, cpus) if per_worker_session and not use_gpu else None,
+                warm_up_repeat=warm_up_repeat,
+            )
+            logger.info(result)
+            results.append(result)
+
+    return sorted(results, key=lambda result: float(result["QPS"]), reverse=True)
+
+
+def output_throughput_results(results, csv_filename):
+    with open(csv_filename, mode="a", newline="", encoding="ascii") as csv_file:
+        column_names = [
+            *[name for name in results[0] if name not in THROUGHPUT_COLUMN_NAMES],
+            *THROUGHPUT_COLUMN_NAMES,
+        ]
+        csv_writer = csv.DictWriter(csv_file, fieldnames=column_names)
+        csv_writer.writeheader()
+        for result in results:
+            csv_writer.writerow(result)
+
+    logger.info(f"Throughput results are saved to csv file: {csv_filename}")
+
+
 def allocateOutputBuffers(output_buffers, output_buffer_max_sizes, device):  # noqa: N802
     # Allocate output tensors with the largest test size needed. So the allocated memory can be reused
     # for each test run.
@@ -903,14 +903,17 @@ def remove_shared_initializers(
     shared_initializers_2 = []
     shared_initializers_names = []
 
+    # Bucket initializers of graph 2 by data type and shape, so that only initializers in same bucket are compared.
+    buckets_2 = {}
+    for initializer2 in graph2.initializer:
+        if initializer2.dims and sum(initializer2.dims) >= min_elements:
+            buckets_2.setdefault((initializer2.data_type, tuple(initializer2.dims)), []).append(initializer2)
+
     for initializer1 in graph1.initializer:
         if not (initializer1.dims and sum(initializer1.dims) >= min_elements):
             continue
 
-        for initializer2 in graph2.initializer:
-            if not (initializer2.dims and sum(initializer2.dims) >= min_elements):
-                continue
-
+        for initializer2 in buckets_2.get((initializer1.data_type, tuple(initializer1.dims)), []):
             if OnnxModel.has_same_value(initializer1, initializer2, signature_cache1, signature_cache2):
                 mapping_initializers_1[initializer1.name] = shared_prefix + initializer2.name
                 shared_initializers_1.append(initializer1)
@@ -16,10 +16,13 @@ import itertools
 import logging
 import os
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import onnx
-from onnx import AttributeProto, GraphProto, ModelProto, NodeProto, TensorProto, helper, numpy_helper
+from onnx import AttributeProto, GraphProto, ModelProto, NodeProto, TensorProto, helper
+from onnx.external_data_helper import ExternalDataInfo
 from onnx.shape_inference import infer_shapes, infer_shapes_path
 from packaging import version
 
@@ -33,50 +36,201 @@ def _npfloat16_to_int(np_list):
     :param np_list: numpy float16 list
     :return int_list: python int list
     """
-    return [int(bin(_.view("H"))[2:].zfill(16), 2) for _ in np_list]
+    return np.asarray(np_list, dtype=np.float16).view(np.uint16).tolist()
 
 
-def convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0):
-    """
-    Convert float32 numpy array to float16 without changing sign or finiteness.
-    Positive values less than min_positive_val are mapped to min_positive_val.
-    Positive finite values greater than max_finite_val are mapped to max_finite_val.
-    Similar for negative values. NaN, 0, inf, and -inf are unchanged.
-    """
+# Number of elements converted at a time, which bounds the size of temporary arrays during conversion.
+_CONVERT_CHUNK_SIZE = 1 << 20
+
 
-    def between(a, b, c):
-        return np.logical_and(a < b, b < c)
+def _convert_chunk_to_float16(chunk, out, min_positive_val, max_finite_val):
+    """Clip magnitude of a float array chunk to [min_positive_val, max_finite_val] and cast it to float16 in out."""
+    magnitude = np.abs(chunk)
+    # NaN is kept by clip, and sign is restored by copysign.
+    np.clip(magnitude, min_positive_val, max_finite_val, out=magnitude)
+    np.copysign(magnitude, chunk, out=magnitude)
+    # 0, inf and -inf are unchanged.
+    np.copyto(magnitude, chunk, where=np.logical_or(chunk == 0, np.isinf(chunk)))
+    out[...] = magnitude
 
-    if np_array[np.where(np_array > 0)].shape[0] > 0:
-        positive_max = np_array[np.where(np_array > 0)].max()
-        positive_min = np_array[np.where(np_array > 0)].min()
+
+def _log_float16_truncation(np_array, min_positive_val, max_finite_val):
+    positive = np_array[np_array > 0]
+    if positive.size > 0:
+        positive_max = positive.max()
+        positive_min = positive.min()
         if positive_max >= max_finite_val:
             logger.debug(f"the float32 number {positive_max} will be truncated to {max_finite_val}")
         if positive_min <= min_positive_val:
             logger.debug(f"the float32 number {positive_min} will be truncated to {min_positive_val}")
 
-    if np_array[np.where(np_array < 0)].shape[0] > 0:
-        negative_max = np_array[np.where(np_array < 0)].max()
-        negative_min = np_array[np.where(np_array < 0)].min()
+    negative = np_array[np_array < 0]
+    if negative.size > 0:
+        negative_max = negative.max()
+        negative_min = negative.min()
         if negative_min <= -max_finite_val:
             logger.debug(f"the float32 number {negative_min} will be truncated to {-max_finite_val}")
         if negative_max >= -min_positive_val:
             logger.debug(f"the float32 number {negative_max} will be truncated to {-min_positive_val}")
 
-    np_array = np.where(between(0, np_array, min_positive_val), min_positive_val, np_array)
-    np_array = np.where(between(-min_positive_val, np_array, 0), -min_positive_val, np_array)
-    np_array = np.where(between(max_finite_val, np_array, float("inf")), max_finite_val, np_array)
-    np_array = np.where(between(float("-inf"), np_array, -max_finite_val), -max_finite_val, np_array)
-    return np.float16(np_array)
 
+def convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0, out=None):
+    """
+    Convert float32 numpy array to float16 without changing sign or finiteness.
+    Positive values less than min_positive_val are mapped to min_positive_val.
+    Positive finite values greater than max_finite_val are mapped to max_finite_val.
+    Similar for negative values. NaN, 0, inf, and -inf are unchanged.
+
+    The array is converted chunk by chunk, so the extra memory is the float16 result plus one chunk of temporaries.
+    The result is written to out (a float16 array of same shape) when it is given.
+    """
+    np_array = np.asarray(np_array)
+    if logger.isEnabledFor(logging.DEBUG):
+        _log_float16_truncation(np_array, min_positive_val, max_finite_val)
+
+    if out is None:
+        out = np.empty(np_array.shape, dtype=np.float16)
+    flat_array = np_array.reshape(-1)
+    flat_out = out.reshape(-1)
+    for start in range(0, flat_array.size, _CONVERT_CHUNK_SIZE):
+        end = start + _CONVERT_CHUNK_SIZE
+        _convert_chunk_to_float16(flat_array[start:end], flat_out[start:end], min_positive_val, max_finite_val)
+    return out
+
+
+class ExternalDataWriter:
+    """Write tensor data to an external data file, so that converted tensors need not be held in memory.
 
-def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finite_val=65504.0):
+    Tensors can be written from multiple threads. Each tensor gets its own region of the file, which starts at an
+    offset aligned to `align` bytes.
+    """
+
+    def __init__(self, base_dir: str, location: str, size_threshold: int = 1024, align: int = 4096):
+        """
+        Args:
+            base_dir (str): directory of the model file.
+            location (str): path of the external data file relative to base_dir.
+            size_threshold (int, optional): only tensors with data size >= size_threshold bytes are written.
+                                            Defaults to 1024.
+            align (int, optional): alignment of tensor data offsets in the file. Defaults to 4096.
+        """
+        self.base_dir = base_dir
+        self.location = location
+        self.size_threshold = size_threshold
+        self.align = align
+        self._file = None  # the file is created when the first tensor is written
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.base_dir, self.location)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def should_write(self, nbytes: int) -> bool:
+        return nbytes >= self.size_threshold
+
+    def reserve(self, tensor: TensorProto, nbytes: int) -> int:
+        """Reserve a region of the file for data of a tensor, and point the tensor to it. Returns offset of the region."""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "wb")  # noqa: SIM115
+            offset = -(-self._size // self.align) * self.align
+            self._size = offset + nbytes
+            tensor.ClearField("raw_data")
+            del tensor.external_data[:]
+            for key, value in [("location", self.location), ("offset", offset), ("length", nbytes)]:
+                entry = tensor.external_data.add()
+                entry.key = key
+                entry.value = str(value)
+            tensor.data_location = TensorProto.EXTERNAL
+        return offset
+
+    def write(self, offset: int, data: np.ndarray):
+        with self._lock:
+            self._file.seek(offset)
+            self._file.write(np.ascontiguousarray(data).data)
+
+
+def _get_all_tensors(graph):
+    """Get initializers and tensors in node attributes of a graph and its subgraphs."""
+    yield from graph.initializer
+    for node in graph.node:
+        for attr in node.attribute:
+            if attr.HasField("t"):
+                yield attr.t
+            yield from attr.tensors
+            if attr.HasField("g"):
+                yield from _get_all_tensors(attr.g)
+            for subgraph in attr.graphs:
+                yield from _get_all_tensors(subgraph)
+
+
+def _get_external_data_path(tensor, base_dir):
+    if tensor.data_location != TensorProto.EXTERNAL:
+        return None
+    return os.path.abspath(os.path.join(base_dir, ExternalDataInfo(tensor).location))
+
+
+def _copy_external_data(tensor, base_dir, external_data_writer):
+    """Copy external data of a tensor to the file of external data writer chunk by chunk."""
+    info = ExternalDataInfo(tensor)
+    path = os.path.join(base_dir, info.location)
+    offset = info.offset or 0
+    length = info.length if info.length is not None else os.path.getsize(path) - offset
+    target_offset = external_data_writer.reserve(tensor, length)
+    if length > 0:
+        data = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(length,))
+        chunk_bytes = _CONVERT_CHUNK_SIZE * 4
+        for start in range(0, length, chunk_bytes):
+            external_data_writer.write(target_offset + start, data[start : start + chunk_bytes])
+
+
+def _get_float_array(tensor, base_dir):
+    """Get float data of a tensor. External data is memory mapped instead of loaded."""
+    if tensor.float_data:
+        return np.array(tensor.float_data)
+    if tensor.raw_data:
+        return np.frombuffer(tensor.raw_data, dtype="float32")
+    if tensor.data_location == TensorProto.EXTERNAL:
+        info = ExternalDataInfo(tensor)
+        num_elements = int(np.prod(tensor.dims))
+        if num_elements == 0:
+            return np.empty(0, dtype=np.float32)
+        return np.memmap(
+            os.path.join(base_dir, info.location),
+            dtype=np.float32,
+            mode="r",
+            offset=info.offset or 0,
+            shape=(num_elements,),
+        )
+    return None
+
+
+def convert_tensor_float_to_float16(
+    tensor, min_positive_val=5.96e-08, max_finite_val=65504.0, base_dir="", external_data_writer=None
+):
     """Convert tensor float to float16.
 
     Args:
         tensor (TensorProto): the tensor to convert.
         min_positive_val (float, optional): minimal positive value. Defaults to 1e-7.
         max_finite_val (float, optional): maximal finite value. Defaults to 1e4.
+        base_dir (str, optional): directory of external data of the tensor, which is used when the tensor has external
+                                  data that is not loaded. Defaults to current directory.
+        external_data_writer (ExternalDataWriter, optional): when it is given, float16 data is written to its file
+                                                             chunk by chunk instead of being kept in the tensor.
+                                                             Defaults to None.
 
     Raises:
         ValueError: input type is not TensorProto.
@@ -89,27 +243,40 @@ def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finit
         raise ValueError(f"Expected input type is an ONNX TensorProto but got {type(tensor)}")
 
     if tensor.data_type == TensorProto.FLOAT:
+        float32_array = _get_float_array(tensor, base_dir)
         tensor.data_type = TensorProto.FLOAT16
-        # convert float_data (float type) to float16 and write to int32_data
+        if float32_array is None:
+            return tensor
+
+        nbytes = float32_array.size * 2
+        if external_data_writer is not None and external_data_writer.should_write(nbytes):
+            if logger.isEnabledFor(logging.DEBUG):
+                _log_float16_truncation(float32_array, min_positive_val, max_finite_val)
+            tensor.ClearField("float_data")
+            offset = external_data_writer.reserve(tensor, nbytes)
+            buffer = np.empty(min(float32_array.size, _CONVERT_CHUNK_SIZE), dtype=np.float16)
+            for start in range(0, float32_array.size, _CONVERT_CHUNK_SIZE):
+                chunk = float32_array[start : start + _CONVERT_CHUNK_SIZE]
+                _convert_chunk_to_float16(chunk, buffer[: chunk.size], min_positive_val, max_finite_val)
+                external_data_writer.write(offset + start * 2, buffer[: chunk.size])
+            return tensor
+
+        float16_array = convert_np_to_float16(float32_array, min_positive_val, max_finite_val)
         if tensor.float_data:
-            float16_data = convert_np_to_float16(np.array(tensor.float_data), min_positive_val, max_finite_val)
-            int_list = _npfloat16_to_int(float16_data)
-            tensor.int32_data[:] = int_list
+            # convert float_data (float type) to float16 and write to int32_data
+            tensor.int32_data[:] = _npfloat16_to_int(float16_array)
             tensor.float_data[:] = []
-        # convert raw_data (bytes type)
-        if tensor.raw_data:
-            # convert n.raw_data to float
-            float32_list = np.frombuffer(tensor.raw_data, dtype="float32")
-            # convert float to float16
-            float16_list = convert_np_to_float16(float32_list, min_positive_val, max_finite_val)
-            # convert float16 to bytes and write back to raw_data
-            tensor.raw_data = float16_list.tobytes()
+        else:
+            # write float16 bytes to raw_data, and external data is loaded into raw_data.
+            tensor.raw_data = float16_array.tobytes()
+            if tensor.data_location == TensorProto.EXTERNAL:
+                del tensor.external_data[:]
+                tensor.data_location = TensorProto.DEFAULT
     return tensor
 
 
 def make_value_info_from_tensor(tensor):
-    shape = numpy_helper.to_array(tensor).shape
-    return helper.make_tensor_value_info(tensor.name, tensor.data_type, shape)
+    return helper.make_tensor_value_info(tensor.name, tensor.data_type, tensor.dims)
 
 
 DEFAULT_OP_BLOCK_LIST = [
@@ -175,6 +342,9 @@ def convert_float_to_float16(
     force_fp16_initializers=False,
     force_fp16_inputs=None,
     use_bfloat16_as_blocked_nodes_dtype=False,
+    num_threads=None,
+    base_dir=None,
+    external_data_writer=None,
 ):
     """Convert tensor float type in the input ONNX model to tensor float16.
 
@@ -194,6 +364,17 @@ def convert_float_to_float16(
                                        Default to false, which will convert only the one needed to avoid precision loss.
         force_fp16_inputs(Dict[str, List[int]]): Force the conversion of the inputs of some operators to float16, even if
                                                  this script's preference it to keep them in float32.
+        num_threads (int, optional): number of threads to convert initializers. Defaults to None, which will use the
+                                     default of ThreadPoolExecutor.
+        base_dir (str, optional): directory of external data that is not loaded in the model. Defaults to None, which
+                                  will use directory of model path, or current directory for ModelProto.
+        external_data_writer (ExternalDataWriter, optional): write float16 data of initializers to an external data
+                                                             file instead of keeping it in memory. Other tensors with
+                                                             external data are copied to the file, so the converted
+                                                             model does not refer to data of the input model. When
+                                                             model is a path, external data is not loaded, so only the
+                                                             graph and chunks of tensors are held in memory.
+                                                             Defaults to None.
     Raises:
         ValueError: input type is not ModelProto.
 
@@ -209,20 +390,34 @@ def convert_float_to_float16(
 
     if isinstance(model, str):
         model_path = model
+        if base_dir is None:
+            base_dir = os.path.dirname(model_path)
+        # With external data writer, external data is converted from memory mapped file one tensor at a time.
+        load_external_data = external_data_writer is None
         if version.parse(onnx.__version__) >= version.parse("1.8.0") and not disable_shape_infer:
             # shape_infer_model_path should be in the same folder of model_path
             with tempfile.NamedTemporaryFile(dir=os.path.dirname(model_path)) as tmpfile:
                 shape_infer_model_path = tmpfile.name
                 # infer_shapes_path can be used for model >2GB, and infer_shapes cannot.
                 infer_shapes_path(model_path, shape_infer_model_path)
-                model = onnx.load(shape_infer_model_path)
+                model = onnx.load(shape_infer_model_path, load_external_data=load_external_data)
                 disable_shape_infer = True
         else:
-            model = onnx.load(model_path)
+            model = onnx.load(model_path, load_external_data=load_external_data)
 
     if not isinstance(model, ModelProto):
         raise ValueError(f"Expected an ONNX ModelProto but got {type(model)}")
 
+    base_dir = base_dir or ""
+    if external_data_writer is not None:
+        output_path = os.path.abspath(external_data_writer.path)
+        if any(_get_external_data_path(tensor, base_dir) == output_path for tensor in _get_all_tensors(model.graph)):
+            raise ValueError(f"External data of the input model cannot be overwritten: {output_path}")
+        # Tensors of other data types are not converted. Copy their data to the new file.
+        for tensor in _get_all_tensors(model.graph):
+            if tensor.data_location == TensorProto.EXTERNAL and tensor.data_type != TensorProto.FLOAT:
+                _copy_external_data(tensor, base_dir, external_data_writer)
+
     func_infer_shape = None
     if not disable_shape_infer and version.parse(onnx.__version__) >= version.parse("1.2.0"):
         try:
@@ -383,9 +578,15 @@ def convert_float_to_float16(
                 next_level.append(q.g)
                 for n in q.graphs:
                     next_level.append(n)  # noqa: PERF402
-                q.t.CopyFrom(convert_tensor_float_to_float16(q.t, min_positive_val, max_finite_val))
+                q.t.CopyFrom(
+                    convert_tensor_float_to_float16(
+                        q.t, min_positive_val, max_finite_val, base_dir, external_data_writer
+                    )
+                )
                 for n in q.tensors:
-                    n = convert_tensor_float_to_float16(n, min_positive_val, max_finite_val)  # noqa: PLW2901
+                    n = convert_tensor_float_to_float16(  # noqa: PLW2901
+                        n, min_positive_val, max_finite_val, base_dir, external_data_writer
+                    )
             # if q is graph, process input, output and value_info (ValueInfoProto)
             if isinstance(q, GraphProto):
                 # Note that float initializers tracked by fp32_initializers will be processed later.
@@ -404,15 +605,28 @@ def convert_float_to_float16(
 
         queue = next_level
 
-    for value in fp32_initializers.values():
-        # By default, to avoid precision loss, do not convert an initializer to fp16 when it is used only by fp32 nodes.
-        if force_fp16_initializers or value.fp16_nodes:
-            value.initializer = convert_tensor_float_to_float16(value.initializer, min_positive_val, max_finite_val)
-            value_info_list.append(make_value_info_from_tensor(value.initializer))
-            if value.fp32_nodes and not force_fp16_initializers:
-                logger.info(
-                    f"initializer is used by both fp32 and fp16 nodes. Consider add these nodes to block list:{value.fp16_nodes}"
-                )
+    # By default, to avoid precision loss, do not convert an initializer to fp16 when it is used only by fp32 nodes.
+    fp16_initializers = [value for value in fp32_initializers.values() if force_fp16_initializers or value.fp16_nodes]
+
+    def convert_initializer(value):
+        convert_tensor_float_to_float16(
+            value.initializer, min_positive_val, max_finite_val, base_dir, external_data_writer
+        )
+
+    # Initializers are converted in parallel since numpy releases GIL during conversion.
+    if num_threads == 1 or len(fp16_initializers) <= 1:
+        for value in fp16_initializers:
+            convert_initializer(value)
+    else:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(convert_initializer, fp16_initializers))
+
+    for value in fp16_initializers:
+        value_info_list.append(make_value_info_from_tensor(value.initializer))
+        if value.fp32_nodes and not force_fp16_initializers:
+            logger.info(
+                f"initializer is used by both fp32 and fp16 nodes. Consider add these nodes to block list:{value.fp16_nodes}"
+            )
 
     # Some operators have data type fixed as float for some input. Add a float16 to float cast for those inputs.
     for node in mixed_float_type_node_list:
@@ -477,9 +691,46 @@ def convert_float_to_float16(
                     # change current node's input name
                     node.output[i] = input_name
                     break
+
+    if external_data_writer is not None:
+        # Float tensors not converted still refer to external data of the input model. Copy their data to the new file.
+        for tensor in _get_all_tensors(model.graph):
+            if tensor.data_location == TensorProto.EXTERNAL and tensor.data_type == TensorProto.FLOAT:
+                _copy_external_data(tensor, base_dir, external_data_writer)
     return model
 
 
+def convert_float_to_float16_out_of_core(model_path, output_path, location=None, size_threshold=1024, **kwargs):
+    """Convert an ONNX model file to float16 and save it with external data, without loading weights into memory.
+
+    The graph is converted in memory, while tensors with external data are converted one at a time from memory mapped
+    input data file to the new data file. Tensors that are not converted are copied to the new data file. This could
+    convert models larger than 2GB with memory for the graph and a few chunks of tensors.
+
+    Args:
+        model_path (str): path of the input model. It could have external data.
+        output_path (str): path of the output model.
+        location (str, optional): path of the external data file relative to directory of output_path.
+                                  Defaults to None, which will use file name of output_path plus ".data".
+        size_threshold (int, optional): tensors with data size >= size_threshold bytes are saved to external data
+                                        file. Defaults to 1024.
+        kwargs: other parameters of convert_float_to_float16, like keep_io_types, op_block_list or
+                use_bfloat16_as_blocked_nodes_dtype.
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    if location is None:
+        location = os.path.basename(output_path) + ".data"
+
+    with ExternalDataWriter(output_dir, location, size_threshold) as external_data_writer:
+        model = convert_float_to_float16(
+            model_path,
+            base_dir=os.path.dirname(model_path),
+            external_data_writer=external_data_writer,
+            **kwargs,
+        )
+    onnx.save_model(model, output_path)
+
+
 def float_to_float16_max_diff(tensor, min_positive_val=5.96e-08, max_finite_val=65504.0):
     """Measure the maximum absolute difference after converting a float tensor to float16."""
     if not isinstance(tensor, TensorProto):
@@ -497,5 +748,11 @@ def float_to_float16_max_diff(tensor, min_positive_val=5.96e-08, max_finite_val=
     if float32_data is None:
         raise RuntimeError("external data not loaded!")
 
-    float16_data = convert_np_to_float16(float32_data, min_positive_val, max_finite_val)
-    return np.amax(np.abs(float32_data - np.float32(float16_data)))
+    max_diff = None
+    float16_chunk = np.empty(min(float32_data.size, _CONVERT_CHUNK_SIZE), dtype=np.float16)
+    for start in range(0, float32_data.size, _CONVERT_CHUNK_SIZE):
+        chunk = float32_data[start : start + _CONVERT_CHUNK_SIZE]
+        _convert_chunk_to_float16(chunk, float16_chunk[: chunk.size], min_positive_val, max_finite_val)
+        chunk_max_diff = np.amax(np.abs(chunk - np.float32(float16_chunk[: chunk.size])))
+        max_diff = chunk_max_diff if max_diff is None else np.maximum(max_diff, chunk_max_diff)
+    return max_diff
@@ -2,6 +2,7 @@
 # Copyright (c) Microsoft Corporation.  All rights reserved.
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
+import time
 from collections import defaultdict
 from collections.abc import Sequence
 from logging import getLogger
@@ -59,6 +60,10 @@ class Fusion:
         It searched nodes of given operators, and start fusion on each of those nodes.
         """
         logger.debug(f"start {self.description} fusion...")
+        start_time = time.perf_counter()
+        # Fusions might edit nodes directly, so the index of the model is refreshed before and after each pass.
+        # Within a pass, it is kept up to date by methods of the model like remove_node and add_node.
+        self.model.refresh_graph_index()
         input_name_to_nodes = self.model.input_name_to_nodes()
         output_name_to_node = self.model.output_name_to_node()
 
@@ -70,17 +75,20 @@ class Fusion:
                     raise Exception("Can not find node in any graph")
                 self.this_graph_name = graph.name
                 self.fuse(node, input_name_to_nodes, output_name_to_node)
+        match_latency = time.perf_counter() - start_time
 
         op_list = [node.op_type for node in self.nodes_to_add]
         if self.fused_count:
-            for key, value in self.fused_count.items():
-                if value:
-                    logger.info(f"Fused {key}: {value}")
+            fused_count = {key: value for key, value in self.fused_count.items() if value}
         else:
             count = op_list.count(self.fused_op_type)
-            if count > 0:
-                logger.info(f"Fused {self.description}: {count}")
+            fused_count = {self.description: count} if count > 0 else {}
+        for key, value in fused_count.items():
+            logger.info(f"Fused {key}: {value}")
 
+        # The changes of this pass are recorded in the index of the model, so that the cleanup below only
+        # visits the affected region of the graph.
+        self.model.refresh_graph_index()
         self.model.remove_nodes(self.nodes_to_remove)
         self.model.add_nodes(self.nodes_to_add, self.node_name_to_graph_name)
 
@@ -89,6 +97,22 @@ class Fusion:
         elif self.nodes_to_remove or self.nodes_to_add:
             self.model.update_graph()
 
+        latency = time.perf_counter() - start_time
+        self.model.fusion_pass_stats.append(
+            {
+                "fusion": self.description,
+                "fused_count": fused_count,
+                "nodes_removed": len(self.nodes_to_remove),
+                "nodes_added": len(self.nodes_to_add),
+                "match_latency": match_latency,
+                "latency": latency,
+            }
+        )
+        logger.debug(
+            f"{self.description} fusion: removed {len(self.nodes_to_remove)} nodes, added {len(self.nodes_to_add)} "
+            f"nodes in {latency * 1000:.1f} ms (match {match_latency * 1000:.1f} ms)"
+        )
+
     def add_initializer(self, name: str, data_type: int, dims: Sequence[int], vals: Any, raw: bool = True):
         if raw:
             np_type = helper.tensor_dtype_to_np_dtype(data_type)
@@ -3,11 +3,13 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 
+import hashlib
 import itertools
 import logging
+import mmap
 import os
 import sys
-from collections import deque
+from collections import Counter, deque
 from pathlib import Path
 
 from float16 import convert_float_to_float16
@@ -22,8 +24,9 @@ from onnx import (
     numpy_helper,
     save_model,
 )
-from onnx.external_data_helper import load_external_data_for_tensor, uses_external_data
+from onnx.external_data_helper import ExternalDataInfo, uses_external_data
 from shape_infer_helper import SymbolicShapeInferenceHelper
+from symbolic_shape_infer import topological_sort_nodes
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +47,164 @@ class OnnxModel:
         # Note that these do not cache the symbolic shape inference result.
         self._dtype_dict: dict[str, int] | None = None
         self._shape_dict: dict[str, list] | None = None
+        # Inference results of nodes shared by shape inference helpers, so that repeated shape inference after
+        # fusions only need to infer nodes with changed inputs.
+        self._shape_infer_node_cache: dict = {}
+
+        # Producer/consumer index of all graphs. It is built on demand, and kept up to date by the methods that
+        # add, remove or rewire nodes (like add_node, remove_node and replace_input_of_all_nodes).
+        # Code that edits node inputs/outputs or graph.node directly shall call invalidate_graph_index() afterwards.
+        self._input_name_to_nodes: dict[str, list[NodeProto]] | None = None
+        self._output_name_to_node: dict[str, NodeProto] | None = None
+        # Other nodes that produce the same output. Like a full rebuild, the last node in graphs is the producer.
+        self._shadowed_producers: dict[str, list[NodeProto]] = {}
+        # Key is id() of node. The value holds a reference to the node so that the id stays valid, the graph,
+        # the order of the node in graphs, and the inputs/outputs of the node when it was indexed.
+        self._node_index: dict[int, tuple[NodeProto, GraphProto, tuple[int, int], list[str], list[str]]] | None = None
+        self._next_node_order: int = 0
+
+        # Names of values whose producer or consumers have changed since the graph was last pruned, so that
+        # prune_graph and update_graph only need visit the affected region. It is None when the graph might have
+        # been changed without being tracked (like when the index is rebuilt), and then the whole graph is visited.
+        self._dirty_names: set[str] | None = None
+        # Names of inputs, outputs and initializers of the main graph when it was last pruned.
+        self._pruned_graph_names: set[str] = set()
+
+        # Statistics of fusion passes (like fused operator count and latency) in the order they are applied.
+        self.fusion_pass_stats: list[dict] = []
+
+    def invalidate_graph_index(self):
+        """Drop the producer/consumer index. It shall be called after editing nodes without the methods of this class.
+        The index will be rebuilt on next use.
+        """
+        self._input_name_to_nodes = None
+        self._output_name_to_node = None
+        self._shadowed_producers = {}
+        self._node_index = None
+
+    def refresh_graph_index(self):
+        """Update the index for nodes whose inputs or outputs were edited directly. It is much faster than a rebuild
+        on large graphs. The index is rebuilt on next use when nodes were added to or removed from graphs directly.
+        """
+        if self._node_index is None:
+            return
+
+        num_nodes = 0
+        edited = []
+        get_entry = self._node_index.get
+        for graph in self.graphs():
+            for node in graph.node:
+                entry = get_entry(id(node))
+                if entry is None or entry[0] is not node or entry[1] is not graph:
+                    self.invalidate_graph_index()
+                    return
+                if entry[3] != node.input or entry[4] != node.output:
+                    edited.append(entry)
+            num_nodes += len(graph.node)
+
+        if num_nodes != len(self._node_index):
+            self.invalidate_graph_index()
+            return
+
+        for node, graph, order, _, _ in edited:
+            self._unindex_node(node)
+            self._index_node(node, graph, order)
+
+    def _build_graph_index(self):
+        self._dirty_names = None
+        self._input_name_to_nodes = {}
+        self._output_name_to_node = {}
+        self._shadowed_producers = {}
+        self._node_index = {}
+        for graph_order, graph in enumerate(self.graphs()):
+            for node_order, node in enumerate(graph.node):
+                self._index_node(node, graph, (graph_order, node_order))
+        self._next_node_order = len(self.model.graph.node)
+
+    def _index_node(self, node: NodeProto, graph: GraphProto, order: tuple[int, int]):
+        inputs = list(node.input)
+        outputs = list(node.output)
+        self._node_index[id(node)] = (node, graph, order, inputs, outputs)
+        if self._dirty_names is not None:
+            if any(outputs):
+                self._dirty_names.update(outputs)
+            else:
+                # A node without output could only be found by a full traversal.
+                self._dirty_names = None
+        for input_name in inputs:
+            if input_name:  # could be empty when it is optional
+                # Lists are replaced instead of updated in place since they are shared with snapshots.
+                # Consumers are sorted by the order of nodes in graphs, like a full rebuild would do.
+                consumers = self._input_name_to_nodes.get(input_name)
+                if consumers is None:
+                    self._input_name_to_nodes[input_name] = [node]
+                else:
+                    i = len(consumers)
+                    while i > 0 and self._node_order(consumers[i - 1]) > order:
+                        i -= 1
+                    self._input_name_to_nodes[input_name] = [*consumers[:i], node, *consumers[i:]]
+        for output_name in outputs:
+            if output_name:
+                producer = self._output_name_to_node.get(output_name)
+                if producer is not None and producer is not node:
+                    # Fusions might add a node that reuses output name of a node to be removed.
+                    shadowed = self._shadowed_producers.setdefault(output_name, [])
+                    if self._node_order(producer) > order:
+                        shadowed.append(node)
+                        continue
+                    shadowed.append(producer)
+                self._output_name_to_node[output_name] = node
+
+    def _unindex_node(self, node: NodeProto):
+        _, _, _, inputs, outputs = self._node_index.pop(id(node))
+        if self._dirty_names is not None:
+            self._dirty_names.update(inputs, node.input, outputs, node.output)
+        # Also look at current inputs and outputs in case they were updated together with a snapshot
+        # returned by input_name_to_nodes() (like FusionUtils.update_node_input), which shares the lists.
+        for input_name in set(inputs).union(node.input):
+            consumers = self._input_name_to_nodes.get(input_name)
+            if consumers is not None:
+                consumers = [consumer for consumer in consumers if consumer is not node]
+                if consumers:
+                    self._input_name_to_nodes[input_name] = consumers
+                else:
+                    del self._input_name_to_nodes[input_name]
+        for output_name in set(outputs).union(node.output):
+            shadowed = [producer for producer in self._shadowed_producers.pop(output_name, []) if producer is not node]
+            if self._output_name_to_node.get(output_name) is node:
+                if shadowed:
+                    producer = max(shadowed, key=self._node_order)
+                    shadowed = [other for other in shadowed if other is not producer]
+                    self._output_name_to_node[output_name] = producer
+                else:
+                    del self._output_name_to_node[output_name]
+            if shadowed:
+                self._shadowed_producers[output_name] = shadowed
+
+    def _node_order(self, node: NodeProto) -> tuple[int, int]:
+        entry = self._node_index.get(id(node))
+        # Nodes that are not indexed (like those appended to a shared list by a caller) are treated as the last ones.
+        return entry[2] if entry is not None and entry[0] is node else (sys.maxsize, 0)
+
+    def _find_indexed_node(self, node: NodeProto):
+        """Get the index entry of a node. The node could also be a copy of a node in graphs."""
+        if self._node_index is None:
+            self._build_graph_index()
+
+        entry = self._node_index.get(id(node))
+        if entry is not None and entry[0] is node:
+            return entry
+
+        for graph in self.graphs():
+            for existing_node in graph.node:
+                if existing_node == node:
+                    entry = self._node_index.get(id(existing_node))
+                    if entry is None:
+                        # The graph has been changed directly.
+                        self._build_graph_index()
+                        entry = self._node_index[id(existing_node)]
+                    return entry
+        return None
 
     def disable_shape_inference(self):
         self.enable_shape_infer = False
@@ -51,7 +212,9 @@ class OnnxModel:
     def infer_runtime_shape(self, dynamic_axis_mapping={}, update=False):  # noqa: B006
         if self.enable_shape_infer:
             if self.shape_infer_helper is None or update:
-                self.shape_infer_helper = SymbolicShapeInferenceHelper(self.model)
+                self.shape_infer_helper = SymbolicShapeInferenceHelper(
+                    self.model, node_cache=self._shape_infer_node_cache
+                )
 
             try:
                 if self.shape_infer_helper.infer(dynamic_axis_mapping):
@@ -62,9 +225,25 @@ class OnnxModel:
 
         return None
 
+    def _get_input_name_to_nodes(self) -> dict[str, list[NodeProto]]:
+        """Get the index from input name to consumer nodes. It shall not be modified by caller."""
+        if self._input_name_to_nodes is None:
+            self._build_graph_index()
+        return self._input_name_to_nodes
+
+    def _get_output_name_to_node(self) -> dict[str, NodeProto]:
+        """Get the index from output name to producer node. It shall not be modified by caller."""
+        if self._output_name_to_node is None:
+            self._build_graph_index()
+        return self._output_name_to_node
+
     def input_name_to_nodes(self, exclude_subgraphs=False):
+        if not exclude_subgraphs:
+            # Return a snapshot of the index, which is much faster than traversing the graphs.
+            return dict(self._get_input_name_to_nodes())
+
         input_name_to_nodes = {}
-        nodes_to_search = self.nodes() if not exclude_subgraphs else self.model.graph.node
+        nodes_to_search = self.model.graph.node
         for node in nodes_to_search:
             for input_name in node.input:
                 if input_name:  # could be empty when it is optional
@@ -75,8 +254,11 @@ class OnnxModel:
         return input_name_to_nodes
 
     def output_name_to_node(self, exclude_subgraphs=False):
+        if not exclude_subgraphs:
+            return dict(self._get_output_name_to_node())
+
         output_name_to_node = {}
-        nodes_to_search = self.nodes() if not exclude_subgraphs else self.model.graph.node
+        nodes_to_search = self.model.graph.node
         for node in nodes_to_search:
             for output_name in node.output:
                 if output_name:  # could be empty when it is optional
@@ -131,10 +313,8 @@ class OnnxModel:
         return output_names
 
     def get_graph_by_node(self, node):
-        for graph in self.graphs():
-            if node in graph.node:
-                return graph
-        return None
+        entry = self._find_indexed_node(node)
+        return entry[1] if entry is not None else None
 
     def get_graph_by_name(self, graph_name):
         for graph in self.graphs():
@@ -150,27 +330,47 @@ class OnnxModel:
         return len(graph.node)
 
     def remove_node(self, node):
-        for graph in self.graphs():
-            if node in graph.node:
-                graph.node.remove(node)
-                return
-        logger.warning("Failed to remove node %s", node)  # It might be a bug to hit this line.
+        self.remove_nodes([node])
 
     def remove_nodes(self, nodes_to_remove):
+        entries = {}
         for node in nodes_to_remove:
-            self.remove_node(node)
+            entry = self._find_indexed_node(node)
+            if entry is None or id(entry[0]) in entries:
+                logger.warning("Failed to remove node %s", node)  # It might be a bug to hit this line.
+                continue
+            entries[id(entry[0])] = entry
+
+        # Delete nodes by position in one scan of each graph. It is much faster than graph.node.remove(node),
+        # which compares the node with every node before it. Note that entries hold the nodes so ids are valid.
+        graph_nodes = {}
+        for entry in entries.values():
+            self._unindex_node(entry[0])
+            graph_nodes.setdefault(id(entry[1]), (entry[1], set()))[1].add(id(entry[0]))
+        for graph, node_ids in graph_nodes.values():
+            positions = [i for i, node in enumerate(graph.node) if id(node) in node_ids]
+            for i in reversed(positions):
+                del graph.node[i]
 
     def add_node(self, node, graph_name=None):
         if graph_name is None or graph_name == self.model.graph.name:
-            self.model.graph.node.extend([node])
+            self.add_nodes([node])
         else:
             graph = self.get_graph_by_name(graph_name)
             insert_idx = self.get_topological_insert_id(graph, node.output)
             graph.node.insert(insert_idx, node)
+            # It is rare to add node to subgraph, so we rebuild the index instead of reordering nodes in the index.
+            self.invalidate_graph_index()
 
     def add_nodes(self, nodes_to_add, node_name_to_graph_name=None):
         if node_name_to_graph_name is None:
-            self.model.graph.node.extend(nodes_to_add)
+            graph = self.model.graph
+            graph.node.extend(nodes_to_add)
+            if self._node_index is not None:
+                # Nodes are copied into the graph, so we index the copies.
+                for i in range(len(graph.node) - len(nodes_to_add), len(graph.node)):
+                    self._index_node(graph.node[i], graph, (0, self._next_node_order))
+                    self._next_node_order += 1
         else:
             for node in nodes_to_add:
                 graph_name = node_name_to_graph_name[node.name]
@@ -198,8 +398,12 @@ class OnnxModel:
                 node.input[j] = new_input_name
 
     def replace_input_of_all_nodes(self, old_input_name, new_input_name):
-        for node in self.nodes():
-            OnnxModel.replace_node_input(node, old_input_name, new_input_name)
+        for node in self._get_input_name_to_nodes().get(old_input_name, []):
+            entry = self._node_index.get(id(node))
+            if entry is not None and entry[0] is node:
+                self._unindex_node(node)
+                OnnxModel.replace_node_input(node, old_input_name, new_input_name)
+                self._index_node(node, entry[1], entry[2])
 
     @staticmethod
     def replace_node_output(node, old_output_name, new_output_name):
@@ -215,8 +419,16 @@ class OnnxModel:
         #        +----[old_name]--> Transpose -->
         # If we want to remove the Cast node: replace output of Add to new_name is not enough;
         # The input of Transpose shall also be updated to new_name.
-        for node in self.model.graph.node:
-            OnnxModel.replace_node_output(node, old_output_name, new_output_name)
+        producer = self._get_output_name_to_node().get(old_output_name)
+        if producer is None:
+            return
+        # All nodes of main graph that produce the output are updated, including the shadowed ones.
+        for node in [producer, *self._shadowed_producers.get(old_output_name, [])]:
+            entry = self._node_index[id(node)]
+            if entry[1] is self.model.graph:
+                self._unindex_node(node)
+                OnnxModel.replace_node_output(node, old_output_name, new_output_name)
+                self._index_node(node, entry[1], entry[2])
 
     def get_initializer(self, name):
         for graph in self.graphs():
@@ -234,7 +446,7 @@ class OnnxModel:
 
     def get_children(self, node, input_name_to_nodes=None, output_index=None):
         if input_name_to_nodes is None:
-            input_name_to_nodes = self.input_name_to_nodes()
+            input_name_to_nodes = self._get_input_name_to_nodes()
 
         children = []
         if output_index is not None:
@@ -251,7 +463,7 @@ class OnnxModel:
 
     def get_parents(self, node, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         parents = []
         for input in node.input:
@@ -261,7 +473,7 @@ class OnnxModel:
 
     def get_parent(self, node, i, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         if len(node.input) <= i:
             return None
@@ -324,7 +536,7 @@ class OnnxModel:
         assert input_index is None or input_index >= 0
 
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         if input_index is None:
             parent, index = self.match_first_parent(node, parent_op_type, output_name_to_node, exclude)
@@ -394,7 +606,7 @@ class OnnxModel:
             assert len(parent_input_index) == len(parent_op_types)
 
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         current_node = node
         matched_parents = []
@@ -467,7 +679,7 @@ class OnnxModel:
                 )
 
         if input_name_to_nodes is None:
-            input_name_to_nodes = self.input_name_to_nodes()
+            input_name_to_nodes = self._get_input_name_to_nodes()
 
         current_node = node
         matched_children = []
@@ -502,7 +714,7 @@ class OnnxModel:
 
     def find_first_parent_by_type(self, node, parent_type, output_name_to_node=None, recursive=True):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         parents = self.get_parents(node, output_name_to_node)
         dq = deque(parents)
@@ -519,11 +731,11 @@ class OnnxModel:
         return None
 
     def get_constant_value(self, output_name):
-        for node in self.get_nodes_by_op_type("Constant"):
-            if node.output[0] == output_name:
-                for att in node.attribute:
-                    if att.name == "value":
-                        return numpy_helper.to_array(att.t)
+        node = self._get_output_name_to_node().get(output_name)
+        if node is not None and node.op_type == "Constant" and node.output[0] == output_name:
+            for att in node.attribute:
+                if att.name == "value":
+                    return numpy_helper.to_array(att.t)
 
         # Fall back to intializer since constant folding might have been applied.
         initializer = self.get_initializer(output_name)
@@ -564,7 +776,7 @@ class OnnxModel:
 
     def get_children_subgraph_nodes(self, root_node, stop_nodes, input_name_to_nodes=None):
         if input_name_to_nodes is None:
-            input_name_to_nodes = self.input_name_to_nodes()
+            input_name_to_nodes = self._get_input_name_to_nodes()
 
         children = input_name_to_nodes[root_node.output[0]]
 
@@ -689,6 +901,8 @@ class OnnxModel:
         if self.enable_shape_infer and shape_infer is None:
             logger.warning("shape inference failed which might impact useless cast node detection.")
 
+        self.invalidate_graph_index()
+
         nodes_to_remove = []
         for node in self.nodes():
             if node.op_type == "Cast":
@@ -703,7 +917,7 @@ class OnnxModel:
             for node in nodes_to_remove:
                 if bool(set(node.output) & graph_output_names):
                     if (not bool(set(node.input) & graph_input_names)) and len(
-                        self.input_name_to_nodes()[node.input[0]]
+                        self._get_input_name_to_nodes()[node.input[0]]
                     ) == 1:
                         self.replace_output_of_all_nodes(node.input[0], node.output[0])
                     else:
@@ -756,6 +970,11 @@ class OnnxModel:
             max_finite_val (float, optional): maximal finite value. Defaults to 1e4.
             force_fp16_inputs(Dict[str, List[int]]): Force the conversion of the inputs of some operators to float16, even if
                                                      this script's preference it to keep them in float32.
+            num_threads (int, optional): number of threads to convert initializers.
+            base_dir (str, optional): directory of external data, when the model is loaded without external data.
+            external_data_writer (ExternalDataWriter, optional): write float16 data of initializers to an external data
+                                                                 file instead of keeping it in memory. See
+                                                                 convert_float_to_float16 in float16.py for details.
         """
         if "keep_io_types" not in kwargs:
             kwargs["keep_io_types"] = True
@@ -808,6 +1027,9 @@ class OnnxModel:
                     "force_fp16_initializers",
                     "force_fp16_inputs",
                     "use_bfloat16_as_blocked_nodes_dtype",
+                    "num_threads",
+                    "base_dir",
+                    "external_data_writer",
                 ]
                 if key in kwargs
             }
@@ -869,7 +1091,7 @@ class OnnxModel:
 
     def get_parent_subgraph_nodes(self, node, stop_nodes, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node = self._get_output_name_to_node()
 
         unique_nodes = []
 
@@ -914,14 +1136,23 @@ class OnnxModel:
         return -1
 
     def remove_unused_constant(self):
-        input_name_to_nodes = self.input_name_to_nodes()
+        # Refresh the index since a node might use the constant after the graph was edited directly.
+        self.refresh_graph_index()
+        input_name_to_nodes = self._get_input_name_to_nodes()
 
         # remove unused constant
         unused_nodes = []
-        nodes = self.nodes()
-        for node in nodes:
-            if node.op_type == "Constant" and node.output[0] not in input_name_to_nodes:
-                unused_nodes.append(node)
+        if self._can_visit_dirty_region():
+            output_name_to_node = self._get_output_name_to_node()
+            for name in self._dirty_names.union(self._get_changed_graph_names()):
+                node = output_name_to_node.get(name)
+                if node is not None and node.op_type == "Constant" and node.output[0] not in input_name_to_nodes:
+                    unused_nodes.append(node)
+        else:
+            nodes = self.nodes()
+            for node in nodes:
+                if node.op_type == "Constant" and node.output[0] not in input_name_to_nodes:
+                    unused_nodes.append(node)
 
         self.remove_nodes(unused_nodes)
 
@@ -953,6 +1184,25 @@ class OnnxModel:
             subgraph_nodes_inputs.update(subgraph_inputs_of_parent_node)
         return subgraph_nodes, subgraph_nodes_inputs
 
+    def _get_graph_names(self) -> set[str]:
+        graph = self.model.graph
+        return {value.name for value in itertools.chain(graph.input, graph.output, graph.initializer)}
+
+    def _get_changed_graph_names(self) -> set[str]:
+        """Get names of inputs, outputs and initializers of the main graph that were added or removed since the
+        graph was last pruned."""
+        return self._get_graph_names().symmetric_difference(self._pruned_graph_names)
+
+    def _can_visit_dirty_region(self) -> bool:
+        """Returns True when all changes since the graph was last pruned are tracked, so that pruning only needs to
+        visit the dirty region. For simplicity, it is only enabled for graph without subgraphs."""
+        return (
+            self._dirty_names is not None
+            and self._node_index is not None
+            and not self._shadowed_producers
+            and len(self.graphs()) == 1
+        )
+
     def prune_graph(self, outputs=None, allow_remove_graph_inputs=True):
         """
         Prune graph to keep only required outputs. It removes unnecessary nodes that are not linked
@@ -960,6 +1210,8 @@ class OnnxModel:
 
         There is also an option to remove graph inputs that are not used to generate any required output.
 
+        When the graph has been pruned before, only the region changed since then is visited.
+
         Args:
             outputs (list): a list of graph outputs to retain. If it is None, all graph outputs will be kept.
             allow_remove_graph_inputs (bool): allow remove graph inputs.
@@ -967,8 +1219,69 @@ class OnnxModel:
 
         keep_outputs = [output.name for output in self.model.graph.output] if outputs is None else outputs
 
+        # Nodes might be edited directly, so the index is refreshed.
+        self.refresh_graph_index()
+        is_incremental = outputs is None and allow_remove_graph_inputs and self._can_visit_dirty_region()
+        if is_incremental:
+            nodes_to_remove = self._get_dead_nodes_in_dirty_region(set(keep_outputs))
+        else:
+            nodes_to_remove = self._get_dead_nodes(keep_outputs)
+            if nodes_to_remove is None:
+                return
+
+        num_nodes_removed = len(nodes_to_remove)
+        self.remove_nodes(nodes_to_remove)
+        if num_nodes_removed > 0 and len(self.graphs()) > 1:
+            self.all_graphs = None  # subgraphs of removed nodes are no longer in the model
+
+        # Remove graph outputs not in list
+        output_to_remove = []
+        if outputs is not None:
+            for output in self.model.graph.output:
+                if output.name not in outputs:
+                    output_to_remove.append(output)
+            for output in output_to_remove:
+                self.model.graph.output.remove(output)
+
+        # Remove graph inputs not used by any node.
+        input_to_remove = []
+        if allow_remove_graph_inputs:
+            input_name_to_nodes = self._get_input_name_to_nodes()
+            if is_incremental:
+                unused_names = {
+                    name
+                    for name in self._dirty_names.union(self._get_changed_graph_names())
+                    if name not in input_name_to_nodes
+                }
+                input_to_remove = [input for input in self.model.graph.input if input.name in unused_names]
+            else:
+                input_to_remove = [input for input in self.model.graph.input if input.name not in input_name_to_nodes]
+            for name in input_to_remove:
+                self.model.graph.input.remove(name)
+
+        if input_to_remove or output_to_remove or num_nodes_removed > 0:
+            removed = []
+            if input_to_remove:
+                removed.append(f"{len(input_to_remove)} inputs")
+            if output_to_remove:
+                removed.append(f"{len(output_to_remove)} outputs")
+            if num_nodes_removed > 0:
+                removed.append(f"{num_nodes_removed} nodes")
+            logger.info("Removed %s", ", ".join(removed))
+
+        self.update_graph()
+
+        # Now the graph is clean, and later changes could be tracked in the index.
+        if outputs is None and allow_remove_graph_inputs and self._node_index is not None:
+            self._dirty_names = set()
+            self._pruned_graph_names = self._get_graph_names()
+
+    def _get_dead_nodes(self, keep_outputs):
+        """Get nodes in the main graph that are not linked to any output in keep_outputs.
+        Returns None when it is not supported.
+        """
         input_name_to_nodes_for_main_graph = self.input_name_to_nodes(exclude_subgraphs=True)
-        output_name_to_node = self.output_name_to_node()
+        output_name_to_node = self._get_output_name_to_node()
 
         def get_first_output(node):
             if node.output[0]:
@@ -983,7 +1296,7 @@ class OnnxModel:
             if len(subgraph_nodes) == 0:
                 # TODO: support other ops such as `BeamSearch` that have subgraphs as op attributes
                 logger.debug("Skip prune_graph since graph has subgraph")
-                return
+                return None
 
             # For graphs with subgraphs, add dangling outputs from parent graph nodes to list of outputs to keep
             for node in self.model.graph.node:
@@ -1015,75 +1328,80 @@ class OnnxModel:
                     if len(name) > 0 and (name in output_name_to_node) and (name not in output_to_node):
                         dq.appendleft(output_name_to_node[name])
 
-        # Keep only those nodes in the output_to_node dictionary.
-        nodes_to_keep = []
-        num_nodes_removed = 0
+        # Remove nodes not in the output_to_node dictionary.
+        nodes_to_remove = []
         for node in self.model.graph.node:
             first_output = get_first_output(node)
             kept_node = output_to_node.get(first_output)
 
             # Need to double check the node since fused node might reuse output name of some nodes to be removed.
             # It is slow to compare whole node, so we compare op_type first to avoid comparing node in most cases.
-            if kept_node and kept_node.op_type == node.op_type and kept_node == node:
-                nodes_to_keep.append(node)
-            else:
-                num_nodes_removed += 1
-
-        self.all_graphs = (
-            None  # to prevent pass-by-copy after ClearField(), forces the use of pass-by-reference instead
-        )
-        self.model.graph.ClearField("node")
-        self.model.graph.node.extend(nodes_to_keep)
-
-        # Remove graph outputs not in list
-        output_to_remove = []
-        if outputs is not None:
-            for output in self.model.graph.output:
-                if output.name not in outputs:
-                    output_to_remove.append(output)
-            for output in output_to_remove:
-                self.model.graph.output.remove(output)
-
-        # Remove graph inputs not used by any node.
-        input_to_remove = []
-        if allow_remove_graph_inputs:
-            input_name_to_nodes = self.input_name_to_nodes()
-            input_to_remove = [input for input in self.model.graph.input if input.name not in input_name_to_nodes]
-            for name in input_to_remove:
-                self.model.graph.input.remove(name)
-
-        if input_to_remove or output_to_remove or num_nodes_removed > 0:
-            removed = []
-            if input_to_remove:
-                removed.append(f"{len(input_to_remove)} inputs")
-            if output_to_remove:
-                removed.append(f"{len(output_to_remove)} outputs")
-            if num_nodes_removed > 0:
-                removed.append(f"{num_nodes_removed} nodes")
-            logger.info("Removed %s", ", ".join(removed))
+            if not (kept_node and kept_node.op_type == node.op_type and kept_node == node):
+                nodes_to_remove.append(node)
+        return nodes_to_remove
+
+    def _get_dead_nodes_in_dirty_region(self, keep_outputs: set[str]):
+        """Get nodes that are no longer linked to any graph output after changes in the dirty region.
+        Since the graph had no such node when it was last pruned, a node could only become dead when its
+        outputs lost consumers, which have been recorded in the dirty region.
+        """
+        input_name_to_nodes = self._get_input_name_to_nodes()
+        output_name_to_node = self._get_output_name_to_node()
+
+        dead_nodes = {}
+        names = [*self._dirty_names, *self._get_changed_graph_names()]
+        while names:
+            node = output_name_to_node.get(names.pop())
+            if node is None or id(node) in dead_nodes:
+                continue
+            if any(
+                output in keep_outputs
+                or any(id(child) not in dead_nodes for child in input_name_to_nodes.get(output, []))
+                for output in node.output
+                if output
+            ):
+                continue
+            dead_nodes[id(node)] = node
+            names.extend(node.input)
 
-        self.update_graph()
+        # Keep the order of nodes in graph.
+        return sorted(dead_nodes.values(), key=self._node_order)
 
     def update_graph(self, verbose=False, allow_remove_graph_inputs=False):
         graph = self.model.graph
 
-        remaining_input_names = set()
-        for node in graph.node:
-            if node.op_type in ["Loop", "Scan", "If"]:
-                # Add input names of nodes in subgraphs
-                subgraph_inputs_of_node = self._get_subgraph_inputs_of_node(node)
-                remaining_input_names.update(subgraph_inputs_of_node)
+        # Nodes might be edited directly, so the index is refreshed.
+        self.refresh_graph_index()
+        if self._can_visit_dirty_region():
+            # Only inputs and initializers whose consumers were changed might become unused.
+            input_name_to_nodes = self._get_input_name_to_nodes()
+            unused_names = {
+                name
+                for name in self._dirty_names.union(self._get_changed_graph_names())
+                if name not in input_name_to_nodes
+            }
+            remaining_input_names = None
+        else:
+            remaining_input_names = set()
+            for node in graph.node:
+                if node.op_type in ["Loop", "Scan", "If"]:
+                    # Add input names of nodes in subgraphs
+                    subgraph_inputs_of_node = self._get_subgraph_inputs_of_node(node)
+                    remaining_input_names.update(subgraph_inputs_of_node)
 
-            if node.op_type != "Constant":
-                remaining_input_names.update(node.input)
-        if verbose:
-            logger.debug(f"remaining input names: {remaining_input_names}")
+                if node.op_type != "Constant":
+                    remaining_input_names.update(node.input)
+            if verbose:
+                logger.debug(f"remaining input names: {remaining_input_names}")
+
+        def is_unused(name):
+            return name in unused_names if remaining_input_names is None else name not in remaining_input_names
 
         # remove graph input that is not used
         inputs_to_remove = []
         if allow_remove_graph_inputs:
             for input in graph.input:
-                if input.name not in remaining_input_names:
+                if is_unused(input.name):
                     inputs_to_remove.append(input)
             for input in inputs_to_remove:
                 graph.input.remove(input)
@@ -1095,7 +1413,7 @@ class OnnxModel:
         weights_to_remove = []
         weights_to_keep = []
         for initializer in graph.initializer:
-            if initializer.name not in remaining_input_names and not self.find_graph_output(initializer.name):
+            if is_unused(initializer.name) and not self.find_graph_output(initializer.name):
                 weights_to_remove.append(initializer)
             else:
                 weights_to_keep.append(initializer.name)
@@ -1128,56 +1446,14 @@ class OnnxModel:
 
     @staticmethod
     def graph_topological_sort(graph, is_deterministic=False):
-        deps_set = set()  # dependency set of all node
-        sorted_node_set = set()  # sorted node set
-        sorted_nodes = []  # initialize sorted_nodes
-
-        initializer_names = [init.name for init in graph.initializer]
-        graph_input_names = [input.name for input in graph.input]
-        input_names = initializer_names + graph_input_names
-
-        if is_deterministic:
-            input_names.sort()
-
-        for input_name in input_names:
-            deps_set.add(input_name)
-
-        sorted_node_set_len = -1
-        graph_nodes = graph.node if not is_deterministic else sorted(graph.node, key=lambda x: x.name)
-
-        last_node_name = None
-        while len(sorted_node_set) != len(graph_nodes):
-            if len(sorted_node_set) == sorted_node_set_len:
-                break
-            sorted_node_set_len = len(sorted_node_set)
-            for node_idx, node in enumerate(graph_nodes):
-                if node_idx in sorted_node_set:
-                    continue
-                input_count = sum(1 for _ in node.input if _)
-                if input_count == 0:
-                    sorted_nodes.append(node)
-                    sorted_node_set.add(node_idx)
-                    for output in node.output:
-                        if output:
-                            deps_set.add(output)
-                    continue
-                failed = False
-                for input_name in node.input:
-                    if input_name and input_name not in deps_set:
-                        failed = True
-                        last_node_name = node.name
-                if not failed:
-                    sorted_nodes.append(node)
-                    sorted_node_set.add(node_idx)
-                    for output in node.output:
-                        if output:
-                            deps_set.add(output)
-                else:
-                    continue
+        known_names = [init.name for init in graph.initializer] + [input.name for input in graph.input]
+        sorted_nodes = topological_sort_nodes(graph.node, known_names, is_deterministic)
 
-        if len(sorted_node_set) != len(graph.node):
+        if len(sorted_nodes) != len(graph.node):
+            sorted_node_ids = {id(node) for node in sorted_nodes}
+            failed_node = next(node for node in graph.node if id(node) not in sorted_node_ids)
             raise RuntimeError(
-                f"Graph is not a DAG: len(sorted_node_set)={len(sorted_node_set)}, len(graph.node)={len(graph.node)}, failed at node {last_node_name}"
+                f"Graph is not a DAG: len(sorted_node_set)={len(sorted_nodes)}, len(graph.node)={len(graph.node)}, failed at node {failed_node.name}"
             )
 
         graph.ClearField("node")
@@ -1188,6 +1464,7 @@ class OnnxModel:
         # for graph in self.graphs():
         #    self.graph_topological_sort(graph)
         OnnxModel.graph_topological_sort(self.model.graph, is_deterministic)
+        self.invalidate_graph_index()
 
     @staticmethod
     def save(
@@ -1305,6 +1582,35 @@ class OnnxModel:
 
         return op_count
 
+    @staticmethod
+    def iterate_tensor_data(tensor: TensorProto, base_dir: str = "", chunk_size: int = 1 << 24):
+        """Iterates the bytes of tensor data in chunks. External data is read through a memory map without
+        loading it into the tensor, so only one chunk is in memory at a time.
+        Args:
+            tensor: a TensorProto object that is not STRING type.
+            base_dir: if external tensor exists, base_dir can help to find the path to it
+            chunk_size: number of bytes in each chunk except the last one.
+        """
+        if uses_external_data(tensor):
+            info = ExternalDataInfo(tensor)
+            with open(os.path.join(base_dir, info.location), "rb") as f:
+                file_size = os.fstat(f.fileno()).st_size
+                offset = info.offset or 0
+                length = info.length if info.length is not None else file_size - offset
+                if offset + length > file_size:
+                    raise ValueError(f"External data of {tensor.name} is out of range of {info.location}")
+                if length == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for start in range(offset, offset + length, chunk_size):
+                        yield data[start : min(start + chunk_size, offset + length)]
+            return
+
+        data = tensor.raw_data if tensor.HasField("raw_data") else numpy_helper.to_array(tensor).tobytes()
+        view = memoryview(data)
+        for start in range(0, len(data), chunk_size):
+            yield view[start : start + chunk_size]
+
     @staticmethod
     def to_data_hash(tensor: TensorProto, base_dir: str = "") -> int:
         """Converts a tensor def object to a hash for data comparison purposes.
@@ -1324,14 +1630,12 @@ class OnnxModel:
         if tensor.data_type == TensorProto.STRING:
             utf8_strings = getattr(tensor, storage_field)
             return hash(tuple(s.decode("utf-8") for s in utf8_strings))
-        # Load raw data from external tensor if it exists
-        if uses_external_data(tensor):
-            load_external_data_for_tensor(tensor, base_dir)
-        if tensor.HasField("raw_data"):
-            return hash(tensor.raw_data)
-        else:
-            np_data = numpy_helper.to_array(tensor)
-            return hash(np_data.tobytes())
+
+        # External data is streamed instead of loaded, so that the digest does not depend on data location.
+        digest = hashlib.blake2b(digest_size=16)
+        for chunk in OnnxModel.iterate_tensor_data(tensor, base_dir):
+            digest.update(chunk)
+        return int.from_bytes(digest.digest(), "little")
 
     @staticmethod
     def has_same_value(
@@ -1339,6 +1643,7 @@ class OnnxModel:
         tensor2: TensorProto,
         signature_cache1: dict | None = None,
         signature_cache2: dict | None = None,
+        base_dir: str = "",
     ) -> bool:
         """Returns True when two tensors have same value.
            Note that name can be different.
@@ -1348,28 +1653,43 @@ class OnnxModel:
             tensor2 (TensorProto): initializer 2
             signature_cache1 (dict): Optional dictionary to store data signatures of tensor1 in order to speed up comparison.
             signature_cache2 (dict): Optional dictionary to store data signatures of tensor2 in order to speed up comparison.
+            base_dir (str): Optional directory of external data files.
         Returns:
             bool: True when two initializers has same value.
         """
+        if tensor1.data_type != tensor2.data_type or tensor1.dims != tensor2.dims:
+            return False
+
         sig1 = (
             signature_cache1[tensor1.name]
             if signature_cache1 and tensor1.name in signature_cache1
-            else OnnxModel.to_data_hash(tensor1)
+            else OnnxModel.to_data_hash(tensor1, base_dir)
         )
         sig2 = (
             signature_cache2[tensor2.name]
             if signature_cache2 and tensor2.name in signature_cache2
-            else OnnxModel.to_data_hash(tensor2)
+            else OnnxModel.to_data_hash(tensor2, base_dir)
         )
         if signature_cache1 is not None:
             signature_cache1[tensor1.name] = sig1
         if signature_cache2 is not None:
             signature_cache2[tensor2.name] = sig2
-        if sig1 == sig2 and tensor1.data_type == tensor2.data_type and tensor1.dims == tensor2.dims:
-            # Same signature, now do the expensive check to confirm the data is the same
-            return (numpy_helper.to_array(tensor1) == numpy_helper.to_array(tensor2)).all()
+        if sig1 != sig2:
+            return False
 
-        return False
+        # Same signature, now do the expensive check to confirm the data is the same
+        return OnnxModel._has_same_data(tensor1, tensor2, base_dir)
+
+    @staticmethod
+    def _has_same_data(tensor1: TensorProto, tensor2: TensorProto, base_dir: str = "") -> bool:
+        if tensor1.data_type == TensorProto.STRING:
+            return (numpy_helper.to_array(tensor1) == numpy_helper.to_array(tensor2)).all()
+        return all(
+            chunk1 == chunk2
+            for chunk1, chunk2 in itertools.zip_longest(
+                OnnxModel.iterate_tensor_data(tensor1, base_dir), OnnxModel.iterate_tensor_data(tensor2, base_dir)
+            )
+        )
 
     def remove_initializer(self, tensor):
         for graph in self.graphs():
@@ -1378,42 +1698,108 @@ class OnnxModel:
                 return
         logger.warning("Failed to remove initializer %s", tensor)  # It might be a bug to hit this line.
 
-    def remove_duplicated_initializer(self, cache: dict | None):
+    def remove_duplicated_initializer(self, cache: dict | None = None, base_dir: str = ""):
         """Remove initializers with duplicated values, and only keep the first one.
         It could help reduce size of models (like ALBert) with shared weights.
-        If require_raw_data passed, method will only compare raw_data initializers to speed runtime
-        Note: this function does not process subgraph.
+        Initializers are bucketed by data type, shape and signature of data, so only those in same bucket are compared.
+        An initializer in subgraph (like If/Loop/Scan) could be replaced by one in the same graph or an outer graph.
+
+        Args:
+            cache (dict, optional): dictionary to store data signatures of initializers. Key is initializer name for
+                the main graph, and (id(graph), initializer name) for subgraphs since their names might collide.
+            base_dir (str, optional): directory of external data files.
         """
-        if len(self.graphs()) > 1:
-            logger.warning("remove_duplicated_initializer does not process subgraphs.")
+        # Signature is only needed when there are multiple initializers of the same data type and shape.
+        shape_count = Counter(
+            (tensor.data_type, tuple(tensor.dims)) for graph in self.graphs() for tensor in graph.initializer
+        )
+        if cache is None:
+            cache = {}
+
+        # Names defined in each graph, and names defined in any graph nested in it. Key is id() of graph.
+        defined_names = {id(graph): OnnxModel._get_defined_names(graph) for graph in self.graphs()}
+        nested_names = {}
+
+        def get_nested_names(graph):
+            names = set()
+            for subgraph in OnnxModel._get_subgraphs(graph):
+                names |= defined_names[id(subgraph)] | get_nested_names(subgraph)
+            nested_names[id(graph)] = names
+            return names
+
+        get_nested_names(self.model.graph)
+
+        duplicated = []  # list of (graph, index of initializer, name of the kept initializer)
+
+        def remove_in_graph(graph, outer_scopes):
+            buckets = {}
+            scopes = [*outer_scopes, (buckets, defined_names[id(graph)])]
+            excluded = {value.name for value in itertools.chain(graph.input, graph.output)}
+            for i, tensor in enumerate(graph.initializer):
+                if shape_count[(tensor.data_type, tuple(tensor.dims))] < 2 or tensor.name in excluded:
+                    continue
+                cache_key = tensor.name if graph is self.model.graph else (id(graph), tensor.name)
+                if cache_key not in cache:
+                    cache[cache_key] = OnnxModel.to_data_hash(tensor, base_dir)
+                key = (tensor.data_type, tuple(tensor.dims), cache[cache_key])
+
+                # Prefer the initializer in outer graph so that it could be shared by more subgraphs.
+                # The name of the kept initializer shall not be shadowed in this graph or the graphs nested in it.
+                kept = next(
+                    (
+                        candidate
+                        for j, (scope_buckets, _) in enumerate(scopes)
+                        for candidate in scope_buckets.get(key, [])
+                        if candidate.name not in nested_names[id(graph)]
+                        and not any(candidate.name in names for _, names in scopes[j + 1 :])
+                        and OnnxModel._has_same_data(candidate, tensor, base_dir)
+                    ),
+                    None,
+                )
+                if kept is None:
+                    buckets.setdefault(key, []).append(tensor)
+                else:
+                    duplicated.append((graph, i, kept.name))
 
-        initializer_count = len(self.model.graph.initializer)
+            for subgraph in OnnxModel._get_subgraphs(graph):
+                remove_in_graph(subgraph, scopes)
 
-        same = [-1] * initializer_count
-        for i in range(initializer_count - 1):
-            if same[i] >= 0:
-                continue
-            for j in range(i + 1, initializer_count):
-                if OnnxModel.has_same_value(
-                    self.model.graph.initializer[i],
-                    self.model.graph.initializer[j],
-                    cache,
-                    cache,
-                ):
-                    same[j] = i
-
-        count = 0
-        for i in range(initializer_count):
-            if same[i] >= 0:
-                count += 1
-                self.replace_input_of_all_nodes(
-                    self.model.graph.initializer[i].name,
-                    self.model.graph.initializer[same[i]].name,
-                )
+        remove_in_graph(self.model.graph, [])
 
-        if count > 0:
+        # Remove initializers from the last one so that indices are not changed.
+        for graph, i, kept_name in reversed(duplicated):
+            OnnxModel._replace_input_in_graph(graph, graph.initializer[i].name, kept_name)
+            del graph.initializer[i]
+
+        if duplicated:
+            self.refresh_graph_index()
             self.update_graph()
-            print(f"Removed {count} initializers with duplicated value")
+            print(f"Removed {len(duplicated)} initializers with duplicated value")
+
+    @staticmethod
+    def _get_subgraphs(graph: GraphProto):
+        for node in graph.node:
+            for attr in node.attribute:
+                if attr.type == AttributeProto.AttributeType.GRAPH:
+                    yield attr.g
+                elif attr.type == AttributeProto.AttributeType.GRAPHS:
+                    yield from attr.graphs
+
+    @staticmethod
+    def _get_defined_names(graph: GraphProto) -> set[str]:
+        names = {tensor.name for tensor in graph.initializer}
+        names.update(value.name for value in graph.input)
+        names.update(output_name for node in graph.node for output_name in node.output)
+        return names
+
+    @staticmethod
+    def _replace_input_in_graph(graph: GraphProto, old_input_name: str, new_input_name: str):
+        """Replace input of nodes in a graph, and in its subgraphs that do not define a value of the same name."""
+        for node in graph.node:
+            OnnxModel.replace_node_input(node, old_input_name, new_input_name)
+        for subgraph in OnnxModel._get_subgraphs(graph):
+            if old_input_name not in OnnxModel._get_defined_names(subgraph):
+                OnnxModel._replace_input_in_graph(subgraph, old_input_name, new_input_name)
 
     def add_prefix_to_names(self, prefix: str):
         """Add prefix to initializer or intermediate outputs in graph. Main graph inputs and outputs are excluded.
@@ -1445,6 +1831,8 @@ class OnnxModel:
                     if prefix + node.output[j] not in excluded:
                         node.output[j] = prefix + node.output[j]
 
+        self.invalidate_graph_index()
+
         for value_info in self.model.graph.value_info:
             if value_info.name not in excluded:
                 value_info.name = prefix + value_info.name
@@ -1545,6 +1933,7 @@ class OnnxModel:
 
                 for node in nodes_not_cast:
                     OnnxModel.replace_node_input(node, graph_input.name, output_name)
+                self.invalidate_graph_index()
 
             # For children that is Cast node, no need to insert Cast.
             # When the children is Cast to int32, we can remove that Cast node since input type is int32 now.
@@ -1597,12 +1986,12 @@ class OnnxModel:
             to=int(new_type),
             name=node_name,
         )
-        graph.node.extend([cast_node])
+        self.add_node(cast_node)
         graph_output.type.tensor_type.elem_type = int(new_type)
         return cast_node
 
     def rename_graph_output(self, old_name: str, new_name: str):
-        if new_name in self.output_name_to_node():
+        if new_name in self._get_output_name_to_node():
             raise RuntimeError("{new_name} exists in graph")
 
         graph = self.graph()
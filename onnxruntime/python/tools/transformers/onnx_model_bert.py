@@ -252,6 +252,7 @@ class BertOnnxModel(OnnxModel):
                         and expand_shape_value[1] == shape_value[0]
                     ):
                         node.input[0] = slice_node.output[0]
+                        self.invalidate_graph_index()
 
         if nodes_to_remove:
             self.remove_nodes(nodes_to_remove)
@@ -296,6 +297,7 @@ class BertOnnxModel(OnnxModel):
                     ) = parent_nodes
                     if shape.input[0] == self.graph().input[0].name:
                         constantOfShape.input[0] = shape.output[0]
+                        self.invalidate_graph_index()
                         output_name_to_node = self.output_name_to_node()
 
             if node.op_type == "Attention":
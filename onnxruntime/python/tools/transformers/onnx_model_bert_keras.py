@@ -230,6 +230,7 @@ class BertOnnxModelKeras(BertOnnxModelTF):
                 count += 1
 
         if count > 0:
+            self.invalidate_graph_index()
             logger.info(f"Skip consequent Reshape count: {count}")
 
     def fuse_embedding(self, node, output_name_to_node):
@@ -413,6 +414,8 @@ class BertOnnxModelKeras(BertOnnxModelTF):
             self.remove_node(reshape_1)
             reshape_removed += 3
 
+        if reshape_removed > 0:
+            self.invalidate_graph_index()
         return reshape_removed
 
     def remove_extra_reshape_2(self):
@@ -465,6 +468,8 @@ class BertOnnxModelKeras(BertOnnxModelTF):
 
             reshape_removed += 4
 
+        if reshape_removed > 0:
+            self.invalidate_graph_index()
         return reshape_removed
 
     def postprocess(self):
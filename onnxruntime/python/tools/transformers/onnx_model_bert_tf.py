@@ -472,6 +472,7 @@ class BertOnnxModelTF(BertOnnxModel):
                     graph_name,
                 )
                 mask_nodes[-1].input[0] = squeeze_output_name
+                self.invalidate_graph_index()
 
             is_same_root = self.check_attention_input(matmul_q, matmul_k, matmul_v, parent, output_name_to_node)
             if is_same_root:
@@ -524,6 +525,7 @@ class BertOnnxModelTF(BertOnnxModel):
                         name=qkv_nodes[1].name + "_reshape",
                     )
                     qkv_nodes[1].input[0] = qkv_nodes[1].name + "_reshape_output"
+                    self.invalidate_graph_index()
                     self.add_node(reshape_, graph_name)
                 if parent.op_type == "Reshape":
                     # Temporary work around: we require the skiplayernorm and attention op be fed with 3-d input
@@ -537,6 +539,7 @@ class BertOnnxModelTF(BertOnnxModel):
                     )
                     self.add_initializer(tensor, graph_name)
                     parent.input[1] = parent.name + "_modified"
+                    self.invalidate_graph_index()
 
                 self.add_node(attention_node, graph_name)
                 attention_count += 1
@@ -569,6 +572,7 @@ class BertOnnxModelTF(BertOnnxModel):
                 count += 1
 
         if count > 0:
+            self.invalidate_graph_index()
             logger.info(f"Skip consequent Reshape count: {count}")
 
     def remove_reshape_before_first_attention(self):
@@ -808,6 +808,7 @@ class T5OnnxModel(BertOnnxModel):
                         self.add_node(gather)
                         node.input[1] = node_name + "_Output_Gather_1"
                         node.input[2] = node_name + "_Output_Gather_1"
+                        self.invalidate_graph_index()
 
                 break
 
@@ -842,6 +843,7 @@ class T5OnnxModel(BertOnnxModel):
 
                 rpb_node = rpb_nodes[0]
                 rpb_node.output[0] = node.output[0]
+                self.invalidate_graph_index()
 
                 nodes_to_remove.extend(extended_mask_nodes)
                 nodes_to_remove.append(node)
@@ -878,6 +880,7 @@ class T5OnnxModel(BertOnnxModel):
 
                 rpb_node = rpb_nodes[0]
                 rpb_node.output[0] = node.output[0]
+                self.invalidate_graph_index()
 
                 nodes_to_remove.extend(extended_mask_nodes)
                 nodes_to_remove.append(node)
@@ -6,13 +6,20 @@
 """This profiler result processor print out the kernel time spent on each Node of the model.
 Example of importing profile result file from onnxruntime_perf_test:
     python profile_result_processor.py --input profile_2021-10-25_12-02-41.json
+Example of merging profile result files of multiple runs or processes:
+    python profile_result_processor.py --input profile_1.json profile_2.json --percentiles 50 90 99
 """
 
 import argparse
 import json
+from array import array
+
+import numpy as np
 
 _NODES_TYPE_CONTAINING_SUBGRAPH = frozenset(("Scan", "Loop", "If"))
 
+_PROVIDER_TO_DEVICE = {"CPUExecutionProvider": "CPU", "CUDAExecutionProvider": "CUDA", "DmlExecutionProvider": "DML"}
+
 
 def parse_arguments(argv=None):
     parser = argparse.ArgumentParser()
@@ -22,7 +29,8 @@ def parse_arguments(argv=None):
         "--input",
         required=False,
         type=str,
-        help="Set the input file for reading the profile results",
+        nargs="+",
+        help="Set the input file for reading the profile results. Results of multiple files are merged.",
     )
 
     parser.add_argument(
@@ -50,6 +58,15 @@ def parse_arguments(argv=None):
 
     parser.set_defaults(kernel_time_only=False)
 
+    parser.add_argument(
+        "--percentiles",
+        required=False,
+        type=float,
+        nargs="+",
+        default=[50, 90, 99],
+        help="Percentiles of kernel time to show for each node",
+    )
+
     parser.add_argument("-v", "--verbose", required=False, action="store_true")
     parser.set_defaults(verbose=False)
 
@@ -66,70 +83,244 @@ def load_profile_json(profile_file):
     return sess_time
 
 
-def parse_kernel_results(sess_time, threshold=0):
-    """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
+def iterate_profile_json(profile_file, chunk_size=1 << 20):
+    """Iterate records of a profile file. Unlike load_profile_json, the file is parsed incrementally,
+    so memory usage does not grow with the size of the file.
 
     Args:
-        sess_time (List[Dict]): profile data
-        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
+        profile_file (str): path of profile file, which is a json array of records.
+        chunk_size (int, optional): number of characters to read at a time. Defaults to 1M.
+
+    Yields:
+        Dict: a profile record.
+    """
+    print(f"loading profile output {profile_file} ...")
+
+    decoder = json.JSONDecoder()
+    with open(profile_file, encoding="utf-8") as opened_file:
+        buffer = ""
+        position = 0
+        is_eof = False
+        in_array = False
+        while True:
+            # Skip white spaces and separators between records.
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                if buffer[position] == "]":
+                    return
+                in_array = in_array or buffer[position] == "["
+                position += 1
+
+            if position < len(buffer):
+                assert in_array, f"profile file is not a json array: {profile_file}"
+                try:
+                    record, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The record might be incomplete in the buffer, so read more data and decode it again.
+                    if is_eof:
+                        raise
+                else:
+                    yield record
+                    continue
+            elif is_eof:
+                assert not in_array, f"profile file is truncated: {profile_file}"
+                return
+
+            data = opened_file.read(chunk_size)
+            is_eof = not data
+            buffer = buffer[position:] + data
+            position = 0
+
+
+def _group_by(keys, values):
+    """Group values by integer keys.
+
+    Args:
+        keys (np.ndarray): integer keys.
+        values (np.ndarray): integer values.
 
     Returns:
-        List[str]: lines of string for output.
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]: unique keys in the order of first
+        appearance, sum, count and start in sorted values of each group, and values sorted by key then value.
     """
-    kernel_name_to_op_name = {}
-    kernel_time = {}
-    kernel_freq = {}
-    total = 0
-    session_init = False
-    for item in sess_time:
-        # Skip all MemcpyHostToDevice before session_initialization
-        if item["cat"] == "Session" and item["name"] == "session_initialization":
-            session_init = True
-        if not session_init:
-            continue
+    if keys.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty, empty
 
-        if item["cat"] == "Kernel" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            kernel_name = item["name"]
+    order = np.lexsort((values, keys))
+    sorted_keys = keys[order]
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    counts = np.diff(np.append(starts, keys.size))
+    sums = np.add.reduceat(sorted_values, starts)
 
-            op_name = item["args"]["op_name"]
-            if op_name in _NODES_TYPE_CONTAINING_SUBGRAPH:
+    # Like a dict, groups are ordered by the first appearance of keys.
+    group_order = np.argsort(np.minimum.reduceat(order, starts), kind="stable")
+    return sorted_keys[starts][group_order], sums[group_order], counts[group_order], starts[group_order], sorted_values
+
+
+def _get_percentile(sorted_values, starts, counts, percentile):
+    """Get percentile of each group using linear interpolation like numpy.percentile."""
+    rank = (counts - 1) * (percentile / 100.0)
+    lower = np.floor(rank).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    lower_values = sorted_values[starts + lower]
+    return lower_values + (sorted_values[starts + upper] - lower_values) * (rank - lower)
+
+
+class ProfileStatistics:
+    """Durations of kernel and node records in profile results.
+
+    Durations are stored in columns (compact integer arrays), and names are mapped to integer ids in the order of first
+    appearance. The statistics are built in one pass of records, which could come from multiple profile files
+    (like those of different runs or processes) to merge them in one report.
+    """
+
+    def __init__(self):
+        self.num_profiles = 0
+
+        self.kernel_names = []
+        self.kernel_op_names = []  # operator name of each kernel
+        self.node_names = []
+        self.node_devices = []  # device (like CPU or CUDA) of each node, or empty when it is unknown
+        self.op_names = []
+        self.providers = []
+        self._kernel_name_to_id = {}
+        self._node_name_to_id = {}
+        self._op_name_to_id = {}
+        self._provider_to_id = {}
+
+        # Columns of kernel records.
+        self.kernel_ids = array("i")
+        self.kernel_durations = array("q")
+
+        # Columns of node records. Provider id is -1 when the record has no provider, like fence.
+        self.node_ids = array("i")
+        self.node_op_ids = array("i")
+        self.node_provider_ids = array("i")
+        self.node_is_fence = array("b")
+        self.node_durations = array("q")
+
+    @staticmethod
+    def _get_id(name_to_id, names, name):
+        index = name_to_id.get(name)
+        if index is None:
+            index = len(names)
+            name_to_id[name] = index
+            names.append(name)
+        return index
+
+    def add_records(self, records):
+        """Add records of a profile.
+
+        Args:
+            records (Iterable[Dict]): profile records, like the result of load_profile_json or iterate_profile_json.
+        """
+        session_init = False
+        for item in records:
+            category = item["cat"]
+            if category == "Session" and item["name"] == "session_initialization":
+                session_init = True
+
+            if (category != "Kernel" and category != "Node") or "dur" not in item:
+                continue
+            args = item.get("args")
+            if not args or "op_name" not in args:
                 continue
 
-            # Handle MemcpyHostToDevice and MemcpyDeviceToHost here
-            if not op_name:
-                op_name = f"({kernel_name})"
+            op_name = args["op_name"]
+            if op_name in _NODES_TYPE_CONTAINING_SUBGRAPH:
+                continue
 
-            if kernel_name in kernel_time:
-                kernel_time[kernel_name] += item["dur"]
-                kernel_freq[kernel_name] += 1
+            if category == "Kernel":
+                # Skip all MemcpyHostToDevice before session_initialization
+                if not session_init:
+                    continue
+
+                kernel_name = item["name"]
+                kernel_id = self._get_id(self._kernel_name_to_id, self.kernel_names, kernel_name)
+                if kernel_id == len(self.kernel_op_names):
+                    # Handle MemcpyHostToDevice and MemcpyDeviceToHost here
+                    self.kernel_op_names.append(op_name if op_name else f"({kernel_name})")
+                self.kernel_ids.append(kernel_id)
+                self.kernel_durations.append(item["dur"])
             else:
-                kernel_time[kernel_name] = item["dur"]
-                kernel_freq[kernel_name] = 1
-                kernel_name_to_op_name[kernel_name] = op_name
+                name = item["name"]
+                node_name = name.replace("_kernel_time", "").replace("_fence_before", "").replace("_fence_after", "")
+                node_id = self._get_id(self._node_name_to_id, self.node_names, node_name)
+                if node_id == len(self.node_devices):
+                    self.node_devices.append("")
+
+                provider = args.get("provider")
+                if provider is None:
+                    provider_id = -1
+                else:
+                    provider_id = self._get_id(self._provider_to_id, self.providers, provider)
+                    if not self.node_devices[node_id]:
+                        self.node_devices[node_id] = _PROVIDER_TO_DEVICE.get(
+                            provider, provider.replace("ExecutionProvider", "")
+                        )
+
+                self.node_ids.append(node_id)
+                self.node_op_ids.append(self._get_id(self._op_name_to_id, self.op_names, op_name))
+                self.node_provider_ids.append(provider_id)
+                self.node_is_fence.append(provider is None and "fence" in name)
+                self.node_durations.append(item["dur"])
+
+        self.num_profiles += 1
+
+    def add_file(self, profile_file):
+        """Add records of a profile file, which is parsed incrementally."""
+        self.add_records(iterate_profile_json(profile_file))
+
 
-            total += item["dur"]
+def _get_statistics(sess_time):
+    if isinstance(sess_time, ProfileStatistics):
+        return sess_time
 
-    if not kernel_time:
+    statistics = ProfileStatistics()
+    statistics.add_records(sess_time)
+    return statistics
+
+
+def parse_kernel_results(sess_time, threshold=0):
+    """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
+
+    Args:
+        sess_time (List[Dict] or ProfileStatistics): profile data
+        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
+
+    Returns:
+        List[str]: lines of string for output.
+    """
+    statistics = _get_statistics(sess_time)
+    kernel_ids, kernel_time, kernel_freq, _, _ = _group_by(
+        np.array(statistics.kernel_ids), np.array(statistics.kernel_durations)
+    )
+    if kernel_ids.size == 0:
         return ["No kernel record found!"]
 
+    kernels = list(zip(kernel_ids.tolist(), kernel_time.tolist(), kernel_freq.tolist(), strict=True))
+    total = sum(duration for _, duration, _ in kernels)
+
     # Output items with run time ratio > thresholds, and sorted by duration in the descending order.
     lines = []
     lines.append(f"\nTop expensive kernels with Time% >= {threshold * 100:.2f}:")
     lines.append("-" * 64)
     lines.append("Total(μs)\tTime%\tCalls\tAvg(μs)\tKernel")
-    for kernel_name, duration in sorted(kernel_time.items(), key=lambda x: x[1], reverse=True):
+    for kernel_id, duration, calls in sorted(kernels, key=lambda x: x[1], reverse=True):
         ratio = duration / total
         if ratio < threshold:
             continue
 
-        calls = kernel_freq[kernel_name]
         avg_time = duration / float(calls)
-        lines.append(f"{duration:10d}\t{ratio * 100.0:5.2f}\t{calls:5d}\t{avg_time:8.1f}\t{kernel_name}")
+        lines.append(
+            f"{duration:10d}\t{ratio * 100.0:5.2f}\t{calls:5d}\t{avg_time:8.1f}\t{statistics.kernel_names[kernel_id]}"
+        )
 
     # Group by operator
     op_time = {}
-    for kernel_name, op_name in kernel_name_to_op_name.items():
-        duration = kernel_time[kernel_name]
+    for kernel_id, duration, _ in kernels:
+        op_name = statistics.kernel_op_names[kernel_id]
         if op_name in op_time:
             op_time[op_name] += duration
         else:
@@ -149,52 +340,24 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
     """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
 
     Args:
-        sess_time (List[Dict]): profile data
+        sess_time (List[Dict] or ProfileStatistics): profile data
         kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
         threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
 
     Returns:
         List[str]: lines of string for output.
     """
-    node_name_list = []
-    node_time = {}
-    node_freq = {}
-    node_provider = {}
-    total = 0
-    for item in sess_time:
-        if item["cat"] == "Node" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            node_name = (
-                item["name"].replace("_kernel_time", "").replace("_fence_before", "").replace("_fence_after", "")
-            )
-
-            if "provider" in item["args"]:
-                if item["args"]["provider"] == "CPUExecutionProvider":
-                    device = "CPU"
-                elif item["args"]["provider"] == "CUDAExecutionProvider":
-                    device = "CUDA"
-                elif item["args"]["provider"] == "DmlExecutionProvider":
-                    device = "DML"
-
-                if node_name not in node_provider:
-                    node_provider[node_name] = device
-                else:
-                    assert node_provider[node_name] == device
-            elif kernel_time_only:
-                continue
-
-            op_name = item["args"]["op_name"]
-            if op_name in _NODES_TYPE_CONTAINING_SUBGRAPH:
-                continue
-
-            if node_name in node_time:
-                node_time[node_name] += item["dur"]
-                node_freq[node_name] += 1
-            else:
-                node_time[node_name] = item["dur"]
-                node_freq[node_name] = 1
-                node_name_list.append(node_name)
-
-            total += item["dur"]
+    statistics = _get_statistics(sess_time)
+    node_ids = np.array(statistics.node_ids)
+    durations = np.array(statistics.node_durations)
+    if kernel_time_only:
+        has_provider = np.array(statistics.node_provider_ids) >= 0
+        node_ids = node_ids[has_provider]
+        durations = durations[has_provider]
+
+    node_ids, node_time, node_freq, _, _ = _group_by(node_ids, durations)
+    nodes = list(zip(node_ids.tolist(), node_time.tolist(), node_freq.tolist(), strict=True))
+    total = sum(duration for _, duration, _ in nodes)
 
     # Output items in the original order.
     lines = [
@@ -203,12 +366,11 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
         "Total(μs)\tTime%\tAcc %\tAvg(μs)\tCalls\tProvider\tNode",
     ]
     before_percentage = 0.0
-    for node_name in node_name_list:
-        duration = node_time[node_name]
-        calls = node_freq[node_name]
+    for node_id, duration, calls in nodes:
         avg_time = duration / float(calls)
         percentage = (duration / total) * 100.0
-        provider = node_provider.get(node_name, "")
+        provider = statistics.node_devices[node_id]
+        node_name = statistics.node_names[node_id]
         before_percentage += percentage
         lines.append(
             f"{duration:10d}\t{percentage:5.2f}\t{before_percentage:5.2f}\t{avg_time:8.1f}\t{calls:5d}\t{provider:8s}\t{node_name}"
@@ -218,126 +380,151 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
     lines.append(f"\nTop expensive nodes with Time% >= {threshold * 100:.2f}:")
     lines.append("-" * 64)
     lines.append("Total(μs)\tTime%\tAvg(μs)\tCalls\tProvider\tNode")
-    for node_name, duration in sorted(node_time.items(), key=lambda x: x[1], reverse=True):
+    for node_id, duration, calls in sorted(nodes, key=lambda x: x[1], reverse=True):
         ratio = duration / total
         if ratio < threshold:
             continue
 
-        calls = node_freq[node_name]
         avg_time = duration / float(calls)
         percentage = (duration / total) * 100.0
-        provider = node_provider.get(node_name, "")
+        provider = statistics.node_devices[node_id]
+        node_name = statistics.node_names[node_id]
         lines.append(f"{duration:10d}\t{percentage:5.2f}\t{avg_time:8.1f}\t{calls:5d}\t{provider:8s}\t{node_name}")
 
     return lines
 
 
-def group_node_results(sess_time):
-    """Group results by operator name.
+def parse_node_percentiles(sess_time, percentiles=(50, 90, 99), threshold=0):
+    """Parse profile data and output percentiles of kernel time per node, sorted by total kernel time.
 
     Args:
-        sess_time (List[Dict]): profile data
+        sess_time (List[Dict] or ProfileStatistics): profile data
+        percentiles (List[float], optional): percentiles to output. Defaults to (50, 90, 99).
+        threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
 
     Returns:
         List[str]: lines of string for output.
     """
-    op_kernel_time = {}
-    op_kernel_records = {}
-    total_kernel_time = 0
-
-    provider_op_kernel_time = {}
-    provider_op_kernel_records = {}
-    provider_kernel_time = {}
-
-    op_fence_time = {}
-    total_fence_time = 0
-
-    provider_counter = {}
-    for item in sess_time:
-        if item["cat"] == "Node" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            op_name = item["args"]["op_name"]
+    statistics = _get_statistics(sess_time)
+    has_provider = np.array(statistics.node_provider_ids) >= 0
+    node_ids, node_time, node_freq, starts, sorted_values = _group_by(
+        np.array(statistics.node_ids)[has_provider], np.array(statistics.node_durations)[has_provider]
+    )
+    total = int(node_time.sum())
+    percentile_values = [_get_percentile(sorted_values, starts, node_freq, p).tolist() for p in percentiles]
+    max_values = sorted_values[starts + node_freq - 1].tolist()
+    node_ids = node_ids.tolist()
+    node_freq = node_freq.tolist()
 
-            # TODO: shall we have a separated group for nodes with subgraph?
-            if op_name in _NODES_TYPE_CONTAINING_SUBGRAPH:
-                continue
+    lines = [
+        f"\nPercentiles of node kernel time with Time% >= {threshold * 100:.2f}:",
+        "-" * 64,
+        "Total(μs)\tTime%\tCalls\t" + "\t".join(f"P{p:g}(μs)" for p in percentiles) + "\tMax(μs)\tProvider\tNode",
+    ]
+    node_time = node_time.tolist()
+    for i in sorted(range(len(node_time)), key=lambda i: node_time[i], reverse=True):
+        ratio = node_time[i] / total
+        if ratio < threshold:
+            continue
 
-            if "provider" not in item["args"]:
-                if "fence" in item["name"]:
-                    if op_name in op_fence_time:
-                        op_fence_time[op_name] += item["dur"]
-                    else:
-                        op_fence_time[op_name] = item["dur"]
-                    total_fence_time += item["dur"]
-                continue
+        percentile_text = "\t".join(f"{values[i]:8.1f}" for values in percentile_values)
+        provider = statistics.node_devices[node_ids[i]]
+        node_name = statistics.node_names[node_ids[i]]
+        lines.append(
+            f"{node_time[i]:10d}\t{ratio * 100.0:5.2f}\t{node_freq[i]:5d}\t{percentile_text}\t{max_values[i]:8d}\t{provider:8s}\t{node_name}"
+        )
 
-            provider = item["args"].get("provider", "")
-            if provider in provider_counter:
-                provider_counter[provider] += 1
-            else:
-                provider_counter[provider] = 1
+    return lines
 
-            key = f"{provider}:{op_name}"
-            if key in provider_op_kernel_time:
-                provider_op_kernel_time[key] += item["dur"]
-                provider_op_kernel_records[key] += 1
-            else:
-                provider_op_kernel_time[key] = item["dur"]
-                provider_op_kernel_records[key] = 1
 
-            if provider in provider_kernel_time:
-                provider_kernel_time[provider] += item["dur"]
-            else:
-                provider_kernel_time[provider] = item["dur"]
+def group_node_results(sess_time):
+    """Group results by operator name.
 
-            if op_name in op_kernel_time:
-                op_kernel_time[op_name] += item["dur"]
-                op_kernel_records[op_name] += 1
-            else:
-                op_kernel_time[op_name] = item["dur"]
-                op_kernel_records[op_name] = 1
+    Args:
+        sess_time (List[Dict] or ProfileStatistics): profile data
 
-            total_kernel_time += item["dur"]
+    Returns:
+        List[str]: lines of string for output.
+    """
+    statistics = _get_statistics(sess_time)
+    op_ids = np.array(statistics.node_op_ids)
+    provider_ids = np.array(statistics.node_provider_ids)
+    durations = np.array(statistics.node_durations)
+    has_provider = provider_ids >= 0
+
+    is_fence = np.logical_and(np.array(statistics.node_is_fence, dtype=bool), ~has_provider)
+    fence_op_ids, fence_time, _, _, _ = _group_by(op_ids[is_fence], durations[is_fence])
+    op_fence_time = dict(zip(fence_op_ids.tolist(), fence_time.tolist(), strict=True))
+    total_fence_time = int(fence_time.sum())
+
+    op_ids = op_ids[has_provider]
+    provider_ids = provider_ids[has_provider]
+    durations = durations[has_provider]
+    kernel_op_ids, op_kernel_time, op_kernel_records, _, _ = _group_by(op_ids, durations)
+    total_kernel_time = int(op_kernel_time.sum())
+
+    num_ops = len(statistics.op_names)
+    provider_op_ids, provider_op_kernel_time, provider_op_kernel_records, _, _ = _group_by(
+        provider_ids.astype(np.int64) * num_ops + op_ids, durations
+    )
+    kernel_provider_ids, kernel_time_per_provider, _, _, _ = _group_by(provider_ids, durations)
+    provider_kernel_time = dict(zip(kernel_provider_ids.tolist(), kernel_time_per_provider.tolist(), strict=True))
 
     lines = ["", "Grouped by operator"]
     lines.append("-" * 64)
     lines.append("Total(μs)\tTime%\tKernel(μs)\tKernel%\tCalls\tAvgKernel(μs)\tFence(μs)\tOperator")
-    for op_name, kernel_time in sorted(op_kernel_time.items(), key=lambda x: x[1], reverse=True):
-        fence_time = op_fence_time.get(op_name, 0)
+    ops = zip(kernel_op_ids.tolist(), op_kernel_time.tolist(), op_kernel_records.tolist(), strict=True)
+    for op_id, kernel_time, kernel_calls in sorted(ops, key=lambda x: x[1], reverse=True):
+        fence_time = op_fence_time.get(op_id, 0)
         kernel_time_ratio = kernel_time / total_kernel_time
         total_time = kernel_time + fence_time
         time_ratio = total_time / (total_kernel_time + total_fence_time)
-        kernel_calls = op_kernel_records[op_name]
         avg_kernel_time = kernel_time / kernel_calls
         lines.append(
-            f"{total_time:10d}\t{time_ratio * 100.0:5.2f}\t{kernel_time:11d}\t{kernel_time_ratio * 100.0:5.2f}\t{kernel_calls:5d}\t{avg_kernel_time:14.1f}\t{fence_time:10d}\t{op_name}"
+            f"{total_time:10d}\t{time_ratio * 100.0:5.2f}\t{kernel_time:11d}\t{kernel_time_ratio * 100.0:5.2f}\t{kernel_calls:5d}\t{avg_kernel_time:14.1f}\t{fence_time:10d}\t{statistics.op_names[op_id]}"
         )
 
     lines += ["", "Grouped by provider + operator"]
     lines.append("-" * 64)
     lines.append("Kernel(μs)\tProvider%\tCalls\tAvgKernel(μs)\tProvider\tOperator")
-    for key, kernel_time in sorted(provider_op_kernel_time.items(), key=lambda x: x[1], reverse=True):
-        parts = key.split(":")
-        provider = parts[0]
-        op_name = parts[1]
-        short_ep = provider.replace("ExecutionProvider", "")
-        calls = provider_op_kernel_records[key]
+    provider_ops = zip(
+        provider_op_ids.tolist(), provider_op_kernel_time.tolist(), provider_op_kernel_records.tolist(), strict=True
+    )
+    for key, kernel_time, calls in sorted(provider_ops, key=lambda x: x[1], reverse=True):
+        provider_id, op_id = divmod(key, num_ops)
+        short_ep = statistics.providers[provider_id].replace("ExecutionProvider", "")
         avg_kernel_time = kernel_time / calls
-        provider_time_ratio = kernel_time / provider_kernel_time[provider]
+        provider_time_ratio = kernel_time / provider_kernel_time[provider_id]
         lines.append(
-            f"{kernel_time:10d}\t{provider_time_ratio * 100.0:9.2f}\t{calls:5d}\t{avg_kernel_time:14.1f}\t{short_ep:8s}\t{op_name}"
+            f"{kernel_time:10d}\t{provider_time_ratio * 100.0:9.2f}\t{calls:5d}\t{avg_kernel_time:14.1f}\t{short_ep:8s}\t{statistics.op_names[op_id]}"
         )
 
     return lines
 
 
 def process_results(profile_file, args):
-    profile_records = load_profile_json(profile_file)
+    """Process profile results.
+
+    Args:
+        profile_file (str or List[str]): path of profile file, or paths of profile files to merge.
+        args (argparse.Namespace): arguments like threshold, kernel_time_only and percentiles.
+
+    Returns:
+        List[str]: lines of string for output.
+    """
+    profile_files = [profile_file] if isinstance(profile_file, str) else profile_file
+
+    statistics = ProfileStatistics()
+    for file in profile_files:
+        statistics.add_file(file)
+
+    lines = parse_kernel_results(statistics, args.threshold)
 
-    lines = parse_kernel_results(profile_records, args.threshold)
+    lines += parse_node_results(statistics, args.kernel_time_only, args.threshold)
 
-    lines += parse_node_results(profile_records, args.kernel_time_only, args.threshold)
+    lines += group_node_results(statistics)
 
-    lines += group_node_results(profile_records)
+    lines += parse_node_percentiles(statistics, args.percentiles, args.threshold)
 
     return lines
 
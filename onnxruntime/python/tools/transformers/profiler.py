@@ -22,7 +22,8 @@ def parse_arguments(argv=None):
         "--input",
         required=False,
         type=str,
-        help="Set the input file for reading the profile results",
+        nargs="+",
+        help="Set the input file for reading the profile results. Results of multiple files are merged.",
     )
 
     parser.add_argument(
@@ -148,6 +149,15 @@ def parse_arguments(argv=None):
     )
     parser.set_defaults(kernel_time_only=False)
 
+    parser.add_argument(
+        "--percentiles",
+        required=False,
+        type=float,
+        nargs="+",
+        default=[50, 90, 99],
+        help="Percentiles of kernel time to show for each node",
+    )
+
     parser.add_argument("-v", "--verbose", required=False, action="store_true")
     parser.set_defaults(verbose=False)
 
@@ -20,9 +20,24 @@ logger = logging.getLogger(__name__)
 
 
 class SymbolicShapeInferenceHelper(SymbolicShapeInference):
-    def __init__(self, model, verbose=0, int_max=2**31 - 1, auto_merge=True, guess_output_rank=False):
+    def __init__(
+        self,
+        model,
+        verbose=0,
+        int_max=2**31 - 1,
+        auto_merge=True,
+        guess_output_rank=False,
+        node_cache: dict | None = None,
+    ):
+        """
+        Args:
+            node_cache (dict, optional): cache of inference results of nodes. When it is shared by helpers of
+                edited versions of a model, only nodes with changed inputs (like those downstream of fused nodes)
+                need to be inferred again.
+        """
         super().__init__(int_max, auto_merge, guess_output_rank, verbose)
         self.model_ = model
+        self.node_cache_ = node_cache
         self.all_shapes_inferred_: bool = False
         self.is_inferred_: bool = False
         self.dynamic_axis_mapping_: dict[str, int] = {}
@@ -57,6 +72,10 @@ class SymbolicShapeInferenceHelper(SymbolicShapeInference):
         self.is_inferred_ = True
         return self.all_shapes_inferred_
 
+    def _get_node_cache_token(self):
+        """Override it since inference result depends on the actual value of dynamic axis."""
+        return (*super()._get_node_cache_token(), tuple(sorted(self.dynamic_axis_mapping_.items())))
+
     def _get_sympy_shape(self, node, idx):
         """Override it to ensure shape inference by giving the actual value of dynamic axis."""
         sympy_shape = []
@@ -2,6 +2,7 @@
 # Licensed under the MIT License.
 from __future__ import annotations
 
+import asyncio
 import copy
 import ctypes
 import gc
@@ -732,6 +733,51 @@ class TestInferenceSession(unittest.TestCase):
         event.wait(10)  # timeout in 10 sec
         self.assertTrue(event.is_set())
 
+    def test_run_awaitable(self):
+        output_expected = np.array([[1.0, 4.0], [9.0, 16.0], [25.0, 36.0]], dtype=np.float32)
+        so = onnxrt.SessionOptions()
+        so.intra_op_num_threads = 2
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), so, providers=available_providers)
+        async_sess = onnxrt.AsyncInferenceSession(sess, max_in_flight_runs=3)
+        self.assertEqual(async_sess.max_in_flight_runs, 3)
+
+        async def run_all():
+            futures = [
+                async_sess.run(["Y"], {"X": np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32) * i})
+                for i in range(10)
+            ]
+            results = await asyncio.wait_for(asyncio.gather(*futures), timeout=10)
+            self.assertEqual(async_sess.in_flight_runs, 0)
+
+            with self.assertRaises(Fail):
+                await asyncio.wait_for(sess.run_awaitable(["Y"], {"X": np.zeros((2, 3, 4), dtype=np.float32)}), 10)
+            return results
+
+        results = asyncio.run(run_all())
+        for i, res in enumerate(results):
+            self.assertEqual(len(res), 1)
+            np.testing.assert_allclose(output_expected * i, res[0], rtol=1e-05, atol=1e-08)
+
+    def test_prepare_run(self):
+        sess = onnxrt.InferenceSession(get_name("mul_1.onnx"), providers=available_providers)
+        x = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], dtype=np.float32)
+        output_expected = np.array([[1.0, 4.0], [9.0, 16.0], [25.0, 36.0]], dtype=np.float32)
+
+        for run in [sess.prepare_run(), sess.prepare_run(["Y"], ["X"])]:
+            for i in range(3):
+                res = run({"X": x * i})
+                self.assertEqual(len(res), 1)
+                np.testing.assert_allclose(output_expected * i, res[0], rtol=1e-05, atol=1e-08)
+
+        run_options = onnxrt.RunOptions()
+        run_options.logid = "prepared"
+        res = sess.prepare_run(run_options=run_options)({"X": x})
+        np.testing.assert_allclose(output_expected, res[0], rtol=1e-05, atol=1e-08)
+
+        with self.assertRaises(ValueError) as context:
+            sess.prepare_run(["Y"], ["Z"])
+        self.assertIn("Required inputs (['X']) are missing", str(context.exception))
+
     def test_run_model_from_bytes(self):
         with open(get_name("mul_1.onnx"), "rb") as f:
             content = f.read()
@@ -0,0 +1,148 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import threading
+import unittest
+
+import numpy as np
+from onnx import TensorProto, helper
+
+import onnxruntime as ort
+
+
+def make_model() -> bytes:
+    """Makes a model with a sequence output of shape (batch, sequence, 4) and a pooled output of shape (batch,)."""
+    nodes = [
+        helper.make_node("Cast", ["input_ids"], ["ids"], to=TensorProto.FLOAT),
+        helper.make_node("Cast", ["attention_mask"], ["mask"], to=TensorProto.FLOAT),
+        helper.make_node("Mul", ["ids", "mask"], ["masked"]),
+        helper.make_node("Unsqueeze", ["masked", "last_axis"], ["unsqueezed"]),
+        helper.make_node("Mul", ["unsqueezed", "weight"], ["hidden"]),
+        helper.make_node("ReduceSum", ["masked", "sequence_axis"], ["pooled"], keepdims=0),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "dynamic_batching",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"]),
+        ],
+        [
+            helper.make_tensor_value_info("hidden", TensorProto.FLOAT, ["batch", "sequence", 4]),
+            helper.make_tensor_value_info("pooled", TensorProto.FLOAT, ["batch"]),
+        ],
+        initializer=[
+            helper.make_tensor("sequence_axis", TensorProto.INT64, [1], [1]),
+            helper.make_tensor("last_axis", TensorProto.INT64, [1], [2]),
+            helper.make_tensor("weight", TensorProto.FLOAT, [4], [1.0, 2.0, 3.0, 4.0]),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    return model.SerializeToString()
+
+
+class CountingSession:
+    """Forwards calls to a session, and records batch sizes of runs."""
+
+    def __init__(self, session):
+        self.session = session
+        self.batch_sizes = []
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def run(self, output_names, input_feed, run_options=None):
+        self.batch_sizes.append(input_feed["input_ids"].shape[0])
+        return self.session.run(output_names, input_feed, run_options)
+
+
+def make_feed(batch_size, sequence_length, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        "input_ids": rng.integers(1, 100, (batch_size, sequence_length), dtype=np.int64),
+        "attention_mask": np.ones((batch_size, sequence_length), dtype=np.int64),
+    }
+
+
+class TestDynamicBatcher(unittest.TestCase):
+    def setUp(self):
+        self.session = ort.InferenceSession(make_model(), providers=["CPUExecutionProvider"])
+
+    def test_batching(self):
+        session = CountingSession(self.session)
+        feeds = [make_feed(1, 8, i) for i in range(6)] + [make_feed(2, 8, 6)]
+        with ort.DynamicBatcher(session, max_batch_size=4, max_wait_ms=1000) as batcher:
+            futures = [batcher.submit(feed) for feed in feeds]
+            results = [future.result(timeout=10) for future in futures]
+
+        # Batches are full except the last one that is completed when the batcher is closed.
+        self.assertEqual(session.batch_sizes, [4, 4])
+        for feed, result in zip(feeds, results, strict=True):
+            expected = self.session.run(None, feed)
+            self.assertEqual(len(result), 2)
+            for actual, expected_output in zip(result, expected, strict=True):
+                np.testing.assert_allclose(actual, expected_output)
+
+    def test_max_wait(self):
+        session = CountingSession(self.session)
+        with ort.DynamicBatcher(session, max_batch_size=32, max_wait_ms=1) as batcher:
+            result = batcher.run(make_feed(1, 8, 0))
+            self.assertEqual(session.batch_sizes, [1])
+            np.testing.assert_allclose(result[1], self.session.run(["pooled"], make_feed(1, 8, 0))[0])
+
+    def test_concurrent_callers(self):
+        session = CountingSession(self.session)
+        feeds = [make_feed(1, 16, i) for i in range(16)]
+        results = [None] * len(feeds)
+        with ort.DynamicBatcher(session, max_batch_size=8, max_wait_ms=50, output_names=["pooled"]) as batcher:
+
+            def call(i):
+                results[i] = batcher.run(feeds[i])
+
+            threads = [threading.Thread(target=call, args=(i,)) for i in range(len(feeds))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertLess(len(session.batch_sizes), len(feeds))
+        for feed, result in zip(feeds, results, strict=True):
+            self.assertEqual(len(result), 1)
+            np.testing.assert_allclose(result[0], self.session.run(["pooled"], feed)[0])
+
+    def test_padding(self):
+        session = CountingSession(self.session)
+        feeds = [make_feed(1, length, length) for length in [3, 5, 9]]
+        with ort.DynamicBatcher(
+            session, max_batch_size=2, max_wait_ms=1000, sequence_length_buckets=[4, 8, 16]
+        ) as batcher:
+            futures = [batcher.submit(feed) for feed in feeds]
+            results = [future.result(timeout=10) for future in futures]
+
+        self.assertEqual(session.batch_sizes, [2, 1])
+        for feed, result in zip(feeds, results, strict=True):
+            expected = self.session.run(None, feed)
+            # The sequence output is truncated to the sequence length of each request.
+            self.assertEqual(result[0].shape, expected[0].shape)
+            np.testing.assert_allclose(result[0], expected[0])
+            np.testing.assert_allclose(result[1], expected[1])
+
+    def test_invalid_requests(self):
+        with ort.DynamicBatcher(self.session, max_wait_ms=1) as batcher:
+            with self.assertRaises(ValueError):
+                batcher.submit({"input_ids": np.ones((1, 4), dtype=np.int64)})
+            with self.assertRaises(ValueError):
+                batcher.submit(
+                    {"input_ids": np.ones((1, 4), dtype=np.int64), "attention_mask": np.ones((2, 4), dtype=np.int64)}
+                )
+
+            # Errors of the run are raised to the caller.
+            with self.assertRaises(Exception):  # noqa: B017
+                batcher.run({"input_ids": np.ones((1, 4), dtype=np.int32), "attention_mask": np.ones((1, 4))})
+
+        with self.assertRaises(RuntimeError):
+            batcher.submit(make_feed(1, 4, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import unittest
+
+import numpy as np
+from onnx import TensorProto, helper
+
+import onnxruntime as ort
+
+
+def make_model() -> bytes:
+    """Makes a model with an output of the same shape as the input, and an output that depends on input data."""
+    graph = helper.make_graph(
+        [
+            helper.make_node("Mul", ["X", "scale"], ["Y"]),
+            helper.make_node("NonZero", ["X"], ["indices"]),
+        ],
+        "iobinding_arena",
+        [helper.make_tensor_value_info("X", TensorProto.FLOAT, ["batch", "sequence"])],
+        [
+            helper.make_tensor_value_info("Y", TensorProto.FLOAT, ["batch", "sequence"]),
+            helper.make_tensor_value_info("indices", TensorProto.INT64, [2, "count"]),
+        ],
+        initializer=[helper.make_tensor("scale", TensorProto.FLOAT, [], [2.0])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    return model.SerializeToString()
+
+
+class FlakySession:
+    """Forwards calls to a session, and fails the next run with IOBinding when requested."""
+
+    def __init__(self, session):
+        self.session = session
+        self.fail_next_run = False
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def run_with_iobinding(self, iobinding, run_options=None):
+        if self.fail_next_run:
+            self.fail_next_run = False
+            raise RuntimeError("transient failure")
+        return self.session.run_with_iobinding(iobinding, run_options)
+
+
+class TestIOBindingArena(unittest.TestCase):
+    def setUp(self):
+        self.session = ort.InferenceSession(make_model(), providers=["CPUExecutionProvider"])
+        self.rng = np.random.default_rng(0)
+
+    def test_reuse_buffers(self):
+        arena = ort.IOBindingArena(self.session, output_names=["Y"])
+        results = []
+        for shape in [(2, 8), (2, 8), (1, 4), (2, 8), (4, 16), (4, 16)]:
+            x = self.rng.standard_normal(shape).astype(np.float32)
+            output = arena.run({"X": x})
+            self.assertEqual(len(output), 1)
+            np.testing.assert_allclose(output[0], self.session.run(["Y"], {"X": x})[0])
+            results.append(output[0])
+
+        # Outputs of learned shapes are views of the same buffer, until the buffer grows.
+        self.assertTrue(np.shares_memory(results[1], results[3]))
+        self.assertFalse(np.shares_memory(results[0], results[1]))
+        self.assertFalse(np.shares_memory(results[3], results[5]))
+        self.assertEqual(arena._buffers["Y"].size, 64)
+
+    def test_data_dependent_output_shapes(self):
+        arena = ort.IOBindingArena(self.session)
+        for count in [3, 5, 3, 7]:
+            x = np.zeros((2, 8), dtype=np.float32)
+            x.flat[:count] = 1.0
+            results = arena.run({"X": x})
+            expected = self.session.run(None, {"X": x})
+            self.assertEqual(len(results), 2)
+            for actual, expected_output in zip(results, expected, strict=True):
+                np.testing.assert_array_equal(actual, expected_output)
+
+    def test_transient_failure(self):
+        session = FlakySession(self.session)
+        arena = ort.IOBindingArena(session, output_names=["Y"])
+        x = self.rng.standard_normal((2, 8)).astype(np.float32)
+        arena.run({"X": x})
+        first = arena.run({"X": x})[0]
+
+        # The run is retried, and buffers are still reused since output shapes are not changed.
+        session.fail_next_run = True
+        np.testing.assert_allclose(arena.run({"X": x})[0], x * 2)
+        result = arena.run({"X": x})[0]
+        np.testing.assert_allclose(result, x * 2)
+        self.assertTrue(np.shares_memory(result, first))
+
+    def test_max_cached_shapes(self):
+        arena = ort.IOBindingArena(self.session, output_names=["Y"], max_cached_shapes=2)
+        for sequence_length in range(1, 6):
+            x = self.rng.standard_normal((1, sequence_length)).astype(np.float32)
+            np.testing.assert_allclose(arena.run({"X": x})[0], x * 2)
+        self.assertEqual(len(arena._output_shapes), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+import onnxruntime as ort
+
+
+def make_model() -> onnx.ModelProto:
+    """Makes a model with a large weight that is shared among replicas, and a small bias that is not."""
+    rng = np.random.default_rng(0)
+    graph = helper.make_graph(
+        [
+            helper.make_node("MatMul", ["X", "weight"], ["matmul"]),
+            helper.make_node("Add", ["matmul", "bias"], ["Y"]),
+        ],
+        "session_pool",
+        [helper.make_tensor_value_info("X", TensorProto.FLOAT, ["batch", 64])],
+        [helper.make_tensor_value_info("Y", TensorProto.FLOAT, ["batch", 16])],
+        initializer=[
+            numpy_helper.from_array(rng.standard_normal((64, 16)).astype(np.float32), "weight"),
+            numpy_helper.from_array(rng.standard_normal(16).astype(np.float32), "bias"),
+        ],
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+
+class TestInferenceSessionPool(unittest.TestCase):
+    def setUp(self):
+        self.model = make_model()
+        self.session = ort.InferenceSession(self.model.SerializeToString(), providers=["CPUExecutionProvider"])
+        self.x = np.random.default_rng(1).standard_normal((3, 64)).astype(np.float32)
+
+    def test_run(self):
+        expected = self.session.run(None, {"X": self.x})[0]
+        pool = ort.InferenceSessionPool(
+            self.model.SerializeToString(), 2, providers=["CPUExecutionProvider"], cpu_sets=[[0], [0]]
+        )
+        self.assertEqual(len(pool.replicas), 2)
+        self.assertEqual([i.name for i in pool.get_inputs()], ["X"])
+        for replica in pool.replicas:
+            # The allocator is only shared on request since it is registered for the whole process.
+            with self.assertRaises(RuntimeError):
+                replica.get_session_options().get_session_config_entry("session.use_env_allocators")
+            np.testing.assert_allclose(replica.run(None, {"X": self.x})[0], expected, rtol=1e-5, atol=1e-5)
+
+        results = [None] * 8
+
+        def run(i):
+            results[i] = pool.run(["Y"], {"X": self.x * i})[0]
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(pool.in_flight_runs, [0, 0])
+        for i, result in enumerate(results):
+            np.testing.assert_allclose(result, self.session.run(None, {"X": self.x * i})[0], rtol=1e-5, atol=1e-5)
+
+    def test_model_with_external_data(self):
+        expected = self.session.run(None, {"X": self.x})[0]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            model_path = os.path.join(temp_dir, "model.onnx")
+            onnx.save_model(self.model, model_path, save_as_external_data=True, size_threshold=0)
+            for share_initializers in [True, False]:
+                pool = ort.InferenceSessionPool(
+                    model_path,
+                    1,
+                    providers=["CPUExecutionProvider"],
+                    cpu_sets=[[0]],
+                    share_initializers=share_initializers,
+                    share_allocator=False,
+                )
+                np.testing.assert_allclose(pool.run(None, {"X": self.x})[0], expected, rtol=1e-5, atol=1e-5)
+
+    def test_share_allocator(self):
+        # The allocator is registered for the whole process, so the pool runs in another process.
+        script = """
+import numpy as np
+import onnxruntime as ort
+
+with open("model.onnx", "rb") as f:
+    model = f.read()
+x = np.ones((1, 64), dtype=np.float32)
+expected = ort.InferenceSession(model, providers=["CPUExecutionProvider"]).run(None, {"X": x})[0]
+if APP_REGISTERS:
+    memory_info = ort.OrtMemoryInfo("Cpu", ort.OrtAllocatorType.ORT_ARENA_ALLOCATOR, 0, ort.OrtMemType.DEFAULT)
+    ort.create_and_register_allocator(memory_info, None)
+for _ in range(2):
+    pool = ort.InferenceSessionPool(
+        model, 2, providers=["CPUExecutionProvider"], cpu_sets=[[0], [0]], share_allocator=True
+    )
+    for replica in pool.replicas:
+        assert replica.get_session_options().get_session_config_entry("session.use_env_allocators") == "1"
+    np.testing.assert_allclose(pool.run(None, {"X": x})[0], expected, rtol=1e-5, atol=1e-5)
+"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            onnx.save_model(self.model, os.path.join(temp_dir, "model.onnx"))
+            for app_registers in [False, True]:
+                with self.subTest(app_registers=app_registers):
+                    result = subprocess.run(
+                        [sys.executable, "-c", f"APP_REGISTERS = {app_registers}\n{script}"],
+                        cwd=temp_dir,
+                        capture_output=True,
+                        text=True,
+                        check=False,
+                    )
+                    self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_sess_options(self):
+        sess_options = ort.SessionOptions()
+        pool = ort.InferenceSessionPool(
+            self.model.SerializeToString(), 1, sess_options, providers=["CPUExecutionProvider"], cpu_sets=[[0]]
+        )
+        np.testing.assert_allclose(
+            pool.run(None, {"X": self.x})[0], self.session.run(None, {"X": self.x})[0], rtol=1e-5, atol=1e-5
+        )
+        # The options are updated for the replicas, as documented.
+        self.assertEqual(sess_options.intra_op_num_threads, 1)
+        with self.assertRaises(RuntimeError):
+            sess_options.get_session_config_entry("session.use_env_allocators")
+
+    def test_cpu_sets(self):
+        pool = ort.InferenceSessionPool(
+            self.model.SerializeToString(), 2, providers=["CPUExecutionProvider"], cpu_sets=[[0, 0], [0]]
+        )
+        self.assertEqual(pool.cpu_sets, [[0, 0], [0]])
+        options = [replica.get_session_options() for replica in pool.replicas]
+        self.assertEqual(options[0].intra_op_num_threads, 2)
+        self.assertEqual(options[0].get_session_config_entry("session.intra_op_thread_affinities"), "1")
+        self.assertEqual(options[1].intra_op_num_threads, 1)
+        with self.assertRaises(RuntimeError):
+            options[1].get_session_config_entry("session.intra_op_thread_affinities")
+
+        # Available CPUs are split among replicas by default.
+        num_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        pool = ort.InferenceSessionPool(self.model.SerializeToString(), 1, providers=["CPUExecutionProvider"])
+        self.assertEqual(len(pool.cpu_sets[0]), num_cpus)
+        with self.assertRaises(ValueError):
+            ort.InferenceSessionPool(self.model.SerializeToString(), num_cpus + 1)
+        with self.assertRaises(ValueError):
+            ort.InferenceSessionPool(self.model.SerializeToString(), 2, cpu_sets=[[0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
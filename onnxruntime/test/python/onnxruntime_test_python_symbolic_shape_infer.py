@@ -106,6 +106,59 @@ class TestSymbolicShapeInference(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, r"if_node.*FLOAT.*DOUBLE"):
             SymbolicShapeInference.infer_shapes(model, auto_merge=True)
 
+    def test_onnx_infer_cache(self):
+        nodes = []
+        x = "input"
+        for layer in range(4):
+            nodes.extend(
+                [
+                    helper.make_node("Transpose", [x], [f"transpose_{layer}"], f"Transpose_{layer}", perm=[1, 0, 2]),
+                    helper.make_node("Sigmoid", [f"transpose_{layer}"], [f"output_{layer}"], f"Sigmoid_{layer}"),
+                ]
+            )
+            x = f"output_{layer}"
+        graph = helper.make_graph(
+            nodes,
+            "graph",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", "seq", 8])],
+            [helper.make_tensor_value_info(x, TensorProto.FLOAT, None)],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+        symbolic_shape_inference = SymbolicShapeInference(2**31 - 1, True, False, 0)
+        symbolic_shape_inference._preprocess(model)
+        while symbolic_shape_inference.run_:
+            symbolic_shape_inference._infer_impl()
+
+        # Identical nodes of different layers share one result, even when their inputs have dims in another order.
+        self.assertEqual(len(symbolic_shape_inference.onnx_infer_cache_), 2)
+        for layer in range(4):
+            shape = symbolic_shape_inference.known_vi_[f"output_{layer}"].type.tensor_type.shape
+            expected = ["seq", "batch"] if layer % 2 == 0 else ["batch", "seq"]
+            self.assertEqual([dim.dim_param or dim.dim_value for dim in shape.dim], [*expected, 8])
+
+    def test_duplicated_producers(self):
+        graph = helper.make_graph(
+            [
+                helper.make_node(
+                    "Constant", [], ["shape"], value=helper.make_tensor("first", TensorProto.INT64, [2], [2, 3])
+                ),
+                helper.make_node(
+                    "Constant", [], ["shape"], value=helper.make_tensor("second", TensorProto.INT64, [2], [3, 2])
+                ),
+                helper.make_node("Reshape", ["x", "shape"], ["y"]),
+            ],
+            "graph",
+            [helper.make_tensor_value_info("x", TensorProto.FLOAT, [6])],
+            [helper.make_tensor_value_info("y", TensorProto.FLOAT, None)],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+        # Only the first producer of a name is inferred, the other one is skipped.
+        inferred = SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+        shape = unique_element(inferred.graph.output).type.tensor_type.shape
+        self.assertEqual([dim.dim_value for dim in shape.dim], [2, 3])
+
 
 class TestSymbolicShapeInferenceForOperators(unittest.TestCase):
     def _check_shapes(self, graph, inferred_graph, vis):  # type: (GraphProto, GraphProto, List[ValueInfoProto]) -> None
@@ -0,0 +1,99 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark the threshold computation of the histogram-based calibration methods.
+
+Example:
+    python benchmark_calibration.py --num_bins 2048 --num_quantized_bins 128 --num_tensors 8 --num_workers 4
+"""
+
+import argparse
+import time
+
+import numpy as np
+from test_calibration import reference_entropy_threshold
+
+from onnxruntime.quantization.calibrate import HistogramCollector
+
+
+def make_histograms(num_tensors: int, num_bins: int, num_quantized_bins: int, num_values: int, seed: int = 0):
+    """
+    Creates histograms similar to the ones collected on activations: gaussian, post-ReLU and heavy-tailed
+    distributions, extended a few times as new batches are collected.
+    """
+    rng = np.random.default_rng(seed)
+    distributions = [
+        lambda size: rng.normal(0, 1, size),
+        lambda size: np.maximum(rng.normal(0, 1, size), 0),
+        lambda size: rng.standard_t(3, size),
+    ]
+    collector = HistogramCollector(
+        method="entropy",
+        symmetric=False,
+        num_bins=num_bins,
+        num_quantized_bins=num_quantized_bins,
+        percentile=99.999,
+        scenario="same",
+    )
+    for batch in range(4):
+        collector.collect(
+            {
+                f"tensor_{i}": (distributions[i % len(distributions)](num_values) * (1 + 0.2 * batch)).astype(
+                    np.float32
+                )
+                for i in range(num_tensors)
+            }
+        )
+    return collector
+
+
+def run(args):
+    collector = make_histograms(args.num_tensors, args.num_bins, args.num_quantized_bins, args.num_values)
+    histograms = collector.get_histogram_dict()
+
+    results = {}
+    for name, get_threshold in [
+        ("loop", reference_entropy_threshold),
+        ("vectorized", collector.get_entropy_threshold),
+    ]:
+        latencies = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results[name] = {
+                tensor: get_threshold(histogram, args.num_quantized_bins) for tensor, histogram in histograms.items()
+            }
+            latencies.append(time.perf_counter() - start)
+        print(f"{name:>10}: {min(latencies) / len(histograms) * 1000:10.2f} ms per tensor")
+
+    for tensor, threshold in results["loop"].items():
+        assert threshold == results["vectorized"][tensor], f"Different thresholds for {tensor}"
+
+    num_bins = [histogram[0].size for histogram in histograms.values()]
+    print(f"bins per histogram: {min(num_bins)}-{max(num_bins)}, thresholds are identical")
+
+    if args.num_workers > 1:
+        for num_workers in [None, args.num_workers]:
+            collector.num_workers = num_workers
+            start = time.perf_counter()
+            collector.compute_entropy()
+            print(f"compute_entropy with num_workers={num_workers}: {time.perf_counter() - start:.2f} s")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_bins", type=int, default=2048, help="Initial number of histogram bins.")
+    parser.add_argument("--num_quantized_bins", type=int, default=128, help="Number of quantized bins.")
+    parser.add_argument("--num_tensors", type=int, default=6, help="Number of histograms.")
+    parser.add_argument("--num_values", type=int, default=100000, help="Number of values per batch and tensor.")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of repetitions.")
+    parser.add_argument(
+        "--num_workers", type=int, default=0, help="If greater than 1, also time compute_entropy with a process pool."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_arguments())
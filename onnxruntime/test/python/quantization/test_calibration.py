@@ -14,7 +14,14 @@ import onnx
 from onnx import TensorProto, helper, numpy_helper
 
 import onnxruntime
-from onnxruntime.quantization.calibrate import CalibrationDataReader, CalibrationMethod, create_calibrator
+from onnxruntime.quantization.calibrate import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    HistogramCollector,
+    create_calibrator,
+    entropy,
+)
+from onnxruntime.quantization.quant_utils import smooth_distribution
 
 
 def generate_input_initializer(tensor_shape, tensor_dtype, input_name):
@@ -26,6 +33,60 @@ def generate_input_initializer(tensor_shape, tensor_dtype, input_name):
     return init
 
 
+def reference_entropy_threshold(histogram, num_quantized_bins):
+    """
+    Finds the optimal threshold one candidate at a time.
+    Reference for HistogramCollector.get_entropy_threshold.
+    """
+    hist, hist_edges = histogram[0], histogram[1]
+    num_bins = hist.size
+    zero_bin_index = num_bins // 2
+    num_half_quantized_bin = num_quantized_bins // 2
+    dtype = hist_edges.dtype
+    kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
+    thresholds = [None] * kl_divergence.size
+
+    for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
+        start_index = zero_bin_index - i
+        end_index = min(zero_bin_index + i + 1, num_bins)
+        thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
+
+        sliced_distribution = hist[start_index:end_index].copy()
+        p = sliced_distribution.copy()
+        p[0] += hist[:start_index].sum()
+        p[-1] += hist[end_index:].sum()
+        nonzeros = (p != 0).astype(np.int64)
+
+        quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
+        num_merged_bins = sliced_distribution.size // num_quantized_bins
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            quantized_bins[index] = sliced_distribution[start : start + num_merged_bins].sum()
+        quantized_bins[-1] += sliced_distribution[num_quantized_bins * num_merged_bins :].sum()
+
+        q = np.zeros(p.size, dtype=np.int64)
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            norm = nonzeros[start : start + num_merged_bins].sum()
+            if norm != 0:
+                q[start : start + num_merged_bins] = quantized_bins[index] / norm
+
+        p = smooth_distribution(p)
+        q = smooth_distribution(q)
+        if p is None or q is None:
+            div = np.array(np.inf, dtype=dtype)
+        else:
+            div = np.array(entropy(p, q), dtype=dtype)
+        kl_divergence[i - num_half_quantized_bin] = div
+
+    optimal_threshold = thresholds[np.argmin(kl_divergence)]
+    if optimal_threshold[0] < histogram[2]:
+        optimal_threshold = (histogram[2], optimal_threshold[1])
+    if optimal_threshold[1] > histogram[3]:
+        optimal_threshold = (optimal_threshold[0], histogram[3])
+    return optimal_threshold
+
+
 class TestDataReader(CalibrationDataReader):
     """for test purpose"""
 
@@ -48,6 +109,24 @@ class TestDataReader(CalibrationDataReader):
         self.preprocess_flag = True
 
 
+class ReusedBufferDataReader(CalibrationDataReader):
+    """Copies the batches of a data reader into the same buffer, like readers recycling their memory."""
+
+    def __init__(self, data_reader):
+        self.data_reader = data_reader
+        self.buffer = None
+
+    def get_next(self):
+        inputs = self.data_reader.get_next()
+        if inputs is None:
+            return None
+        if self.buffer is None:
+            self.buffer = inputs["input"].copy()
+        else:
+            self.buffer[...] = inputs["input"]
+        return {"input": self.buffer}
+
+
 class TestCalibrateMinMaxCalibrator(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -392,6 +471,53 @@ class TestCalibrateMinMaxCalibrator(unittest.TestCase):
                 tensors_range = calibrator.compute_data()
                 self.assertEqual(len(tensors_range.items()), num_tensors)  # A range for every tensor in the graph.
 
+    def test_histogram_calibrators_max_intermediate_outputs(self):
+        """
+        Checks that histogram-based calibrators collect the tensors in chunks of max_intermediate_outputs batches
+        and produce the same histograms and ranges as collecting all the batches at once.
+        """
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_4.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix(), augmented=False)
+
+        data_reader = TestDataReader()
+        calibration_configs = [
+            (CalibrationMethod.Percentile, {"symmetric": True}),
+            (CalibrationMethod.Percentile, {"symmetric": False}),
+            (CalibrationMethod.Entropy, {}),
+            (CalibrationMethod.Distribution, {}),
+        ]
+        for calibration_method, extra_options in calibration_configs:
+            with self.subTest(calibration_method=calibration_method, **extra_options):
+                histograms = {}
+                ranges = {}
+                for max_intermediate_outputs in [None, 1, 3, data_reader.count]:
+                    data_reader.rewind()
+                    augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                        f"augmented_{calibration_method}_{max_intermediate_outputs}.onnx"
+                    )
+                    calibrator = create_calibrator(
+                        test_model_path,
+                        calibrate_method=calibration_method,
+                        augmented_model_path=augmented_model_path,
+                        extra_options={**extra_options, "max_intermediate_outputs": max_intermediate_outputs},
+                    )
+                    # Batches read again by the second pass are not the ones left in the buffer.
+                    calibrator.collect_data(ReusedBufferDataReader(data_reader))
+                    self.assertEqual(len(calibrator.intermediate_outputs), 0)
+                    ranges[max_intermediate_outputs] = calibrator.compute_data()
+                    histograms[max_intermediate_outputs] = calibrator.collector.get_histogram_dict()
+
+                expected_histograms = histograms.pop(None)
+                expected_ranges = ranges.pop(None)
+                for max_intermediate_outputs, histogram_dict in histograms.items():
+                    self.assertEqual(set(histogram_dict), set(expected_histograms))
+                    for tensor, histogram in histogram_dict.items():
+                        self.assertEqual(len(histogram), len(expected_histograms[tensor]))
+                        for actual, expected in zip(histogram, expected_histograms[tensor], strict=True):
+                            np.testing.assert_array_equal(actual, expected)
+                    for tensor, tensor_data in ranges[max_intermediate_outputs].items():
+                        np.testing.assert_array_equal(tensor_data.range_value, expected_ranges[tensor].range_value)
+
     def test_augment_graph_with_zero_value_dimension(self):
         """TEST_CONFIG_5"""
         #   Conv
@@ -527,6 +653,190 @@ class TestCalibrateMinMaxCalibrator(unittest.TestCase):
         for output_name, min_max in output_min_max_dict.items():
             np.testing.assert_equal(min_max, tensors_range[output_name].range_value)
 
+    def test_compute_data_running_reduction(self):
+        """
+        Checks that folding the reduced values of every batch into running values gives the same ranges
+        as keeping all the intermediate outputs.
+        """
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_7.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix(), opset_version=18)
+
+        data_reader = TestDataReader()
+        for extra_options in [
+            {},
+            {"symmetric": True},
+            {"per_channel": True},
+            {"moving_average": True, "averaging_constant": 0.5},
+            {"moving_average": True, "per_channel": True},
+        ]:
+            with self.subTest(**extra_options):
+                tensors_ranges = []
+                for running_options in [
+                    {},
+                    {"running_reduction": True},
+                    {"running_reduction": True, "use_io_binding": True},
+                ]:
+                    augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                        f"./augmented_test_model_7_{len(tensors_ranges)}.onnx"
+                    )
+                    calibrater = create_calibrator(
+                        test_model_path,
+                        augmented_model_path=augmented_model_path.as_posix(),
+                        extra_options={**extra_options, **running_options},
+                    )
+                    # Collect twice to check that the ranges of the calls are merged the same way.
+                    for _ in range(2):
+                        data_reader.rewind()
+                        calibrater.collect_data(data_reader)
+                    self.assertEqual(calibrater.intermediate_outputs, [])
+                    self.assertIsNone(calibrater.running_values)
+                    tensors_ranges.append(calibrater.compute_data())
+
+                expected = tensors_ranges[0]
+                for tensors_range in tensors_ranges[1:]:
+                    self.assertEqual(set(expected.keys()), set(tensors_range.keys()))
+                    for tensor, tensor_data in expected.items():
+                        np.testing.assert_allclose(
+                            tensor_data.range_value, tensors_range[tensor].range_value, rtol=1e-6
+                        )
+
+    def test_calibrators_num_inference_sessions(self):
+        """
+        Checks that running the batches on several inference sessions gives the same ranges as a single session.
+        """
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_4.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix(), augmented=False)
+
+        data_reader = TestDataReader()
+        for calibration_method, extra_options in [
+            (CalibrationMethod.MinMax, {}),
+            (CalibrationMethod.MinMax, {"moving_average": True}),
+            (CalibrationMethod.MinMax, {"running_reduction": True, "use_io_binding": True}),
+            (CalibrationMethod.Percentile, {}),
+            (CalibrationMethod.Entropy, {"max_intermediate_outputs": 1}),
+            (CalibrationMethod.Distribution, {}),
+        ]:
+            with self.subTest(calibration_method=calibration_method, **extra_options):
+                tensors_ranges = []
+                # 3 sessions do not evenly divide the 4 batches.
+                for num_inference_sessions in [1, 3]:
+                    data_reader.rewind()
+                    augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                        f"augmented_{calibration_method}_{num_inference_sessions}.onnx"
+                    )
+                    calibrator = create_calibrator(
+                        test_model_path,
+                        calibrate_method=calibration_method,
+                        augmented_model_path=augmented_model_path,
+                        extra_options={**extra_options, "num_inference_sessions": num_inference_sessions},
+                    )
+                    self.assertEqual(len(calibrator.infer_sessions), num_inference_sessions)
+                    calibrator.collect_data(data_reader)
+                    tensors_ranges.append(calibrator.compute_data())
+
+                expected, tensors_range = tensors_ranges
+                self.assertEqual(set(expected.keys()), set(tensors_range.keys()))
+                for tensor, tensor_data in expected.items():
+                    np.testing.assert_array_equal(tensor_data.range_value, tensors_range[tensor].range_value)
+
+    def test_histogram_calibrators_num_workers(self):
+        """
+        Checks that the ranges computed by a pool of processes are the same as the ones computed sequentially.
+        """
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_4.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix(), augmented=False)
+
+        data_reader = TestDataReader()
+        calibration_methods = [CalibrationMethod.Percentile, CalibrationMethod.Entropy, CalibrationMethod.Distribution]
+        for calibration_method in calibration_methods:
+            with self.subTest(calibration_method=calibration_method):
+                tensors_ranges = []
+                for num_workers in [None, 2]:
+                    data_reader.rewind()
+                    augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                        f"augmented_{calibration_method}_{num_workers}.onnx"
+                    )
+                    calibrator = create_calibrator(
+                        test_model_path,
+                        calibrate_method=calibration_method,
+                        augmented_model_path=augmented_model_path,
+                        extra_options={"num_workers": num_workers},
+                    )
+                    calibrator.collect_data(data_reader)
+                    tensors_ranges.append(calibrator.compute_data())
+
+                expected, tensors_range = tensors_ranges
+                self.assertEqual(set(expected.keys()), set(tensors_range.keys()))
+                for tensor, tensor_data in expected.items():
+                    self.assertEqual(tensor_data.range_value, tensors_range[tensor].range_value)
+                    if calibration_method == CalibrationMethod.Distribution:
+                        self.assertEqual(tensor_data.avg_std, tensors_range[tensor].avg_std)
+
+
+class TestHistogramCollector(unittest.TestCase):
+    def test_entropy_threshold(self):
+        """
+        Checks that all the candidate thresholds evaluated at once lead to the same threshold
+        as evaluating them one at a time.
+        """
+        rng = np.random.default_rng(0)
+        distributions = {
+            "normal": lambda size: rng.normal(0, 1, size),
+            "relu": lambda size: np.maximum(rng.normal(0, 1, size), 0),
+            "heavy_tail": lambda size: rng.standard_t(3, size),
+            "sparse": lambda size: rng.laplace(0, 0.1, size) * (rng.random(size) < 0.3),
+        }
+        for name, distribution in distributions.items():
+            for dtype, num_bins, num_quantized_bins in [
+                (np.float32, 512, 128),
+                (np.float32, 301, 64),
+                (np.float16, 256, 128),
+            ]:
+                with self.subTest(distribution=name, dtype=dtype, num_bins=num_bins):
+                    collector = HistogramCollector(
+                        method="entropy",
+                        symmetric=False,
+                        num_bins=num_bins,
+                        num_quantized_bins=num_quantized_bins,
+                        percentile=99.999,
+                        scenario="same",
+                    )
+                    data = distribution(10000).astype(dtype)
+                    collector.collect({"tensor": data})
+                    # Extends the histogram with larger values.
+                    collector.collect({"tensor": data * dtype(1.5)})
+                    histogram = collector.get_histogram_dict()["tensor"]
+
+                    expected = reference_entropy_threshold(histogram, num_quantized_bins)
+                    threshold = collector.get_entropy_threshold(histogram, num_quantized_bins)
+                    self.assertEqual(expected[0].dtype, threshold[0].dtype)
+                    self.assertEqual(expected, threshold)
+
+    def test_entropy_threshold_random_histograms(self):
+        """
+        Checks that close KL divergences of candidates select the same threshold as evaluating them one at a time.
+        """
+        rng = np.random.default_rng(0)
+        for num_bins, num_quantized_bins in [(256, 64), (1000, 128), (512, 128)]:
+            collector = HistogramCollector(
+                method="entropy",
+                symmetric=False,
+                num_bins=num_bins,
+                num_quantized_bins=num_quantized_bins,
+                percentile=99.999,
+                scenario="same",
+            )
+            for i in range(20):
+                with self.subTest(num_bins=num_bins, num_quantized_bins=num_quantized_bins, i=i):
+                    data = rng.standard_t(rng.uniform(1.5, 10), rng.integers(1000, 200000)) * rng.uniform(0.1, 50)
+                    data = data.astype(np.float32)
+                    hist, hist_edges = np.histogram(data, num_bins)
+                    histogram = (hist, hist_edges.astype(np.float32), data.min(), data.max())
+
+                    expected = reference_entropy_threshold(histogram, num_quantized_bins)
+                    threshold = collector.get_entropy_threshold(histogram, num_quantized_bins)
+                    self.assertEqual(expected, threshold)
+
 
 if __name__ == "__main__":
     unittest.main()
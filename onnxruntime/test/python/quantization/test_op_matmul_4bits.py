@@ -15,6 +15,7 @@ import onnx
 from onnx import TensorProto, helper
 from op_test_utils import TestDataFeeds, check_model_correctness, check_op_type_count, check_qtype_by_node_type
 
+import onnxruntime
 from onnxruntime.quantization import quant_utils
 
 
@@ -387,6 +388,244 @@ class TestOpMatMul4Bits(unittest.TestCase):
         data_reader = self.input_feeds(1, {"input": (100, 52)})
         self.quant_test_with_algo("HQQ", model_fp32_path, data_reader, 32, False)
 
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_hqq_optimize_weights_and_packing(self):
+        if not find_spec("torch"):
+            self.skipTest("skip test_hqq_quant since torch is not installed")
+        import torch
+
+        from onnxruntime.quantization.matmul_4bits_quantizer import HQQWeightOnlyQuantizer
+
+        for bits in [2, 4, 8]:
+            values = torch.randint(0, 2**bits, (6, 16), dtype=torch.int32)
+            compress_ratio = 8 // bits
+            expected = sum(
+                values[:, j::compress_ratio].to(torch.uint8) << (bits * j) for j in range(compress_ratio)
+            ).to(torch.uint8)
+            packed = torch.zeros((6, 16 // compress_ratio), dtype=torch.uint8)
+            HQQWeightOnlyQuantizer.pack_on_row_fast_248bit(packed, values, bits)
+            torch.testing.assert_close(packed, expected, rtol=0, atol=0)
+
+        torch.manual_seed(0)
+        for axis in [0, 1]:
+            weight = torch.randn(256, 64) if axis == 1 else torch.randn(64, 256)
+            w_min = weight.amin(dim=axis, keepdim=True)
+            scale = 15 / (weight.amax(dim=axis, keepdim=True) - w_min)
+            zero = torch.round(-w_min * scale)
+            _, best_zero = HQQWeightOnlyQuantizer.optimize_weights(weight, scale, zero, [0, 15], axis=axis)
+            self.assertEqual(best_zero.shape, zero.shape)
+
+            # Each block keeps a zero point whose error is not larger than the initial one.
+            def block_errors(zero_point, scale=scale, weight=weight, axis=axis):
+                w_q = torch.round(weight * scale + zero_point).clamp(0, 15)
+                return torch.abs(weight - (w_q - zero_point) / scale).mean(dim=axis)
+
+            initial_errors = block_errors(zero)
+            optimized_errors = block_errors(best_zero)
+            self.assertTrue(bool((optimized_errors <= initial_errors).all()))
+            self.assertLess(float(optimized_errors.mean()), float(initial_errors.mean()))
+
+            # Parameters not given by caller have the default values.
+            _, partial_zero = HQQWeightOnlyQuantizer.optimize_weights(
+                weight, scale, zero, [0, 15], axis=axis, opt_params={"iters": 20}
+            )
+            torch.testing.assert_close(partial_zero, best_zero, rtol=0, atol=0)
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_num_workers(self):
+        #      (input)
+        #      /     \
+        #  MatMul_0  MatMul_1 (excluded, shares weight_0)
+        #      \     /
+        #       Add
+        #        |
+        #       If (MatMul in both branches, weight_1 shared and weight_2 from the main graph)
+        #        |
+        #     (output)
+        np.random.seed(13)
+        in_features = 64
+        weights = [
+            onnx.numpy_helper.from_array(np.random.randn(in_features, in_features).astype(np.float32), f"weight_{i}")
+            for i in range(3)
+        ]
+
+        def make_branch(name, weight_name):
+            return helper.make_graph(
+                [helper.make_node("MatMul", ["add_output", weight_name], [f"{name}_output"], f"MatMul_{name}")],
+                name,
+                [],
+                [helper.make_tensor_value_info(f"{name}_output", TensorProto.FLOAT, [-1, in_features])],
+            )
+
+        then_branch = make_branch("then", "weight_1")
+        else_branch = make_branch("else", "weight_2")
+        else_branch.node.append(
+            helper.make_node("MatMul", ["else_output", "weight_1"], ["else_output_1"], "MatMul_else_1")
+        )
+        else_branch.output[0].name = "else_output_1"
+        nodes = [
+            helper.make_node("MatMul", ["input", "weight_0"], ["matmul_0_output"], "MatMul_0"),
+            helper.make_node("MatMul", ["input", "weight_0"], ["matmul_1_output"], "MatMul_1"),
+            helper.make_node("Add", ["matmul_0_output", "matmul_1_output"], ["add_output"], "Add"),
+            helper.make_node("If", ["condition"], ["output"], "If", then_branch=then_branch, else_branch=else_branch),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "matmul_4bits_num_workers_test",
+            [
+                helper.make_tensor_value_info("input", TensorProto.FLOAT, [-1, in_features]),
+                helper.make_tensor_value_info("condition", TensorProto.BOOL, []),
+            ],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [-1, in_features])],
+            initializer=weights,
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 21)])
+        model.ir_version = 10
+
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        for quant_format in [quant_utils.QuantFormat.QOperator, quant_utils.QuantFormat.QDQ]:
+            with self.subTest(quant_format=quant_format):
+                quantized_models = []
+                for num_workers, stream in [(None, False), (3, False), (3, True)]:
+                    model_int4_path = (
+                        Path(self._tmp_model_dir.name) / f"num_workers_{quant_format}_{num_workers}_{stream}"
+                    )
+                    model_int4_path.mkdir()
+                    model_int4_path = str(model_int4_path / "model.onnx")
+                    quant_config = matmul_4bits_quantizer.DefaultWeightOnlyQuantConfig(
+                        block_size=32, is_symmetric=False, quant_format=quant_format
+                    )
+                    quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                        onnx.ModelProto.FromString(model.SerializeToString()),
+                        nodes_to_exclude=["MatMul_1"],
+                        algo_config=quant_config,
+                        num_workers=num_workers,
+                        external_data_path=model_int4_path + ".data" if stream else None,
+                    )
+                    quant.process()
+                    # weight_0 is still used by MatMul_1, the other float weights are not used anymore.
+                    self.assertEqual(
+                        [
+                            init.name
+                            for init in quant.model.model.graph.initializer
+                            if init.name in ("weight_0", "weight_1", "weight_2")
+                        ],
+                        ["weight_0"],
+                    )
+                    if stream:
+                        self.assertTrue(
+                            all(
+                                init.data_location == TensorProto.EXTERNAL
+                                for init in quant.model.model.graph.initializer
+                                if init.name.endswith("Q4")
+                            )
+                        )
+                    quant.model.save_model_to_file(model_int4_path, True)
+                    quantized_models.append(model_int4_path)
+
+                expected = onnx.load(quantized_models[0])
+                self.assertEqual(expected, onnx.load(quantized_models[1]))
+
+                # The streamed model only differs by the layout of its external data.
+                sess_options = onnxruntime.SessionOptions()
+                sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC
+                input_feed = {"input": np.random.randn(4, in_features).astype(np.float32)}
+                for condition in [True, False]:
+                    input_feed["condition"] = np.array(condition)
+                    outputs = [
+                        onnxruntime.InferenceSession(path, sess_options, providers=["CPUExecutionProvider"]).run(
+                            None, input_feed
+                        )
+                        for path in quantized_models
+                    ]
+                    np.testing.assert_array_equal(outputs[0], outputs[2])
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_load_external_data(self):
+        #      (input)
+        #         |
+        #       Gather (not quantized, its data stays external)
+        #         |
+        #      MatMul_0
+        #         |
+        #      MatMul_1
+        #         |
+        #      (output)
+        np.random.seed(17)
+        in_features = 64
+        initializers = [
+            onnx.numpy_helper.from_array(np.random.randn(in_features, in_features).astype(np.float32), name)
+            for name in ["embedding", "weight_0", "weight_1"]
+        ]
+        graph = helper.make_graph(
+            [
+                helper.make_node("Gather", ["embedding", "input"], ["gather_output"], "Gather"),
+                helper.make_node("MatMul", ["gather_output", "weight_0"], ["matmul_0_output"], "MatMul_0"),
+                helper.make_node("MatMul", ["matmul_0_output", "weight_1"], ["output"], "MatMul_1"),
+            ],
+            "matmul_4bits_external_data_test",
+            [helper.make_tensor_value_info("input", TensorProto.INT64, [-1])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [-1, in_features])],
+            initializer=initializers,
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 21)])
+        model.ir_version = 10
+        model_dir = Path(self._tmp_model_dir.name) / "load_external_data"
+        model_dir.mkdir()
+        model_fp32_path = str(model_dir / "model_fp32.onnx")
+        onnx.save(model, model_fp32_path, save_as_external_data=True, location="model_fp32.onnx.data")
+
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        expected = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, block_size=32)
+        expected.process()
+        expected_model = onnx.ModelProto.FromString(expected.model.model.SerializeToString())
+        (model_dir / "expected").mkdir()
+        expected_path = str(model_dir / "expected" / "model_int4.onnx")
+        expected.model.save_model_to_file(expected_path, True)
+
+        for num_workers in [None, 2]:
+            with self.subTest(num_workers=num_workers):
+                # The external data is loaded in memory at the end without external_data_path.
+                quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                    model_fp32_path, block_size=32, num_workers=num_workers, load_external_data=False
+                )
+                quant.process()
+                self.assertEqual(expected_model, quant.model.model)
+
+                output_dir = model_dir / f"output_{num_workers}"
+                output_dir.mkdir()
+                model_int4_path = str(output_dir / "model_int4.onnx")
+                quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                    model_fp32_path,
+                    block_size=32,
+                    num_workers=num_workers,
+                    external_data_path=model_int4_path + ".data",
+                    load_external_data=False,
+                )
+                quant.process()
+                initializers = {tensor.name: tensor for tensor in quant.model.model.graph.initializer}
+                for name in ["embedding", "weight_0_Q4", "weight_1_Q4"]:
+                    self.assertEqual(initializers[name].data_location, TensorProto.EXTERNAL)
+                    self.assertEqual(initializers[name].external_data[0].value, "model_int4.onnx.data")
+                quant.model.save_model_to_file(model_int4_path, True)
+                self.assertEqual(onnx.load(expected_path), onnx.load(model_int4_path))
+
+        # Other algorithms would load the whole model again.
+        with self.assertRaises(ValueError):
+            matmul_4bits_quantizer.MatMul4BitsQuantizer(
+                model_fp32_path,
+                algo_config=matmul_4bits_quantizer.RTNWeightOnlyQuantConfig(),
+                load_external_data=False,
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
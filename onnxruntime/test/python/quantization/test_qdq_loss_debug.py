@@ -22,6 +22,7 @@ from onnxruntime.quantization.qdq_loss_debug import (
     QUANT_INPUT_SUFFIX,
     collect_activations,
     compute_activation_error,
+    compute_activation_error_streaming,
     compute_weight_error,
     create_activation_matching,
     create_weight_matching,
@@ -213,6 +214,23 @@ class TestSaveActivations(unittest.TestCase):
                 f"{tensor_name} qdq error {activations_error[tensor_name]['qdq_err']} exceeds threashold.",
             )
 
+        # The streaming comparison accumulates the same errors without collecting the activations.
+        data_reader.rewind()
+        streaming_error = compute_activation_error_streaming(
+            augmented_qdq_model_path, data_reader, augmented_float_model_path
+        )
+        self.assertEqual(streaming_error.keys(), activations_error.keys())
+        for tensor_name, errors in activations_error.items():
+            self.assertEqual(streaming_error[tensor_name].keys(), errors.keys())
+            for err_name, err in errors.items():
+                self.assertAlmostEqual(streaming_error[tensor_name][err_name], err, places=3)
+
+        data_reader.rewind()
+        qdq_only_error = compute_activation_error_streaming(augmented_qdq_model_path, data_reader)
+        for tensor_name, errors in qdq_only_error.items():
+            self.assertEqual(list(errors), ["qdq_err"])
+            self.assertAlmostEqual(errors["qdq_err"], streaming_error[tensor_name]["qdq_err"])
+
     def test_create_weight_matching(self):
         # Setup: create float model:
         float_model_path = str(Path(self._tmp_model_dir.name) / "float_model3.onnx")
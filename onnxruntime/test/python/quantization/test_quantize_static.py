@@ -22,7 +22,14 @@ from op_test_utils import (
 )
 
 import onnxruntime as ort
-from onnxruntime.quantization import QuantType, StaticQuantConfig, quantize, quantize_static
+from onnxruntime.quantization import (
+    CalibrationMethod,
+    QuantType,
+    StaticQuantConfig,
+    compute_data_fingerprint,
+    quantize,
+    quantize_static,
+)
 
 
 def construct_test_model(test_model_path, channel_size):
@@ -151,6 +158,50 @@ class TestStaticQuantization(unittest.TestCase):
         check_model_correctness(self, self._model_fp32_path, quant_model_path, data_reader.get_next())
         data_reader.rewind()
 
+    def test_calibration_cache(self):
+        data_reader = input_feeds_neg_one_zero_one(10, {"input": [1, self._channel_size, 1, 3]})
+        data_fingerprint = compute_data_fingerprint(data_reader.data_feeds)
+        cache_dir = Path(self._tmp_model_dir.name) / "calibration_cache"
+
+        def get_next_not_called():
+            raise AssertionError("The calibration data should not be read when the calibration is cached.")
+
+        for calibrate_method, calib_extra_options in [
+            (CalibrationMethod.MinMax, {}),
+            (CalibrationMethod.Percentile, {"CalibPercentile": 99.9}),
+            (CalibrationMethod.Percentile, {"CalibPercentile": 99.0}),
+            # Collecting the histograms in chunks gives the same ranges, so they are cached already.
+            (CalibrationMethod.Percentile, {"CalibPercentile": 99.0, "CalibMaxIntermediateOutputs": 3}),
+        ]:
+            with self.subTest(calibrate_method=calibrate_method, **calib_extra_options):
+                quant_model_paths = []
+                for run in ["no_cache", "cache", "cached"]:
+                    extra_options = dict(calib_extra_options)
+                    if run != "no_cache":
+                        extra_options.update(
+                            {"CalibCacheDir": str(cache_dir), "CalibDataFingerprint": data_fingerprint}
+                        )
+                    data_reader.rewind()
+                    if run == "cached" or (run == "cache" and calib_extra_options.get("CalibPercentile") == 99.0):
+                        # The ranges are cached or, for the second percentile, computed from the cached histograms.
+                        data_reader.get_next = get_next_not_called
+                    quant_model_paths.append(
+                        str(Path(self._tmp_model_dir.name) / f"quant.{calibrate_method}.{len(quant_model_paths)}.onnx")
+                    )
+                    quantize_static(
+                        self._model_fp32_path,
+                        quant_model_paths[-1],
+                        data_reader,
+                        calibrate_method=calibrate_method,
+                        extra_options=extra_options,
+                    )
+                    if "get_next" in data_reader.__dict__:
+                        del data_reader.get_next
+
+                expected = onnx.load(quant_model_paths[0])
+                for quant_model_path in quant_model_paths[1:]:
+                    self.assertEqual(expected.graph, onnx.load(quant_model_path).graph)
+
     @unittest.skip(
         "Skip failed test in Python Packaging Test Pipeline."
         "During importing neural_compressor, pycocotools throws ValueError: numpy.ndarray size changed"
@@ -0,0 +1,135 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark topological sort of OnnxModel on synthetic deep graphs.
+
+Example:
+    python benchmark_topological_sort.py --num_nodes 500000
+    python benchmark_topological_sort.py --num_nodes 50000 --optimize
+"""
+
+import argparse
+import random
+import time
+
+from onnx import TensorProto, helper
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from onnx_model import OnnxModel
+    from optimizer import optimize_model
+    from symbolic_shape_infer import topological_sort_nodes
+else:
+    from onnxruntime.tools.symbolic_shape_infer import topological_sort_nodes
+    from onnxruntime.transformers.onnx_model import OnnxModel
+    from onnxruntime.transformers.optimizer import optimize_model
+
+
+def create_model(num_nodes: int, hidden_size: int = 8, seed: int = 0):
+    """
+    Creates a deep graph of residual blocks like MatMul -> Add -> Relu -> MatMul -> Add -> Add (residual) -> Mul.
+    Nodes are shuffled so that the graph has to be sorted.
+    """
+    nodes = []
+    x = "input"
+    layer = 0
+    while len(nodes) < num_nodes:
+        nodes.extend(
+            [
+                helper.make_node("MatMul", [x, "weight"], [f"matmul1_{layer}"], f"MatMul1_{layer}"),
+                helper.make_node("Add", [f"matmul1_{layer}", "bias"], [f"add1_{layer}"], f"Add1_{layer}"),
+                helper.make_node("Relu", [f"add1_{layer}"], [f"relu_{layer}"], f"Relu_{layer}"),
+                helper.make_node("MatMul", [f"relu_{layer}", "weight"], [f"matmul2_{layer}"], f"MatMul2_{layer}"),
+                helper.make_node("Add", [f"matmul2_{layer}", "bias"], [f"add2_{layer}"], f"Add2_{layer}"),
+                helper.make_node("Add", [f"add2_{layer}", x], [f"residual_{layer}"], f"Residual_{layer}"),
+                helper.make_node("Mul", [f"residual_{layer}", "scale"], [f"output_{layer}"], f"Mul_{layer}"),
+            ]
+        )
+        x = f"output_{layer}"
+        layer += 1
+    nodes.append(helper.make_node("Identity", [x], ["output"], "Output"))
+    random.Random(seed).shuffle(nodes)
+
+    graph = helper.make_graph(
+        nodes,
+        "deep_graph",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch_size", hidden_size])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch_size", hidden_size])],
+        initializer=[
+            helper.make_tensor("weight", TensorProto.FLOAT, [hidden_size, hidden_size], [0.1] * hidden_size**2),
+            helper.make_tensor("bias", TensorProto.FLOAT, [hidden_size], [0.1] * hidden_size),
+            helper.make_tensor("scale", TensorProto.FLOAT, [], [0.5]),
+        ],
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+
+def repeated_sweep_sort(graph):
+    """The previous implementation: sweep nodes until no more node can be appended, which is O(N^2)."""
+    known_names = {init.name for init in graph.initializer} | {input.name for input in graph.input}
+    sorted_nodes = []
+    is_sorted = [False] * len(graph.node)
+    progress = True
+    while progress:
+        progress = False
+        for index, node in enumerate(graph.node):
+            if not is_sorted[index] and all(name in known_names for name in node.input if name):
+                sorted_nodes.append(node)
+                is_sorted[index] = True
+                known_names.update(node.output)
+                progress = True
+    return sorted_nodes
+
+
+def run(args):
+    model = create_model(args.num_nodes)
+    graph = model.graph
+    print(f"nodes: {len(graph.node)}")
+
+    known_names = [init.name for init in graph.initializer] + [input.name for input in graph.input]
+    for is_deterministic in [False, True]:
+        start = time.perf_counter()
+        sorted_nodes = topological_sort_nodes(graph.node, known_names, is_deterministic)
+        print(f"topological_sort_nodes(is_deterministic={is_deterministic}): {time.perf_counter() - start:.2f} s")
+        assert len(sorted_nodes) == len(graph.node)
+
+    if args.compare_nodes > 0:
+        small_graph = create_model(args.compare_nodes).graph
+        start = time.perf_counter()
+        repeated_sweep_sort(small_graph)
+        latency = time.perf_counter() - start
+        print(f"repeated sweep on {len(small_graph.node)} nodes: {latency:.2f} s")
+
+    if args.optimize:
+        onnx_model = OnnxModel(model)
+        start = time.perf_counter()
+        onnx_model.topological_sort()
+        sort_latency = time.perf_counter() - start
+
+        start = time.perf_counter()
+        optimize_model(onnx_model.model, model_type="bert", num_heads=0, hidden_size=0, opt_level=0)
+        optimize_latency = time.perf_counter() - start
+        print(
+            f"OnnxModel.topological_sort: {sort_latency:.2f} s, optimize_model: {optimize_latency:.2f} s "
+            f"({sort_latency / optimize_latency:.1%})"
+        )
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_nodes", type=int, default=500000, help="Number of nodes in the synthetic graph.")
+    parser.add_argument(
+        "--compare_nodes",
+        type=int,
+        default=5000,
+        help="Number of nodes to run the previous repeated sweep sort. 0 to skip it.",
+    )
+    parser.add_argument("--optimize", action="store_true", help="Also time optimize_model on the synthetic graph.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_arguments())
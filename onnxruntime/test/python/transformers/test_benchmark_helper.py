@@ -0,0 +1,119 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import csv
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from benchmark_helper import (
+        get_cpu_sets,
+        get_throughput_configs,
+        get_throughput_result,
+        inference_ort_throughput,
+        output_throughput_results,
+        run_throughput_benchmark,
+    )
+else:
+    from onnxruntime.transformers.benchmark_helper import (
+        get_cpu_sets,
+        get_throughput_configs,
+        get_throughput_result,
+        inference_ort_throughput,
+        output_throughput_results,
+        run_throughput_benchmark,
+    )
+
+
+def create_model(model_path):
+    weight = np.random.default_rng(0).standard_normal((32, 32)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("MatMul", ["input", "weight"], ["output"], "matmul")],
+        "graph",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch_size", 32])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch_size", 32])],
+        initializer=[numpy_helper.from_array(weight, "weight")],
+    )
+    onnx.save_model(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)]), model_path)
+
+
+class TestThroughputBenchmark(unittest.TestCase):
+    def test_get_throughput_result(self):
+        result = get_throughput_result([0.001 * i for i in range(1, 1001)], 2, duration=0.5, cpu_time=1.0, num_cpus=4)
+        self.assertEqual(result["test_times"], 1000)
+        self.assertEqual(result["QPS"], "4000.00")
+        self.assertEqual(result["latency_50_percentile"], "500.50")
+        self.assertEqual(result["latency_999_percentile"], "999.00")
+        self.assertEqual(result["cpu_utilization"], "50.0")
+
+    def test_get_throughput_configs(self):
+        configs = get_throughput_configs(2, 8, inter_op_num_threads_list=[1, 2])
+        self.assertEqual(
+            [(c["per_worker_session"], c["intra_op_num_threads"], c["inter_op_num_threads"]) for c in configs],
+            [
+                (False, 8, 1),
+                (False, 4, 1),
+                (False, 2, 1),
+                (False, 1, 1),
+                (False, 4, 2),
+                (False, 2, 2),
+                (False, 1, 2),
+                (True, 4, 1),
+            ],
+        )
+        self.assertEqual(get_cpu_sets(2, list(range(5))), [{0, 1}, {2, 3}])
+        with self.assertRaises(ValueError):
+            get_cpu_sets(3, [0, 1])
+
+    def test_inference_ort_throughput(self):
+        import onnxruntime
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            model_path = os.path.join(temp_dir, "model.onnx")
+            create_model(model_path)
+            ort_inputs = {"input": np.ones((2, 32), dtype=np.float32)}
+
+            sessions = []
+
+            def create_session():
+                sessions.append(onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"]))
+                return sessions[-1]
+
+            for per_worker_session in [False, True]:
+                sessions.clear()
+                result = inference_ort_throughput(
+                    create_session, ort_inputs, {"model_name": "test"}, 50, 2, 3, per_worker_session, warm_up_repeat=1
+                )
+                self.assertEqual(len(sessions), 3 if per_worker_session else 1)
+                self.assertEqual(result["test_times"], 50)
+                self.assertEqual(result["sessions"], len(sessions))
+                self.assertEqual(result["model_name"], "test")
+                self.assertGreater(float(result["QPS"]), 0)
+
+            def create_invalid_session():
+                raise RuntimeError("invalid session")
+
+            with self.assertRaises(RuntimeError):
+                inference_ort_throughput(create_invalid_session, ort_inputs, {}, 10, 2, 2, per_worker_session=True)
+
+            results = run_throughput_benchmark(model_path, ort_inputs, {"model_name": "test"}, 20, 2, [1, 2])
+            self.assertEqual(
+                [float(r["QPS"]) for r in results], sorted((float(r["QPS"]) for r in results), reverse=True)
+            )
+            csv_filename = os.path.join(temp_dir, "throughput.csv")
+            output_throughput_results(results, csv_filename)
+            with open(csv_filename) as csv_file:
+                rows = list(csv.DictReader(csv_file))
+            self.assertEqual(len(rows), len(results))
+            self.assertEqual(rows[0]["model_name"], "test")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+from onnx.external_data_helper import uses_external_data
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from float16 import (
+        ExternalDataWriter,
+        convert_float_to_float16,
+        convert_float_to_float16_out_of_core,
+        convert_np_to_float16,
+    )
+else:
+    from onnxruntime.transformers.float16 import (
+        ExternalDataWriter,
+        convert_float_to_float16,
+        convert_float_to_float16_out_of_core,
+        convert_np_to_float16,
+    )
+
+
+def convert_np_to_float16_reference(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0):
+    def between(a, b, c):
+        return np.logical_and(a < b, b < c)
+
+    np_array = np.where(between(0, np_array, min_positive_val), min_positive_val, np_array)
+    np_array = np.where(between(-min_positive_val, np_array, 0), -min_positive_val, np_array)
+    np_array = np.where(between(max_finite_val, np_array, float("inf")), max_finite_val, np_array)
+    np_array = np.where(between(float("-inf"), np_array, -max_finite_val), -max_finite_val, np_array)
+    return np.float16(np_array)
+
+
+class TestFloat16Conversion(unittest.TestCase):
+    def test_convert_np_to_float16(self):
+        special_values = [0, -0.0, np.nan, np.inf, -np.inf, 5.96e-08, -5.96e-08, 1e-9, -1e-9, 65504, -7e4, 3e38, 1.5]
+        rng = np.random.default_rng(0)
+        random_values = rng.standard_normal(3000) * rng.choice([1e-9, 1e-6, 1.0, 1e5], 3000)
+        for dtype in [np.float32, np.float64]:
+            for values in [special_values, random_values]:
+                np_array = np.array(values, dtype=dtype).reshape(-1, 1)
+                for min_positive_val, max_finite_val in [(5.96e-08, 65504.0), (1e-7, 1e4)]:
+                    expected = convert_np_to_float16_reference(np_array, min_positive_val, max_finite_val)
+                    actual = convert_np_to_float16(np_array, min_positive_val, max_finite_val)
+                    self.assertEqual(actual.shape, expected.shape)
+                    self.assertEqual(actual.tobytes(), expected.tobytes())
+
+    def create_model(self):
+        rng = np.random.default_rng(0)
+        weights = [(rng.standard_normal((64, 64)) * 1e5).astype(np.float32) for _ in range(3)]
+        nodes = [
+            helper.make_node("MatMul", ["input", "weight_0"], ["matmul_0"], "matmul_0"),
+            helper.make_node("MatMul", ["matmul_0", "weight_1"], ["matmul_1"], "matmul_1"),
+            helper.make_node("Add", ["matmul_1", "weight_2"], ["add"], "add"),
+            helper.make_node("Mul", ["add", "scale"], ["output"], "mul"),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "graph",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch_size", 64])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch_size", 64])],
+            initializer=[numpy_helper.from_array(weight, f"weight_{i}") for i, weight in enumerate(weights)]
+            + [helper.make_tensor("scale", TensorProto.FLOAT, [1], [1e-9])],
+        )
+        return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+    def test_convert_with_external_data_writer(self):
+        expected = convert_float_to_float16(self.create_model(), num_threads=1)
+        expected_arrays = {init.name: numpy_helper.to_array(init) for init in expected.graph.initializer}
+
+        with tempfile.TemporaryDirectory() as base_dir:
+            # The source model has external data that is not loaded, and float16 data is written to another file.
+            model_path = os.path.join(base_dir, "model.onnx")
+            onnx.save_model(self.create_model(), model_path, save_as_external_data=True, location="model.onnx.data")
+            model = onnx.load(model_path, load_external_data=False)
+            with ExternalDataWriter(base_dir, "model_fp16.onnx.data") as writer:
+                model = convert_float_to_float16(
+                    model, disable_shape_infer=True, num_threads=2, base_dir=base_dir, external_data_writer=writer
+                )
+
+            initializers = {init.name: init for init in model.graph.initializer}
+            self.assertTrue(all(init.data_type == TensorProto.FLOAT16 for init in initializers.values()))
+            self.assertTrue(all(uses_external_data(initializers[f"weight_{i}"]) for i in range(3)))
+            # Data smaller than size threshold is kept in the tensor.
+            self.assertFalse(uses_external_data(initializers["scale"]))
+
+            for name, init in initializers.items():
+                offsets = [int(entry.value) for entry in init.external_data if entry.key == "offset"]
+                self.assertTrue(all(offset % writer.align == 0 for offset in offsets))
+                np.testing.assert_array_equal(numpy_helper.to_array(init, base_dir), expected_arrays[name])
+
+    def test_convert_float_to_float16_out_of_core(self):
+        # Add is kept in float32, so its weight is not converted but copied to the new data file.
+        expected = convert_float_to_float16(self.create_model(), node_block_list=["add"])
+        expected_arrays = {init.name: numpy_helper.to_array(init) for init in expected.graph.initializer}
+
+        with tempfile.TemporaryDirectory() as input_dir, tempfile.TemporaryDirectory() as output_dir:
+            model_path = os.path.join(input_dir, "model.onnx")
+            onnx.save_model(self.create_model(), model_path, save_as_external_data=True, location="model.onnx.data")
+            output_path = os.path.join(output_dir, "model_fp16.onnx")
+            convert_float_to_float16_out_of_core(model_path, output_path, node_block_list=["add"])
+
+            # The converted model does not refer to data of the input model.
+            os.remove(os.path.join(input_dir, "model.onnx.data"))
+            model = onnx.load(output_path)
+            self.assertEqual(
+                [node.op_type for node in model.graph.node], [node.op_type for node in expected.graph.node]
+            )
+            for init in model.graph.initializer:
+                np.testing.assert_array_equal(numpy_helper.to_array(init), expected_arrays[init.name])
+            self.assertEqual(model.graph.initializer[2].data_type, TensorProto.FLOAT)
+
+            # The data file of the input model cannot be used as output.
+            with self.assertRaises(ValueError):
+                convert_float_to_float16_out_of_core(output_path, os.path.join(output_dir, "model_fp16.onnx"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,320 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from onnx import TensorProto, helper, numpy_helper
+from onnx.external_data_helper import set_external_data, uses_external_data
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from onnx_model import OnnxModel
+else:
+    from onnxruntime.transformers.onnx_model import OnnxModel
+
+
+class TestOnnxModelGraphIndex(unittest.TestCase):
+    def create_model(self):
+        then_branch = helper.make_graph(
+            [helper.make_node("Mul", ["b", "b"], ["then_out"], "then_mul")],
+            "then_branch",
+            [],
+            [helper.make_tensor_value_info("then_out", TensorProto.FLOAT, [2])],
+        )
+        else_branch = helper.make_graph(
+            [helper.make_node("Neg", ["c"], ["else_out"], "else_neg")],
+            "else_branch",
+            [],
+            [helper.make_tensor_value_info("else_out", TensorProto.FLOAT, [2])],
+        )
+        nodes = [
+            helper.make_node("Relu", ["x"], ["a"], "relu"),
+            helper.make_node("Add", ["a", "x"], ["b"], "add"),
+            helper.make_node("Sub", ["a", "b"], ["c"], "sub"),
+            helper.make_node("If", ["cond"], ["y"], "if", then_branch=then_branch, else_branch=else_branch),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "main",
+            [
+                helper.make_tensor_value_info("x", TensorProto.FLOAT, [2]),
+                helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+            ],
+            [helper.make_tensor_value_info("y", TensorProto.FLOAT, [2])],
+        )
+        return OnnxModel(helper.make_model(graph))
+
+    def assert_index_up_to_date(self, model: OnnxModel):
+        input_name_to_nodes = {k: [n.name for n in v] for k, v in model.input_name_to_nodes().items()}
+        output_name_to_node = {k: v.name for k, v in model.output_name_to_node().items()}
+
+        model.invalidate_graph_index()
+        self.assertEqual(input_name_to_nodes, {k: [n.name for n in v] for k, v in model.input_name_to_nodes().items()})
+        self.assertEqual(output_name_to_node, {k: v.name for k, v in model.output_name_to_node().items()})
+
+    def test_index_is_updated_by_mutators(self):
+        model = self.create_model()
+        self.assertEqual([n.name for n in model.input_name_to_nodes()["b"]], ["sub", "then_mul", "then_mul"])
+        self.assertEqual(model.get_graph_by_node(model.get_nodes_by_op_type("Neg")[0]).name, "else_branch")
+
+        snapshot = model.input_name_to_nodes()
+        model.replace_input_of_all_nodes("b", "a")
+        self.assertEqual([n.name for n in snapshot["b"]], ["sub", "then_mul", "then_mul"])
+        self.assertEqual(
+            [n.name for n in model.input_name_to_nodes()["a"]], ["add", "sub", "sub", "then_mul", "then_mul"]
+        )
+        self.assert_index_up_to_date(model)
+
+        # Consumers are in the same order as nodes(), so node added to main graph is before nodes of subgraphs.
+        model.add_node(helper.make_node("Identity", ["a"], ["d"], "identity"))
+        self.assertEqual(
+            [n.name for n in model.input_name_to_nodes()["a"]],
+            ["add", "sub", "sub", "identity", "then_mul", "then_mul"],
+        )
+        self.assert_index_up_to_date(model)
+
+        # A copy of a node in graphs could also be removed.
+        sub = model.get_nodes_by_op_type("Sub")[0]
+        sub_copy = helper.make_node("Sub", ["a", "a"], ["c"], "sub")
+        model.remove_node(sub_copy)
+        self.assertNotIn("c", model.output_name_to_node())
+        self.assertIsNone(model.get_graph_by_node(sub))
+        self.assert_index_up_to_date(model)
+
+        model.replace_output_of_all_nodes("d", "c")
+        self.assertEqual(model.get_parent(model.get_nodes_by_op_type("Neg")[0], 0).name, "identity")
+        self.assert_index_up_to_date(model)
+
+        model.remove_nodes(model.get_nodes_by_op_type("Add"))
+        self.assertEqual([n.name for n in model.input_name_to_nodes()["x"]], ["relu"])
+        self.assert_index_up_to_date(model)
+
+    def test_index_with_reused_output_name(self):
+        model = self.create_model()
+        add = model.get_nodes_by_op_type("Add")[0]
+        self.assertIs(model.get_parent(model.get_nodes_by_op_type("Sub")[0], 1), add)
+
+        # A fused node could reuse output name of a node to be removed. The last one in graph is the producer.
+        model.add_node(helper.make_node("Sum", ["a", "x"], ["b"], "sum"))
+        self.assertEqual(model.get_parent(model.get_nodes_by_op_type("Sub")[0], 1).name, "sum")
+        self.assert_index_up_to_date(model)
+
+        model.remove_node(model.get_nodes_by_op_type("Sum")[0])
+        self.assertIs(model.get_parent(model.get_nodes_by_op_type("Sub")[0], 1), add)
+        self.assert_index_up_to_date(model)
+
+        # Output of all nodes that produce the name is replaced.
+        model.add_node(helper.make_node("Sum", ["a", "x"], ["b"], "sum"))
+        model.replace_output_of_all_nodes("b", "e")
+        self.assertEqual([node.output[0] for node in model.get_nodes_by_op_type("Add")], ["e"])
+        self.assertEqual([node.output[0] for node in model.get_nodes_by_op_type("Sum")], ["e"])
+        self.assertNotIn("b", model.output_name_to_node())
+        self.assert_index_up_to_date(model)
+
+    def test_topological_sort(self):
+        model = self.create_model()
+        graph = model.graph()
+        nodes = list(graph.node)
+        # The If node uses "b" and "c" in subgraphs, so it shall be placed after Add and Sub.
+        graph.ClearField("node")
+        graph.node.extend([nodes[3], nodes[2], nodes[1], nodes[0]])
+        model.topological_sort()
+        self.assertEqual([node.name for node in model.nodes()[:4]], ["relu", "add", "sub", "if"])
+
+        graph.ClearField("node")
+        graph.node.extend([nodes[3], nodes[1], nodes[0], nodes[2]])
+        model.topological_sort(is_deterministic=True)
+        self.assertEqual([node.name for node in model.nodes()[:4]], ["relu", "add", "sub", "if"])
+
+        model.add_nodes([helper.make_node("Neg", ["w"], ["v"], "neg"), helper.make_node("Abs", ["v"], ["w"], "abs")])
+        with self.assertRaises(RuntimeError):
+            model.topological_sort()
+
+    def test_topological_sort_ignores_subgraphs_of_contrib_ops(self):
+        # Like BeamSearch, whose decoder subgraph has its own inputs, only If/Loop/Scan subgraphs are visited.
+        decoder = helper.make_graph(
+            [helper.make_node("Identity", ["past"], ["present"], "identity")],
+            "decoder",
+            [],
+            [helper.make_tensor_value_info("present", TensorProto.FLOAT, [2])],
+        )
+        graph = helper.make_graph(
+            [helper.make_node("BeamSearch", ["x"], ["y"], "beam_search", domain="com.microsoft", decoder=decoder)],
+            "main",
+            [helper.make_tensor_value_info("x", TensorProto.FLOAT, [2])],
+            [helper.make_tensor_value_info("y", TensorProto.FLOAT, [2])],
+        )
+        model = OnnxModel(helper.make_model(graph))
+        model.topological_sort()
+        self.assertEqual([node.name for node in model.graph().node], ["beam_search"])
+
+    def test_prune_graph_in_dirty_region(self):
+        nodes = [
+            helper.make_node("Relu", ["x"], ["a"], "relu"),
+            helper.make_node("Mul", ["a", "scale"], ["b"], "mul"),
+            helper.make_node("Add", ["b", "bias"], ["c"], "add"),
+            helper.make_node("Sigmoid", ["a"], ["d"], "sigmoid"),
+            helper.make_node("Sub", ["c", "d"], ["y"], "sub"),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "main",
+            [helper.make_tensor_value_info("x", TensorProto.FLOAT, [2])],
+            [helper.make_tensor_value_info("y", TensorProto.FLOAT, [2])],
+            initializer=[
+                helper.make_tensor("scale", TensorProto.FLOAT, [], [2.0]),
+                helper.make_tensor("bias", TensorProto.FLOAT, [], [1.0]),
+            ],
+        )
+        model = OnnxModel(helper.make_model(graph))
+        model.prune_graph()
+        self.assertEqual(len(model.nodes()), 5)
+
+        # Bypass Mul and Add like a fusion, and edit Sub directly. Then only the changed region is visited.
+        model.add_node(helper.make_node("Neg", ["a"], ["e"], "neg"))
+        model.replace_input_of_all_nodes("c", "e")
+        model.get_nodes_by_op_type("Sub")[0].input[1] = "a"
+        expected = OnnxModel(helper.make_model(model.graph()))
+        model.prune_graph()
+        expected.prune_graph()
+
+        self.assertEqual([node.name for node in model.nodes()], ["relu", "sub", "neg"])
+        self.assertEqual(len(model.graph().initializer), 0)
+        self.assertEqual(model.model.SerializeToString(), expected.model.SerializeToString())
+        self.assert_index_up_to_date(model)
+
+    def test_update_graph_after_direct_edit(self):
+        graph = helper.make_graph(
+            [helper.make_node("Add", ["x", "w1"], ["y"], "add")],
+            "main",
+            [helper.make_tensor_value_info("x", TensorProto.FLOAT, [2])],
+            [helper.make_tensor_value_info("y", TensorProto.FLOAT, [2])],
+            initializer=[helper.make_tensor("w1", TensorProto.FLOAT, [], [1.0])],
+        )
+        model = OnnxModel(helper.make_model(graph))
+        model.prune_graph()
+
+        # The input is edited directly, so only update_graph could find that w1 is unused and w2 is used.
+        model.add_initializer(helper.make_tensor("w2", TensorProto.FLOAT, [], [2.0]))
+        model.get_nodes_by_op_type("Add")[0].input[1] = "w2"
+        model.update_graph()
+
+        self.assertEqual([initializer.name for initializer in model.graph().initializer], ["w2"])
+        self.assert_index_up_to_date(model)
+
+
+class TestOnnxModelDuplicatedInitializer(unittest.TestCase):
+    def test_remove_duplicated_initializer(self):
+        weight = np.arange(6, dtype=np.float32).reshape(2, 3)
+        then_branch = helper.make_graph(
+            [helper.make_node("MatMul", ["x", "then_weight"], ["then_out"], "then_matmul")],
+            "then_branch",
+            [],
+            [helper.make_tensor_value_info("then_out", TensorProto.FLOAT, [1, 3])],
+            initializer=[numpy_helper.from_array(weight, "then_weight")],
+        )
+        else_branch = helper.make_graph(
+            [helper.make_node("MatMul", ["x", "else_weight"], ["else_out"], "else_matmul")],
+            "else_branch",
+            [],
+            [helper.make_tensor_value_info("else_out", TensorProto.FLOAT, [1, 3])],
+            initializer=[numpy_helper.from_array(weight + 1, "else_weight")],
+        )
+        graph = helper.make_graph(
+            [
+                helper.make_node("MatMul", ["x", "weight"], ["a"], "matmul1"),
+                helper.make_node("MatMul", ["x", "weight_copy"], ["b"], "matmul2"),
+                helper.make_node("MatMul", ["x", "weight_transposed"], ["c"], "matmul3"),
+                helper.make_node("If", ["cond"], ["y"], "if", then_branch=then_branch, else_branch=else_branch),
+            ],
+            "main",
+            [
+                helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 2]),
+                helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+            ],
+            [helper.make_tensor_value_info(name, TensorProto.FLOAT, [1, 3]) for name in ["a", "b", "c", "y"]],
+            initializer=[
+                numpy_helper.from_array(weight, "weight"),
+                numpy_helper.from_array(weight.copy(), "weight_copy"),
+                numpy_helper.from_array(weight.reshape(3, 2), "weight_transposed"),
+            ],
+        )
+        model = OnnxModel(helper.make_model(graph))
+
+        with tempfile.TemporaryDirectory() as base_dir:
+            # Data of an external tensor is compared without loading it into the tensor.
+            with open(os.path.join(base_dir, "weights.bin"), "wb") as f:
+                f.write(b"\0" * 8)
+                f.write(weight.tobytes())
+            weight_copy = model.get_initializer("weight_copy")
+            set_external_data(weight_copy, "weights.bin", offset=8, length=weight.nbytes)
+            weight_copy.ClearField("raw_data")
+            weight_copy.data_location = TensorProto.EXTERNAL
+
+            model.remove_duplicated_initializer(base_dir=base_dir)
+
+        self.assertEqual([init.name for init in model.model.graph.initializer], ["weight", "weight_transposed"])
+        # The initializer in subgraph is replaced by the one in main graph.
+        if_node = model.get_nodes_by_op_type("If")[0]
+        self.assertEqual([init.name for attr in if_node.attribute for init in attr.g.initializer], ["else_weight"])
+        self.assertEqual(
+            [node.input[1] for node in model.nodes() if node.op_type == "MatMul"],
+            ["weight", "weight", "weight_transposed", "else_weight", "weight"],
+        )
+        self.assertFalse(any(uses_external_data(init) for init in model.model.graph.initializer))
+
+    def test_sibling_subgraphs_with_same_initializer_name(self):
+        def create_model(then_value, else_value):
+            def create_branch(name, value):
+                return helper.make_graph(
+                    [helper.make_node("Add", ["x", "c"], [f"{name}_out"], f"{name}_add")],
+                    name,
+                    [],
+                    [helper.make_tensor_value_info(f"{name}_out", TensorProto.FLOAT, [3])],
+                    initializer=[numpy_helper.from_array(np.array(value, dtype=np.float32), "c")],
+                )
+
+            graph = helper.make_graph(
+                [
+                    helper.make_node("Add", ["x", "m"], ["a"], "add"),
+                    helper.make_node(
+                        "If",
+                        ["cond"],
+                        ["y"],
+                        "if",
+                        then_branch=create_branch("then_branch", then_value),
+                        else_branch=create_branch("else_branch", else_value),
+                    ),
+                ],
+                "main",
+                [
+                    helper.make_tensor_value_info("x", TensorProto.FLOAT, [3]),
+                    helper.make_tensor_value_info("cond", TensorProto.BOOL, []),
+                ],
+                [helper.make_tensor_value_info(name, TensorProto.FLOAT, [3]) for name in ["a", "y"]],
+                initializer=[numpy_helper.from_array(np.array([1, 2, 3], dtype=np.float32), "m")],
+            )
+            return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+
+        import onnxruntime
+
+        x = np.zeros(3, dtype=np.float32)
+        # The initializer that equals to the one in main graph is in either branch.
+        for then_value, else_value in [([4, 5, 6], [1, 2, 3]), ([1, 2, 3], [4, 5, 6])]:
+            model = OnnxModel(create_model(then_value, else_value))
+            model.remove_duplicated_initializer()
+            if_node = model.get_nodes_by_op_type("If")[0]
+            self.assertEqual(sum(len(attr.g.initializer) for attr in if_node.attribute), 1)
+
+            session = onnxruntime.InferenceSession(model.model.SerializeToString(), providers=["CPUExecutionProvider"])
+            for cond, expected in [(True, then_value), (False, else_value)]:
+                outputs = session.run(None, {"x": x, "cond": np.array(cond)})
+                np.testing.assert_array_equal(outputs[1], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
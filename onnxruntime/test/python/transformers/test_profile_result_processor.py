@@ -0,0 +1,100 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from profile_result_processor import (
+        ProfileStatistics,
+        group_node_results,
+        iterate_profile_json,
+        load_profile_json,
+        parse_kernel_results,
+        parse_node_percentiles,
+        parse_node_results,
+    )
+else:
+    from onnxruntime.transformers.profile_result_processor import (
+        ProfileStatistics,
+        group_node_results,
+        iterate_profile_json,
+        load_profile_json,
+        parse_kernel_results,
+        parse_node_percentiles,
+        parse_node_results,
+    )
+
+
+def create_records(durations):
+    records = [
+        {"cat": "Kernel", "name": "memcpy", "dur": 1, "args": {"op_name": ""}},
+        {"cat": "Session", "name": "session_initialization", "dur": 100, "args": {}},
+    ]
+    for duration in durations:
+        for node_name, op_name in [("matmul", "MatMul"), ("relu", "Relu")]:
+            args = {"op_name": op_name}
+            records.append({"cat": "Node", "name": f"{node_name}_fence_before", "dur": 0, "args": args})
+            records.append(
+                {
+                    "cat": "Node",
+                    "name": f"{node_name}_kernel_time",
+                    "dur": duration,
+                    "args": {**args, "provider": "CUDAExecutionProvider"},
+                }
+            )
+            records.append({"cat": "Kernel", "name": f"{op_name}_kernel", "dur": duration, "args": args})
+            records.append({"cat": "Kernel", "name": "memcpy", "dur": 1, "args": {"op_name": ""}})
+    return records
+
+
+class TestProfileResultProcessor(unittest.TestCase):
+    def test_iterate_profile_json(self):
+        records = create_records([10, 20, 30])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for indent in [None, 2]:
+                profile_file = os.path.join(temp_dir, f"profile_{indent}.json")
+                with open(profile_file, "w") as f:
+                    json.dump(records, f, indent=indent)
+
+                # Records are split across chunks.
+                self.assertEqual(list(iterate_profile_json(profile_file, chunk_size=7)), records)
+                self.assertEqual(list(iterate_profile_json(profile_file)), load_profile_json(profile_file))
+
+            with open(os.path.join(temp_dir, "truncated.json"), "w") as f:
+                f.write(json.dumps(records)[:-10])
+            with self.assertRaises(json.JSONDecodeError):
+                list(iterate_profile_json(os.path.join(temp_dir, "truncated.json")))
+
+    def test_merge_profiles(self):
+        statistics = ProfileStatistics()
+        statistics.add_records(create_records([10, 20, 30]))
+        statistics.add_records(create_records([40, 50]))
+        self.assertEqual(statistics.num_profiles, 2)
+
+        # The result is the same as the one of concatenated records, except that kernels before session initialization
+        # are skipped in each profile.
+        records = create_records([10, 20, 30]) + create_records([40, 50])[1:]
+        self.assertEqual(parse_kernel_results(statistics), parse_kernel_results(records))
+        self.assertEqual(parse_node_results(statistics), parse_node_results(records))
+        self.assertEqual(group_node_results(statistics), group_node_results(records))
+
+        lines = parse_node_percentiles(statistics, percentiles=[50, 90])
+        self.assertEqual(lines[2].split("\t")[:5], ["Total(μs)", "Time%", "Calls", "P50(μs)", "P90(μs)"])
+        expected = np.percentile([10, 20, 30, 40, 50], [50, 90])
+        for line, node_name in zip(lines[3:], ["matmul", "relu"], strict=True):
+            columns = line.split("\t")
+            self.assertEqual(columns[-1], node_name)
+            self.assertEqual(int(columns[2]), 5)
+            np.testing.assert_allclose([float(value) for value in columns[3:5]], expected)
+            self.assertEqual(int(columns[5]), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ import unittest
 import onnx
 import pytest
 import torch
+from onnx import TensorProto, helper
 from parity_utilities import find_transformers_source
 
 if find_transformers_source():
@@ -73,6 +74,62 @@ class SymbolicShapeInferenceHelperTest(unittest.TestCase):
         self.assertEqual(shape_infer_helper.compare_shape("329", "817"), True)
         self.assertEqual(shape_infer_helper.compare_shape("447", "853"), False)
 
+    def _create_model(self):
+        nodes = [
+            helper.make_node("MatMul", ["input", "weight"], ["matmul"], "matmul"),
+            helper.make_node("Shape", ["input"], ["shape"], "shape"),
+            helper.make_node("Gather", ["shape", "zero"], ["batch"], "gather"),
+            helper.make_node("Unsqueeze", ["batch", "axes"], ["batch_1d"], "unsqueeze"),
+            helper.make_node("Concat", ["batch_1d", "new_shape"], ["reshape_shape"], "concat", axis=0),
+            helper.make_node("Reshape", ["matmul", "reshape_shape"], ["reshape"], "reshape"),
+            helper.make_node("Softmax", ["reshape"], ["output"], "softmax", axis=-1),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "test",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch_size", "seq_len", 8])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, None)],
+            [
+                helper.make_tensor("weight", TensorProto.FLOAT, [8, 8], [0.1] * 64),
+                helper.make_tensor("zero", TensorProto.INT64, [], [0]),
+                helper.make_tensor("axes", TensorProto.INT64, [1], [0]),
+                helper.make_tensor("new_shape", TensorProto.INT64, [3], [-1, 2, 4]),
+            ],
+        )
+        return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+    def _get_shapes(self, shape_infer_helper):
+        return {name: shape_infer_helper.get_edge_shape(name) for name in shape_infer_helper.known_vi_}
+
+    def test_shape_infer_helper_with_node_cache(self):
+        model = self._create_model()
+        node_cache = {}
+        shape_infer_helper = SymbolicShapeInferenceHelper(model, node_cache=node_cache)
+        self.assertTrue(shape_infer_helper.infer({"batch_size": 2}))
+        self.assertEqual(shape_infer_helper.get_edge_shape("output"), [2, "seq_len", 2, 4])
+        num_cached = len(node_cache)
+        self.assertGreater(num_cached, 0)
+
+        # Nodes are not inferred again when the model is not changed.
+        shape_infer_helper = SymbolicShapeInferenceHelper(model, node_cache=node_cache)
+        self.assertTrue(shape_infer_helper.infer({"batch_size": 2}))
+        self.assertEqual(len(node_cache), num_cached)
+
+        # After an edit, only the downstream nodes with changed inputs are inferred again.
+        # Results of the edited nodes are replaced, so the cache does not grow.
+        stale_keys = set(node_cache)
+        model.graph.node[5].input[0] = "input"
+        model.graph.node[6].op_type = "Relu"
+        model.graph.node[6].ClearField("attribute")
+        shape_infer_helper = SymbolicShapeInferenceHelper(model, node_cache=node_cache)
+        self.assertTrue(shape_infer_helper.infer({"batch_size": 2}))
+        self.assertEqual(len(node_cache), num_cached)
+        self.assertEqual(len(set(node_cache) - stale_keys), 2)
+
+        expected = SymbolicShapeInferenceHelper(model)
+        self.assertTrue(expected.infer({"batch_size": 2}))
+        self.assertEqual(self._get_shapes(shape_infer_helper), self._get_shapes(expected))
+
 
 if __name__ == "__main__":
     unittest.main()